@@ -13,4 +13,7 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'CareTrack.settings')
 
+# Use the async versions of the read-heavy views (see app/async_views.py)
+os.environ.setdefault('CARETRACK_ASYNC_VIEWS', '1')
+
 application = get_asgi_application()
@@ -0,0 +1,20 @@
+"""
+SQLite backend that starts transactions with BEGIN IMMEDIATE
+
+Django's SQLite backend opens atomic() blocks with a plain (deferred)
+BEGIN, so a transaction that reads before it writes - like
+SugarReading.save, which reads the patient's baseline and summary
+first - only asks for the write lock at its first UPDATE/INSERT. In WAL
+mode, if another process committed in between, SQLite fails that
+request straight away with "database is locked" instead of waiting
+for the busy timeout. BEGIN IMMEDIATE takes the write lock up front,
+so concurrent writers queue on busy_timeout; readers are not affected.
+
+(Django 5.1+ offers the same through OPTIONS['transaction_mode'].)
+"""
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE')
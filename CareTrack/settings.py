@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -45,6 +46,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so request times include all the other middleware (see app/metrics.py)
+    'app.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -58,9 +61,14 @@ ROOT_URLCONF = 'CareTrack.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Django templates, with render times recorded for /metrics
+        'BACKEND': 'app.metrics.InstrumentedTemplates',
+        'NAME': 'django',  # keep the usual engine alias (it would be 'metrics')
         'DIRS': [],
         'APP_DIRS': True,
+        # No 'loaders' option on purpose: Django then wraps the loaders in the cached
+        # loader, so each template is compiled once per process (runserver still
+        # reloads changed templates). Listing loaders here would turn that off.
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
@@ -81,10 +89,72 @@ WSGI_APPLICATION = 'CareTrack.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        # CARETRACK_DB_PATH points the app at another database file (used by the benchmarks)
+        'NAME': os.environ.get('CARETRACK_DB_PATH', BASE_DIR / 'db.sqlite3'),
     }
 }
 
+# Database profile: CARETRACK_DB_PROFILE=production tunes SQLite for many
+# processes reading and writing at once (gunicorn/uvicorn workers)
+DB_PROFILE = os.environ.get('CARETRACK_DB_PROFILE', 'development')
+
+# PRAGMAs run on every new SQLite connection (see app/signals.py)
+SQLITE_PRAGMAS = {}
+
+if DB_PROFILE == 'production':
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',         # readers never wait for the writer (and vice versa)
+        'synchronous': 'NORMAL',       # safe with WAL; fsync at checkpoints, not every commit
+        'busy_timeout': 5000,          # wait up to 5 s for the write lock instead of failing
+        'cache_size': -64000,          # 64 MB page cache per connection (negative = KiB)
+        'mmap_size': 268435456,        # read the first 256 MB of the file through mmap
+        'temp_store': 'MEMORY',        # sorts and temp indexes in memory
+    }
+    # Transactions take the write lock up front so writers wait instead of failing
+    DATABASES['default']['ENGINE'] = 'CareTrack.db_backend'
+    DATABASES['default']['OPTIONS'] = {
+        # Same wait in Python's sqlite3 driver (seconds)
+        'timeout': 5,
+    }
+    # Keep connections for a minute so the PRAGMAs are not re-run on every request
+    DATABASES['default']['CONN_MAX_AGE'] = 60
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'caretrack-default',
+    },
+    # {% cache %} template fragments (used automatically by the cache tag). Kept per
+    # process, so a deploy with changed templates or diet plans starts empty
+    'template_fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'caretrack-fragments',
+        'OPTIONS': {
+            'MAX_ENTRIES': 200,
+        },
+    },
+    # Rendered chart fragments (bounded - oldest entries are culled past MAX_ENTRIES)
+    'charts': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'caretrack-charts',
+        'TIMEOUT': 60 * 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': 500,
+        },
+    },
+}
+
+# Which cache alias stores chart fragments (see app/chart_cache.py)
+CHART_CACHE_ALIAS = 'charts'
+
+# Serve the read-heavy pages with the async views in app/async_views.py.
+# CareTrack/asgi.py switches this on; under WSGI the sync views are used.
+ASYNC_VIEWS = os.environ.get('CARETRACK_ASYNC_VIEWS', '0') == '1'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
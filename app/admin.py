@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import Patient, SugarReading, HealthData
+from .anomalies import BASELINE_FIELDS
+from .models import Patient, SugarReading, HealthData, PatientSummary
+from .pagination import EstimatedCountPaginator
+from .search import patients_matching, readings_matching
 
 # Customize how Patient appears in admin
 @admin.register(Patient)
@@ -7,7 +10,10 @@ class PatientAdmin(admin.ModelAdmin):
     """Admin interface for Patient model"""
     
     # What columns to show in the list
-    list_display = ['name', 'age', 'weight', 'height', 'bmi', 'created_at']
+    list_display = ['name', 'age', 'weight', 'height', 'bmi', 'reading_count', 'last_reading', 'estimated_hba1c', 'created_at']
+    
+    # Summary columns come from PatientSummary in the same query
+    list_select_related = ['summary']
     
     # Add search box
     search_fields = ['name']
@@ -16,7 +22,7 @@ class PatientAdmin(admin.ModelAdmin):
     list_filter = ['age', 'created_at']
     
     # Make BMI read-only (it's auto-calculated)
-    readonly_fields = ['bmi', 'created_at', 'updated_at']
+    readonly_fields = ['bmi', 'created_at', 'updated_at'] + BASELINE_FIELDS
     
     # Organize fields in sections
     fieldsets = (
@@ -30,7 +36,66 @@ class PatientAdmin(admin.ModelAdmin):
             'fields': ('created_at', 'updated_at'),
             'classes': ('collapse',)  # This section starts collapsed
         }),
+        ('Anomaly Baseline', {
+            'fields': tuple(BASELINE_FIELDS),
+            'classes': ('collapse',)
+        }),
     )
+    
+    def get_search_results(self, request, queryset, search_term):
+        """Search names with the full-text index instead of LIKE '%...%'"""
+        if not search_term.strip():
+            return queryset, False
+        return queryset.filter(patients_matching(search_term, include_notes=False)), False
+    
+    def _summary_value(self, obj, field):
+        summary = getattr(obj, 'summary', None)
+        return getattr(summary, field, None)
+    
+    def reading_count(self, obj):
+        return self._summary_value(obj, 'reading_count') or 0
+    reading_count.short_description = 'Readings'
+    reading_count.admin_order_field = 'summary__reading_count'
+    
+    def last_reading(self, obj):
+        return self._summary_value(obj, 'last_reading_date')
+    last_reading.short_description = 'Last Reading'
+    last_reading.admin_order_field = 'summary__last_reading_date'
+    
+    def estimated_hba1c(self, obj):
+        return self._summary_value(obj, 'estimated_hba1c')
+    estimated_hba1c.short_description = 'eHbA1c (%)'
+    estimated_hba1c.admin_order_field = 'summary__estimated_hba1c'
+
+
+class FastingStatusFilter(admin.SimpleListFilter):
+    """Filter readings by fasting status (worked out in SQL)"""
+    
+    title = 'fasting status'
+    parameter_name = 'fasting_status'
+    
+    def lookups(self, request, model_admin):
+        return [('Low', 'Low'), ('Normal', 'Normal'), ('High', 'High')]
+    
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(fasting_status=self.value())
+        return queryset
+
+
+class PostMealStatusFilter(admin.SimpleListFilter):
+    """Filter readings by post-meal status (worked out in SQL)"""
+    
+    title = 'post-meal status'
+    parameter_name = 'postmeal_status'
+    
+    def lookups(self, request, model_admin):
+        return [('Normal', 'Normal'), ('High', 'High')]
+    
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(postmeal_status=self.value())
+        return queryset
 
 
 @admin.register(SugarReading)
@@ -42,24 +107,57 @@ class SugarReadingAdmin(admin.ModelAdmin):
         'reading_date',
         'sugar_before_breakfast',
         'sugar_after_breakfast',
-        'display_status',
+        'fasting_status_display',
+        'postmeal_status_display',
+        'is_anomaly',
+        'anomaly_score',
         'created_at'
     ]
     
-    search_fields = ['patient__name']  # Search by patient name
+    # Fetch each row's patient in the same query (one query per page, not per row)
+    list_select_related = ['patient']
     
-    list_filter = ['reading_date', 'created_at']
+    search_fields = ['patient__name', 'notes']  # Search by patient name or notes (full-text, see get_search_results)
+    
+    list_filter = ['is_anomaly', FastingStatusFilter, PostMealStatusFilter, 'reading_date']
+    
+    # Drill down by year/month/day (reading_date leads the sugar_date_values_idx index)
+    date_hierarchy = 'reading_date'
+    
+    # No exact COUNT(*) over millions of rows on every page view
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    
+    # Anomaly flags are set automatically when the reading is added
+    readonly_fields = ['is_anomaly', 'anomaly_score']
     
     # Order by date (newest first)
     ordering = ['-reading_date']
     
-    # Custom method to show status with colors
-    def display_status(self, obj):
-        """Display status in admin panel"""
-        status = obj.get_status()
-        return f"Fasting: {status['fasting']}, Post-meal: {status['postmeal']}"
+    def get_queryset(self, request):
+        """Let the database work out the status so we can sort and filter on it"""
+        return super().get_queryset(request).with_status()
+    
+    def get_search_results(self, request, queryset, search_term):
+        """Search patient names and notes with the full-text index"""
+        if not search_term.strip():
+            return queryset, False
+        return queryset.filter(readings_matching(search_term)), False
+    
+    # Status columns read the values with_status() worked out in SQL, so they can be sorted
+    def fasting_status_display(self, obj):
+        """Fasting status in admin panel"""
+        return obj.fasting_status
+    
+    fasting_status_display.short_description = 'Fasting Status'
+    fasting_status_display.admin_order_field = 'fasting_status'
+    
+    def postmeal_status_display(self, obj):
+        """Post-meal status in admin panel"""
+        return obj.postmeal_status
     
-    display_status.short_description = 'Status'
+    postmeal_status_display.short_description = 'Post-meal Status'
+    postmeal_status_display.admin_order_field = 'postmeal_status'
 
 
 @admin.register(HealthData)
@@ -79,6 +177,19 @@ class HealthDataAdmin(admin.ModelAdmin):
     
     list_filter = ['test_date']
     
+    # Same scaling settings as the sugar reading list
+    list_select_related = ['patient']
+    date_hierarchy = 'test_date'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    
+    def get_search_results(self, request, queryset, search_term):
+        """Search patient names with the full-text index"""
+        if not search_term.strip():
+            return queryset, False
+        patients = Patient.objects.filter(patients_matching(search_term, include_notes=False))
+        return queryset.filter(patient__in=patients), False
+    
     fieldsets = (
         ('Patient Info', {
             'fields': ('patient', 'test_date')
@@ -93,3 +204,21 @@ class HealthDataAdmin(admin.ModelAdmin):
         }),
     )
 # Register your models here.
+
+
+# Precomputed summaries are maintained automatically, so they are read-only here
+@admin.register(PatientSummary)
+class PatientSummaryAdmin(admin.ModelAdmin):
+    """Admin interface for PatientSummary model"""
+    
+    list_display = ['patient', 'reading_count', 'last_reading_date', 'last_fasting_status',
+                    'avg_fasting_30d', 'avg_postmeal_30d', 'estimated_hba1c', 'windows_as_of']
+    list_select_related = ['patient']
+    search_fields = ['patient__name']
+    list_filter = ['last_fasting_status', 'last_postmeal_status']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,143 @@
+"""
+Trend analytics for sugar readings with NumPy
+
+Readings are pulled with a single values_list query straight into NumPy
+arrays, and every metric is computed with array operations:
+
+    estimated_a1c   estimated HbA1c (%) from the mean sugar level
+    sd, cv          standard deviation (mg/dL) and coefficient of variation (%)
+    in/below/above  % of values in, below and above the normal range
+                    (same thresholds as SugarReading.get_status)
+    slope           least-squares trend of the daily average (mg/dL per day)
+
+batch_metrics() does the same for many patients in one pass (one query,
+grouped sums with np.add.reduceat), for reports over the whole clinic.
+
+numpy is imported here at module level, so views should import this
+module inside the function that needs it (see views.dashboard).
+"""
+from datetime import timedelta
+
+import numpy as np
+from django.utils import timezone
+
+from .models import FASTING_HIGH, FASTING_LOW, POSTMEAL_HIGH, SugarReading
+from .summaries import estimate_hba1c
+
+# Rows fetched from the database at a time
+ANALYTICS_CHUNK_SIZE = 5000
+
+READING_DTYPE = np.dtype([
+    ('patient_id', np.int64),
+    ('day', np.int64),
+    ('fasting', np.float64),
+    ('postmeal', np.float64),
+])
+
+
+def load_readings(patient_ids=None, days=None, between=None):
+    """
+    Readings as a NumPy structured array sorted by patient and date
+
+    One query for all requested patients (or everyone if patient_ids is
+    None), optionally limited to the last `days` days or to the
+    (first, last) dates in `between`. Dates become day numbers
+    (date.toordinal()) so they can be used in the trend fit.
+    """
+    readings = SugarReading.objects.all()
+    if patient_ids is not None:
+        readings = readings.filter(patient_id__in=list(patient_ids))
+    if days is not None:
+        readings = readings.filter(reading_date__gte=timezone.localdate() - timedelta(days=days - 1))
+    if between is not None:
+        readings = readings.filter(reading_date__range=between)
+
+    rows = (
+        readings.order_by('patient_id', 'reading_date')
+        .values_list('patient_id', 'reading_date', 'sugar_before_breakfast', 'sugar_after_breakfast')
+        .iterator(chunk_size=ANALYTICS_CHUNK_SIZE)
+    )
+    return np.fromiter(
+        ((patient_id, day.toordinal(), fasting, postmeal) for patient_id, day, fasting, postmeal in rows),
+        dtype=READING_DTYPE,
+    )
+
+
+def _percent(part, whole):
+    return np.round(100.0 * part / whole, 1)
+
+
+def _group_metrics(data):
+    """Metrics for every patient in `data` (sorted by patient_id), keyed by patient id"""
+    if data.size == 0:
+        return {}
+
+    patient_ids, starts = np.unique(data['patient_id'], return_index=True)
+    fasting = data['fasting']
+    postmeal = data['postmeal']
+
+    def group_sum(values):
+        return np.add.reduceat(values, starts)
+
+    readings = group_sum(np.ones(data.size))
+
+    # Every reading holds two values (fasting and post-meal); variability uses both
+    values = 2 * readings
+    total = group_sum(fasting + postmeal)
+    mean = total / values
+    squares = group_sum(fasting ** 2 + postmeal ** 2)
+    variance = np.where(values > 1, (squares - total * mean) / np.maximum(values - 1, 1), 0.0)
+    sd = np.sqrt(np.maximum(variance, 0.0))
+
+    # Range checks, matching SugarReading.get_status
+    fasting_below = group_sum(fasting < FASTING_LOW)
+    fasting_above = group_sum(fasting > FASTING_HIGH)
+    postmeal_above = group_sum(postmeal >= POSTMEAL_HIGH)
+    below = fasting_below
+    above = fasting_above + postmeal_above
+
+    # Least-squares slope of the daily average against the day number.
+    # Days are shifted to each patient's first day to keep the sums small.
+    first_day = data['day'][starts]
+    x = (data['day'] - np.repeat(first_day, np.diff(np.append(starts, data.size)))).astype(np.float64)
+    y = (fasting + postmeal) / 2
+    sum_x, sum_y = group_sum(x), group_sum(y)
+    sum_xy, sum_xx = group_sum(x * y), group_sum(x * x)
+    denominator = readings * sum_xx - sum_x ** 2
+    slope = np.divide(
+        readings * sum_xy - sum_x * sum_y, denominator,
+        out=np.full(denominator.shape, np.nan), where=denominator > 0,
+    )
+
+    metrics = {}
+    for i, patient_id in enumerate(patient_ids.tolist()):
+        metrics[patient_id] = {
+            'readings': int(readings[i]),
+            'mean': round(float(mean[i]), 1),
+            'estimated_a1c': estimate_hba1c(float(mean[i])),
+            'sd': round(float(sd[i]), 1),
+            'cv': round(float(100 * sd[i] / mean[i]), 1) if mean[i] else None,
+            'in_range': float(_percent(values[i] - below[i] - above[i], values[i])),
+            'below_range': float(_percent(below[i], values[i])),
+            'above_range': float(_percent(above[i], values[i])),
+            'fasting_in_range': float(_percent(readings[i] - fasting_below[i] - fasting_above[i], readings[i])),
+            'postmeal_in_range': float(_percent(readings[i] - postmeal_above[i], readings[i])),
+            'slope': None if np.isnan(slope[i]) else round(float(slope[i]), 2),
+        }
+    return metrics
+
+
+def patient_metrics(patient_id, days=None, between=None):
+    """Trend metrics for one patient (None if there are no readings in the window)"""
+    return _group_metrics(load_readings([patient_id], days, between)).get(patient_id)
+
+
+def batch_metrics(patient_ids=None, days=None, between=None):
+    """
+    Trend metrics for many patients at once
+
+    Returns {patient_id: metrics} for every patient with readings in the
+    window (last `days` days, or the (first, last) dates in `between`);
+    patients without readings are left out.
+    """
+    return _group_metrics(load_readings(patient_ids, days, between))
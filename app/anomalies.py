@@ -0,0 +1,246 @@
+"""
+Streaming anomaly detection for new sugar readings
+
+Each patient keeps an exponentially weighted moving average (EWMA) and
+variance of their fasting and post-meal levels on the Patient row. When a
+reading is added it is compared with that baseline *before* the baseline
+is updated:
+
+    score = |value - mean| / max(sd, ANOMALY_MIN_SD)
+
+and flagged if the larger of the two scores reaches ANOMALY_THRESHOLD
+(once the patient has ANOMALY_MIN_READINGS readings). Scoring and updating
+take a fixed amount of work per reading - no earlier readings are read.
+
+The live baseline follows the order readings are entered. Edits and
+deletes do not rewind it; backfill_anomalies() (and the backfill_anomalies
+management command) replays a patient's readings in date order to
+reseed the baseline and the flags. Bulk writes (app/ingest.py) are scored
+by score_bulk_readings(), which replays only the patients it has to.
+"""
+import math
+from operator import attrgetter
+
+from django.db import connection, transaction
+from django.db.models import Max
+
+from .models import Patient, SugarReading
+
+# Weight of the newest reading in the running mean/variance (~ last 20 readings)
+EWMA_ALPHA = 0.1
+
+# Flag readings this many standard deviations away from the baseline
+ANOMALY_THRESHOLD = 3.0
+
+# Readings needed before the baseline is trusted
+ANOMALY_MIN_READINGS = 7
+
+# Smallest standard deviation used (mg/dL), so very steady patients are not
+# flagged for ordinary day-to-day changes
+ANOMALY_MIN_SD = 10.0
+
+# Readings updated per query by backfill_anomalies()
+BACKFILL_BATCH_SIZE = 1000
+
+BASELINE_FIELDS = [
+    'baseline_readings',
+    'baseline_fasting_mean', 'baseline_fasting_var',
+    'baseline_postmeal_mean', 'baseline_postmeal_var',
+]
+
+
+def ewma_step(mean, var, value):
+    """
+    Score `value` against (mean, var), then fold it in
+
+    Returns (score, new_mean, new_var). The first value seeds the mean.
+    """
+    if mean is None:
+        return 0.0, float(value), 0.0
+
+    diff = value - mean
+    score = abs(diff) / max(math.sqrt(var), ANOMALY_MIN_SD)
+    increment = EWMA_ALPHA * diff
+    return score, mean + increment, (1 - EWMA_ALPHA) * (var + diff * increment)
+
+
+def _score(state, fasting, postmeal):
+    """Update a baseline dict in place and return (is_anomaly, score)"""
+    fasting_score, state['baseline_fasting_mean'], state['baseline_fasting_var'] = ewma_step(
+        state['baseline_fasting_mean'], state['baseline_fasting_var'], fasting
+    )
+    postmeal_score, state['baseline_postmeal_mean'], state['baseline_postmeal_var'] = ewma_step(
+        state['baseline_postmeal_mean'], state['baseline_postmeal_var'], postmeal
+    )
+    trusted = state['baseline_readings'] >= ANOMALY_MIN_READINGS
+    state['baseline_readings'] += 1
+
+    if state['baseline_readings'] == 1:
+        return False, None
+    score = round(max(fasting_score, postmeal_score), 2)
+    return trusted and score >= ANOMALY_THRESHOLD, score
+
+
+def _empty_baseline():
+    return {
+        'baseline_readings': 0,
+        'baseline_fasting_mean': None, 'baseline_fasting_var': 0.0,
+        'baseline_postmeal_mean': None, 'baseline_postmeal_var': 0.0,
+    }
+
+
+def score_readings(readings, state=None):
+    """
+    Set is_anomaly/anomaly_score on one patient's unsaved readings, in date order
+
+    Scoring starts from `state` (the patient's baseline fields) or an empty
+    baseline. Returns the baseline fields after the last reading, for
+    code that builds readings in memory and bulk inserts them.
+    """
+    state = dict(state) if state else _empty_baseline()
+    for reading in readings:
+        reading.is_anomaly, reading.anomaly_score = _score(
+            state, reading.sugar_before_breakfast, reading.sugar_after_breakfast
+        )
+    return state
+
+
+def score_new_reading(reading):
+    """
+    Set reading.is_anomaly/anomaly_score and update the patient's baseline
+
+    Called just before a new reading is inserted (inside SugarReading.save's
+    transaction, so a failed insert also undoes the baseline update). The
+    patient row is locked so concurrent readings update it one at a time.
+    """
+    with transaction.atomic():
+        state = (
+            Patient.objects.select_for_update()
+            .filter(pk=reading.patient_id).values(*BASELINE_FIELDS).first()
+        )
+        if state is None:
+            return
+        reading.is_anomaly, reading.anomaly_score = _score(
+            state, reading.sugar_before_breakfast, reading.sugar_after_breakfast
+        )
+        # update() leaves Patient.updated_at alone - the patient's own details did not change
+        Patient.objects.filter(pk=reading.patient_id).update(**state)
+
+
+def score_bulk_readings(readings, rescore=(), states=None):
+    """
+    Score unsaved readings that are about to be bulk inserted
+
+    bulk_create skips the pre_save scoring. A patient whose new readings all
+    come after their latest stored reading is scored here from their stored
+    baseline - the same result as adding the readings one by one - and the
+    baseline is saved. Backdated readings change the order of the history,
+    so those patients (and the ones in `rescore`, whose stored readings are
+    being overwritten) are returned instead: run backfill_anomalies() for
+    them after the write. Call inside the write's transaction.
+
+    Callers writing many batches (import_readings) pass a `states` dict that
+    lives across batches: patient id -> (latest reading date, baseline). A
+    patient's baseline is then read once, kept there between batches and
+    only saved by save_baselines(states) after the last one.
+    """
+    by_patient = {}
+    for reading in readings:
+        by_patient.setdefault(reading.patient_id, []).append(reading)
+    replay = set(rescore)
+    candidates = [patient_id for patient_id in by_patient if patient_id not in replay]
+    known = {} if states is None else states
+    unknown = [patient_id for patient_id in candidates if patient_id not in known]
+    if unknown:
+        latest = dict(
+            SugarReading.objects.filter(patient_id__in=unknown).order_by()
+            .values('patient_id').annotate(latest=Max('reading_date'))
+            .values_list('patient_id', 'latest')
+        )
+        for row in Patient.objects.select_for_update().filter(pk__in=unknown).values('pk', *BASELINE_FIELDS):
+            patient_id = row.pop('pk')
+            known[patient_id] = (latest.get(patient_id), row)
+
+    for patient_id in candidates:
+        patient_readings = sorted(by_patient[patient_id], key=attrgetter('reading_date'))
+        latest_date, state = known[patient_id]
+        if latest_date is not None and patient_readings[0].reading_date <= latest_date:
+            # The replay writes this patient's baseline
+            del known[patient_id]
+            replay.add(patient_id)
+            continue
+        known[patient_id] = (patient_readings[-1].reading_date, score_readings(patient_readings, state))
+    if states is None:
+        save_baselines(known)
+    return replay
+
+
+def save_baselines(states):
+    """Write baselines kept by score_bulk_readings(): patient id -> (latest reading date, baseline)"""
+    Patient.objects.bulk_update(
+        [Patient(pk=patient_id, **state) for patient_id, (_, state) in states.items()],
+        BASELINE_FIELDS,
+        batch_size=BACKFILL_BATCH_SIZE,
+    )
+
+
+def _save_flags(rows):
+    """
+    Write (is_anomaly, anomaly_score, pk) rows
+
+    One prepared UPDATE run per row: bulk_update() builds a CASE branch per
+    row, which is slow for the thousands of rows a replay can change.
+    """
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"UPDATE {quote(SugarReading._meta.db_table)} "
+            f"SET {quote('is_anomaly')} = %s, {quote('anomaly_score')} = %s WHERE {quote('id')} = %s",
+            rows,
+        )
+
+
+def backfill_anomalies(patient_ids=None):
+    """
+    Rebuild baselines and flags from existing readings, in date order
+
+    Streams all readings once (ordered by patient and date) and only writes
+    readings whose flag or score changed. Returns (patients, flagged).
+    """
+    patients = Patient.objects.all()
+    readings = SugarReading.objects.all()
+    if patient_ids is not None:
+        patients = patients.filter(pk__in=list(patient_ids))
+        readings = readings.filter(patient_id__in=list(patient_ids))
+
+    rows = (
+        readings.order_by('patient_id', 'reading_date', 'pk')
+        .values_list('patient_id', 'pk', 'sugar_before_breakfast', 'sugar_after_breakfast',
+                     'is_anomaly', 'anomaly_score')
+        .iterator(chunk_size=BACKFILL_BATCH_SIZE)
+    )
+
+    baselines = {}
+    changed = []
+    flagged = 0
+    with transaction.atomic():
+        for patient_id, pk, fasting, postmeal, was_anomaly, old_score in rows:
+            state = baselines.setdefault(patient_id, _empty_baseline())
+            is_anomaly, score = _score(state, fasting, postmeal)
+            flagged += is_anomaly
+            if (is_anomaly, score) != (was_anomaly, old_score):
+                changed.append((is_anomaly, score, pk))
+            if len(changed) >= BACKFILL_BATCH_SIZE:
+                _save_flags(changed)
+                changed = []
+        if changed:
+            _save_flags(changed)
+
+        # Clear every baseline, then write the replayed ones (patients without readings stay empty)
+        patients.exclude(baseline_readings=0).update(**_empty_baseline())
+        Patient.objects.bulk_update(
+            [Patient(pk=patient_id, **state) for patient_id, state in baselines.items()],
+            BASELINE_FIELDS,
+            batch_size=BACKFILL_BATCH_SIZE,
+        )
+    return len(baselines), flagged
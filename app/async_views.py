@@ -0,0 +1,170 @@
+"""
+Async versions of the read-heavy views
+
+Same pages, context and templates as app/views.py, but written with
+Django's async ORM (aget, afirst, aaggregate, async for) so a worker
+served through CareTrack.asgi is not blocked while it waits on the
+database. app/urls.py routes to these when settings.ASYNC_VIEWS is on,
+which CareTrack/asgi.py turns on.
+
+All data is fetched before rendering - templates must not trigger
+queries in an async view (Django raises SynchronousOnlyOperation).
+"""
+from asgiref.sync import sync_to_async
+from django.db.models import Count
+from django.http import Http404, HttpResponseNotAllowed
+from django.shortcuts import render
+
+from .conditional import by_patient_id, by_pk, by_reading, conditional_page
+from .diet_plans import diet_plan_context
+from .exports import ASTREAMERS
+from .models import Patient, SugarReading
+from .pagination import apaginate_readings
+from .summaries import refresh_windows
+from .views import DASHBOARD_WINDOWS, SERIES_DEFAULT_LIMIT, _dashboard_window, _export_response
+
+
+async def _aget_or_404(queryset, **lookup):
+    """Async get_object_or_404"""
+    try:
+        return await queryset.aget(**lookup)
+    except queryset.model.DoesNotExist:
+        raise Http404(f"No {queryset.model._meta.object_name} matches the given query.")
+
+
+# View 3: Patient Detail (async)
+@conditional_page('patient_detail', by_pk)
+async def patient_detail(request, pk):
+    """Display detailed information about a patient"""
+    patient = await _aget_or_404(Patient.objects.all(), pk=pk)
+    
+    recent_readings = [reading async for reading in patient.sugar_readings.with_status()[:7]]
+    latest_reading = recent_readings[0] if recent_readings else None
+    unusual_readings = [reading async for reading in patient.sugar_readings.filter(is_anomaly=True)[:5]]
+    health_data = await patient.health_data.afirst()
+    
+    context = {
+        'patient': patient,
+        'latest_reading': latest_reading,
+        'recent_readings': recent_readings,
+        'unusual_readings': unusual_readings,
+        'health_data': health_data,
+    }
+    
+    return render(request, 'app/patient_detail.html', context)
+
+
+# View 6: Reading Detail (async)
+@conditional_page('reading_detail', by_reading)
+async def reading_detail(request, pk):
+    """Display detailed information about a specific reading"""
+    reading = await _aget_or_404(SugarReading.objects.with_status().select_related('patient'), pk=pk)
+    status = reading.get_status()
+    patient = reading.patient
+    
+    context = {
+        'reading': reading,
+        'status': status,
+        'patient': patient,
+        **diet_plan_context(status, patient),
+    }
+    
+    return render(request, 'app/reading_detail.html', context)
+
+
+# View 7: Dashboard (async)
+@conditional_page('dashboard', by_patient_id, daily=True)
+async def dashboard(request, patient_id):
+    """Display patient dashboard with graphs"""
+    patient = await _aget_or_404(Patient.objects.select_related('summary'), pk=patient_id)
+    window_key, window_days, window_label = _dashboard_window(request)
+    
+    stats = await patient.sugar_readings.in_window(window_days).asummary()
+    readings_count = stats['readings_count']
+    
+    # No readings in the window: fall back to the most recent readings, as the sync view does
+    between = None
+    empty_window_label = None
+    if not readings_count and window_days is not None:
+        recent = patient.sugar_readings.values_list('reading_date', flat=True)[:SERIES_DEFAULT_LIMIT]
+        dates = [day async for day in recent]
+        if dates:
+            between = (dates[-1], dates[0])
+            stats = await patient.sugar_readings.filter(reading_date__range=between).asummary()
+            readings_count = stats['readings_count']
+            empty_window_label, window_label = window_label, f'Last {readings_count} readings'
+    if not readings_count:
+        stats = None
+    
+    # The NumPy analytics are synchronous (ORM iterator + array maths), so run them in a thread
+    trend = None
+    if stats:
+        from .analytics import patient_metrics
+        trend = await sync_to_async(patient_metrics)(patient.pk, None if between else window_days, between)
+    
+    # Rolling averages are recalculated if they are from an earlier day
+    summary = await sync_to_async(refresh_windows)(getattr(patient, 'summary', None))
+    
+    context = {
+        'patient': patient,
+        'summary': summary,
+        'series_limit': SERIES_DEFAULT_LIMIT,
+        'stats': stats,
+        'trend': trend,
+        'readings_count': readings_count,
+        'windows': DASHBOARD_WINDOWS,
+        'window_key': window_key,
+        'window_label': window_label,
+        'empty_window_label': empty_window_label,
+        'last_reading_date': between[1] if between else None,
+    }
+    
+    return render(request, 'app/dashboard.html', context)
+
+
+# View 8: History (async)
+@conditional_page('history', by_patient_id)
+async def history(request, patient_id):
+    """Display complete history of readings"""
+    patient = await _aget_or_404(Patient.objects.all(), pk=patient_id)
+    
+    try:
+        start = int(request.GET.get('start', 1))
+    except ValueError:
+        start = 1
+    page = await apaginate_readings(
+        patient.sugar_readings.with_status(),
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        start=start,
+    )
+    
+    totals = await patient.sugar_readings.aaggregate(total_readings=Count('id'))
+    
+    context = {
+        'patient': patient,
+        'readings': page.object_list,
+        'page': page,
+        'totals': totals,
+    }
+    
+    return render(request, 'app/history.html', context)
+
+
+# View 8b: Export readings (async)
+# Streams from async generators: under ASGI, Django 4.2 reads a sync
+# iterator to the end before sending, which would hold the whole export.
+# require_GET is not async-aware in Django 4.2, so the method is checked here.
+async def export_patient(request, patient_id):
+    """Download one patient's complete history"""
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    patient = await _aget_or_404(Patient.objects.all(), pk=patient_id)
+    return _export_response(request, patient.pk, f'caretrack-patient-{patient.pk}', ASTREAMERS)
+
+
+async def export_all(request):
+    """Download the complete history of every patient"""
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    return _export_response(request, None, 'caretrack-all-patients', ASTREAMERS)
@@ -0,0 +1,92 @@
+"""
+Cache for chart data built from a patient's readings
+
+A patient's chart only changes when their readings change. Fragments are
+stored per patient together with a "data version": the patient's
+PatientSummary.updated_at. Every write path (save, delete, admin, bulk
+import and the batch API) updates the summary when readings change, so an
+edit anywhere changes the version that every worker process reads from
+the database, and a stale fragment is never served even though each
+process has its own cache. Signals also drop the cached
+fragments in the writing process as soon as a reading is saved or deleted
+(see app/signals.py).
+
+The cache backend is chosen with settings.CHART_CACHE_ALIAS and should be
+a bounded cache (e.g. LocMemCache with MAX_ENTRIES).
+"""
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import PatientSummary
+
+# Names of every fragment we cache, so invalidation can remove them all
+CHART_NAMES = {'reading_series'}
+
+# Hit/miss counters for this process
+_counters = {'hits': 0, 'misses': 0, 'invalidations': 0}
+_counters_lock = threading.Lock()
+
+
+def _cache():
+    return caches[getattr(settings, 'CHART_CACHE_ALIAS', 'default')]
+
+
+def _count(counter):
+    with _counters_lock:
+        _counters[counter] += 1
+
+
+def _key(name, patient_id):
+    return f"chart:{name}:{patient_id}"
+
+
+def data_version(patient_id):
+    """Version string for a patient's readings: when their summary was last updated (one indexed lookup)"""
+    updated_at = (
+        PatientSummary.objects.filter(patient_id=patient_id)
+        .values_list('updated_at', flat=True).first()
+    )
+    return updated_at.isoformat() if updated_at else 'none'
+
+
+def get_or_build(name, patient_id, builder, version=None):
+    """
+    Return the cached fragment for a patient, calling builder() on a miss
+
+    Args:
+        name: fragment name (must be listed in CHART_NAMES)
+        patient_id: patient the fragment belongs to
+        builder: function with no arguments that returns the fragment
+        version: data version if the caller already has it
+    """
+    if version is None:
+        version = data_version(patient_id)
+
+    cache = _cache()
+    key = _key(name, patient_id)
+    cached = cache.get(key)
+    if cached is not None and cached[0] == version:
+        _count('hits')
+        return cached[1]
+
+    _count('misses')
+    fragment = builder()
+    cache.set(key, (version, fragment))
+    return fragment
+
+
+def invalidate(patient_id):
+    """Forget every cached fragment for a patient"""
+    _cache().delete_many([_key(name, patient_id) for name in CHART_NAMES])
+    _count('invalidations')
+
+
+def cache_stats():
+    """Hit/miss counters for this process"""
+    with _counters_lock:
+        stats = dict(_counters)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+    return stats
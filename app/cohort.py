@@ -0,0 +1,134 @@
+"""
+Clinic-wide (cohort) glycemic analytics
+
+Every number here comes from grouped SQL aggregation - no model instances
+are loaded - so the page stays fast with tens of thousands of patients
+and millions of readings. Results are cached briefly because they
+describe the whole clinic, not one patient.
+"""
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import models
+from django.db.models import Avg, Case, Count, Value, When
+from django.utils import timezone
+
+from .diet_plans import AGE_BANDS, BMI_BANDS
+from .models import FASTING_HIGH, Patient, SugarReading
+
+# Windows (days) offered on the analytics page
+COHORT_WINDOWS = (7, 30, 90, 365)
+DEFAULT_COHORT_WINDOW = 30
+
+# How long (seconds) a computed summary is reused
+COHORT_CACHE_TIMEOUT = 5 * 60
+
+
+def bmi_band_expression(field='bmi'):
+    """SQL version of diet_plans.get_bmi_band (same cut-offs)"""
+    return Case(
+        When(**{f'{field}__isnull': True}, then=Value('unknown')),
+        When(**{f'{field}__gt': 30}, then=Value('obese')),
+        When(**{f'{field}__gt': 25}, then=Value('overweight')),
+        When(**{f'{field}__lt': 18.5}, then=Value('underweight')),
+        default=Value('normal'),
+        output_field=models.CharField(),
+    )
+
+
+def age_band_expression(field='age'):
+    """SQL version of diet_plans.get_age_band (same cut-offs)"""
+    return Case(
+        When(**{f'{field}__gt': 60}, then=Value('senior')),
+        When(**{f'{field}__lt': 30}, then=Value('young')),
+        default=Value('adult'),
+        output_field=models.CharField(),
+    )
+
+
+def _percent(part, whole):
+    return round(100.0 * part / whole, 1) if whole else 0.0
+
+
+def _round(value):
+    return round(value, 1) if value is not None else None
+
+
+def compute_cohort_summary(days=DEFAULT_COHORT_WINDOW):
+    """
+    Clinic-wide summary for the last `days` days
+
+    Returns a JSON-friendly dict with:
+        high fasting: % of patients (with readings in the window) whose
+                      average fasting level is above the normal range
+        bmi_bands: patient count and share per BMI band
+        age_bands: average fasting/post-meal per age band
+    """
+    since = timezone.localdate() - timedelta(days=days - 1)
+    recent = SugarReading.objects.filter(reading_date__gte=since)
+
+    total_patients = Patient.objects.count()
+
+    # One row per patient with readings in the window, counted in SQL
+    per_patient = (
+        recent.order_by().values('patient')
+        .annotate(avg_fasting=Avg('sugar_before_breakfast'))
+    )
+    active_patients = per_patient.count()
+    high_fasting_patients = per_patient.filter(avg_fasting__gt=FASTING_HIGH).count()
+
+    bmi_counts = dict(
+        Patient.objects.order_by()
+        .annotate(band=bmi_band_expression())
+        .values('band').annotate(patients=Count('id'))
+        .values_list('band', 'patients')
+    )
+    bmi_bands = [
+        {'band': band, 'patients': bmi_counts.get(band, 0), 'percent': _percent(bmi_counts.get(band, 0), total_patients)}
+        for band in BMI_BANDS + ('unknown',)
+        if band != 'unknown' or bmi_counts.get(band)
+    ]
+
+    age_rows = {
+        row['band']: row
+        for row in recent.order_by()
+        .annotate(band=age_band_expression('patient__age'))
+        .values('band')
+        .annotate(
+            patients=Count('patient', distinct=True),
+            readings=Count('id'),
+            avg_fasting=Avg('sugar_before_breakfast'),
+            avg_postmeal=Avg('sugar_after_breakfast'),
+        )
+    }
+    age_bands = []
+    for band in AGE_BANDS:
+        row = age_rows.get(band, {})
+        age_bands.append({
+            'band': band,
+            'patients': row.get('patients', 0),
+            'readings': row.get('readings', 0),
+            'avg_fasting': _round(row.get('avg_fasting')),
+            'avg_postmeal': _round(row.get('avg_postmeal')),
+        })
+
+    return {
+        'days': days,
+        'since': since.isoformat(),
+        'total_patients': total_patients,
+        'active_patients': active_patients,
+        'high_fasting_patients': high_fasting_patients,
+        'high_fasting_percent': _percent(high_fasting_patients, active_patients),
+        'bmi_bands': bmi_bands,
+        'age_bands': age_bands,
+    }
+
+
+def get_cohort_summary(days=DEFAULT_COHORT_WINDOW):
+    """Cached version of compute_cohort_summary()"""
+    key = f'cohort-summary:{days}:{timezone.localdate().isoformat()}'
+    summary = cache.get(key)
+    if summary is None:
+        summary = compute_cohort_summary(days)
+        cache.set(key, summary, COHORT_CACHE_TIMEOUT)
+    return summary
@@ -0,0 +1,127 @@
+"""
+Conditional GET (ETag / Last-Modified) for the patient pages
+
+Everything a patient page shows changes only when one of these does:
+
+    Patient.updated_at            patient details edited
+    PatientSummary.updated_at     any reading added, edited or deleted
+                                  (the summary is saved in the same transaction)
+    newest HealthData updated_at  lab results added or edited
+    number of HealthData rows     lab results deleted
+
+They are read in one small query (a join plus two indexed subqueries),
+before the view runs. If the browser already has that version the
+response is a 304 and the page's own queries and template never run.
+
+conditional_page() works for both the sync views and the async views in
+app/async_views.py (Django's condition() decorator only wraps sync views).
+"""
+import hashlib
+from asyncio import iscoroutinefunction
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+
+from django.contrib.messages import get_messages
+from django.db.models import Count, F, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from .models import HealthData, Patient
+
+
+def version_queryset(**lookup):
+    """One-row queryset with the timestamps a patient page depends on"""
+    health = HealthData.objects.filter(patient=OuterRef('pk')).order_by().values('patient')
+    return Patient.objects.filter(**lookup).values(
+        'pk',
+        'updated_at',
+        summary_updated_at=F('summary__updated_at'),
+        health_updated_at=Subquery(health.annotate(latest=Max('updated_at')).values('latest')),
+        health_count=Coalesce(Subquery(health.annotate(total=Count('id')).values('total')), 0),
+    )
+
+
+def _validators(page, version, extra):
+    """(etag, last_modified timestamp) for one page"""
+    parts = [page, version['pk'], version['updated_at'], version['summary_updated_at'],
+             version['health_updated_at'], version['health_count'], extra]
+    etag = hashlib.md5(repr(parts).encode(), usedforsecurity=False).hexdigest()
+    changed = [value for value in (version['updated_at'], version['summary_updated_at'],
+                                   version['health_updated_at']) if value is not None]
+    return quote_etag(etag), int(max(changed).timestamp())
+
+
+def _always_render(request):
+    """Only GET/HEAD can be answered with 304, and never while a flash message is waiting"""
+    return request.method not in ('GET', 'HEAD') or len(get_messages(request)) > 0
+
+
+def _finish(response, etag, last_modified):
+    """Add validators to a full response; ask browsers to revalidate every time"""
+    if response.status_code == 200:
+        response.headers.setdefault('ETag', etag)
+        response.headers.setdefault('Last-Modified', http_date(last_modified))
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def conditional_page(page, lookup, daily=False):
+    """
+    Decorator: answer If-None-Match / If-Modified-Since with 304 for a patient page
+
+    Args:
+        page: name mixed into the ETag (pages of one patient differ)
+        lookup: function (view kwargs) -> filter kwargs for Patient
+        daily: page also depends on today's date (rolling windows)
+    """
+    def extra(request):
+        return (request.get_full_path(), timezone.localdate().isoformat() if daily else None)
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                # Message storage may fall back to the session (a database read)
+                if await sync_to_async(_always_render)(request):
+                    return await view(request, *args, **kwargs)
+                version = await version_queryset(**lookup(kwargs)).afirst()
+                if version is None:
+                    return await view(request, *args, **kwargs)
+                etag, last_modified = _validators(page, version, extra(request))
+                response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                return _finish(response, etag, last_modified)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if _always_render(request):
+                return view(request, *args, **kwargs)
+            version = version_queryset(**lookup(kwargs)).first()
+            if version is None:
+                return view(request, *args, **kwargs)
+            etag, last_modified = _validators(page, version, extra(request))
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = view(request, *args, **kwargs)
+            return _finish(response, etag, last_modified)
+        return wrapper
+
+    return decorator
+
+
+# Lookups from each view's URL kwargs to its patient
+def by_pk(kwargs):
+    return {'pk': kwargs['pk']}
+
+
+def by_patient_id(kwargs):
+    return {'pk': kwargs['patient_id']}
+
+
+def by_reading(kwargs):
+    return {'sugar_readings__pk': kwargs['pk']}
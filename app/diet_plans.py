@@ -1,10 +1,62 @@
 """
 Comprehensive Diet Plans for Diabetes Management
+
+A plan only depends on the sugar condition (3 values), the BMI band (4)
+and the age band (3), so all 36 variants are built once when this module
+is imported and stored as read-only structures. get_detailed_diet_plan()
+is then just a dictionary lookup.
 """
+from itertools import product
+from types import MappingProxyType
+
+from .metrics import timed
+
+CONDITIONS = ('high_sugar', 'low_sugar', 'normal')
+BMI_BANDS = ('underweight', 'normal', 'overweight', 'obese')
+AGE_BANDS = ('young', 'adult', 'senior')
 
+# How long the rendered diet plan HTML is cached (seconds) - plans only change with the code
+DIET_PLAN_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def get_condition(status):
+    """Overall condition from a status dict with 'fasting' and 'postmeal'"""
+    if status['fasting'] == 'High' or status['postmeal'] == 'High':
+        return 'high_sugar'
+    elif status['fasting'] == 'Low':
+        return 'low_sugar'
+    return 'normal'
+
+
+def get_bmi_band(bmi):
+    """BMI band used to pick the BMI note"""
+    if bmi > 30:
+        return 'obese'
+    elif bmi > 25:
+        return 'overweight'
+    elif bmi < 18.5:
+        return 'underweight'
+    return 'normal'
+
+
+def get_age_band(age):
+    """Age band used to pick the age note"""
+    if age > 60:
+        return 'senior'
+    elif age < 30:
+        return 'young'
+    return 'adult'
+
+
+def get_diet_plan_key(status, patient_age, bmi):
+    """The (condition, bmi_band, age_band) key that identifies a diet plan"""
+    return (get_condition(status), get_bmi_band(bmi), get_age_band(patient_age))
+
+
+@timed('caretrack_diet_plan_seconds')
 def get_detailed_diet_plan(status, patient_age, bmi):
     """
-    Generate detailed diet plan based on sugar status, age, and BMI
+    Get detailed diet plan based on sugar status, age, and BMI
     
     Args:
         status: dict with 'fasting' and 'postmeal' sugar status
@@ -12,16 +64,33 @@ def get_detailed_diet_plan(status, patient_age, bmi):
         bmi: float - patient's BMI
     
     Returns:
-        dict with comprehensive meal plans
+        read-only dict with comprehensive meal plans (shared - do not modify)
+    """
+    return DIET_PLANS[get_diet_plan_key(status, patient_age, bmi)]
+
+
+def diet_plan_context(status, patient):
     """
+    Diet plan template variables (reading detail page and monthly reports)
     
-    # Determine overall condition
-    if status['fasting'] == 'High' or status['postmeal'] == 'High':
-        condition = 'high_sugar'
-    elif status['fasting'] == 'Low':
-        condition = 'low_sugar'
-    else:
-        condition = 'normal'
+    The templates cache the plan's HTML under diet_plan_key, so it is only
+    rendered once per plan variant, not once per request.
+    """
+    bmi = float(patient.bmi) if patient.bmi else 25.0
+    return {
+        'diet_plan': get_detailed_diet_plan(status=status, patient_age=patient.age, bmi=bmi),
+        'diet_plan_key': '-'.join(get_diet_plan_key(status, patient.age, bmi)),
+        'diet_plan_cache_timeout': DIET_PLAN_CACHE_TIMEOUT,
+    }
+
+
+def build_diet_plan(condition, bmi_band, age_band):
+    """
+    Build one diet plan from scratch (used to fill DIET_PLANS at import time)
+    
+    Returns:
+        dict with comprehensive meal plans
+    """
     
     # Base diet plan structure
     diet_plan = {
@@ -364,22 +433,38 @@ def get_detailed_diet_plan(status, patient_age, bmi):
         ]
     
     # Adjust for BMI
-    if bmi > 30:
+    if bmi_band == 'obese':
         diet_plan['bmi_note'] = 'Your BMI indicates obesity. Focus on portion control and regular exercise. Consult a nutritionist for personalized plan.'
-    elif bmi > 25:
+    elif bmi_band == 'overweight':
         diet_plan['bmi_note'] = 'Your BMI indicates overweight. Reduce portion sizes and increase physical activity.'
-    elif bmi < 18.5:
+    elif bmi_band == 'underweight':
         diet_plan['bmi_note'] = 'Your BMI indicates underweight. Increase calorie intake with nutritious foods. Consider consulting a doctor.'
     
     # Adjust for age
-    if patient_age > 60:
+    if age_band == 'senior':
         diet_plan['age_note'] = 'Senior citizens need: More calcium (milk, curd), easy-to-digest foods, vitamin D supplements, and regular health checkups.'
-    elif patient_age < 30:
+    elif age_band == 'young':
         diet_plan['age_note'] = 'Young adults: Focus on building healthy habits now for long-term diabetes management.'
     
     return diet_plan
 
 
+def _freeze(value):
+    """Recursively turn dicts into read-only mappings and lists into tuples"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+# Every diet plan variant, built once: (condition, bmi_band, age_band) -> plan
+DIET_PLANS = {
+    key: _freeze(build_diet_plan(*key))
+    for key in product(CONDITIONS, BMI_BANDS, AGE_BANDS)
+}
+
+
 def get_indian_meal_alternatives():
     """Common Indian meal alternatives for diabetes"""
     return {
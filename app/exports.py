@@ -0,0 +1,139 @@
+"""
+Streaming export of readings (and optionally health data) as CSV or NDJSON
+
+Rows are pulled with values(...).iterator(chunk_size=...) and turned
+into text one at a time, so a StreamingHttpResponse built from these
+generators uses the same small amount of memory for 10 rows or 10 million.
+The astream_* versions do the same with aiterator() for the async views -
+under ASGI a sync generator would be read to the end before sending.
+"""
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import HealthData, SugarReading
+
+# Rows fetched from the database at a time
+EXPORT_CHUNK_SIZE = 2000
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Same column names import_readings understands, so exports can be re-imported
+READING_COLUMNS = ['patient_id', 'reading_date', 'sugar_before_breakfast', 'sugar_after_breakfast', 'notes']
+HEALTH_COLUMNS = ['patient_id', 'test_date', 'cholesterol_total', 'cholesterol_ldl', 'cholesterol_hdl', 'tsh_level']
+
+# Column layout when readings and health data share one CSV
+COMBINED_COLUMNS = [
+    'record_type', 'patient_id', 'date',
+    'sugar_before_breakfast', 'sugar_after_breakfast', 'notes',
+    'cholesterol_total', 'cholesterol_ldl', 'cholesterol_hdl', 'tsh_level',
+]
+
+
+class _Echo:
+    """File-like object for csv.writer that hands each line straight back"""
+
+    def write(self, value):
+        return value
+
+
+# values() rather than values_list(): in Django 4.2 a values_list() queryset
+# runs its query as soon as aiterator() starts, outside sync_to_async
+def _readings(patient_id=None):
+    readings = SugarReading.objects.all()
+    if patient_id is not None:
+        readings = readings.filter(patient_id=patient_id)
+    return readings.order_by('patient_id', 'reading_date').values(*READING_COLUMNS)
+
+
+def _health_data(patient_id=None):
+    health_data = HealthData.objects.all()
+    if patient_id is not None:
+        health_data = health_data.filter(patient_id=patient_id)
+    return health_data.order_by('patient_id', 'test_date').values(*HEALTH_COLUMNS)
+
+
+def _json_line(row, record_type):
+    return json.dumps(dict(row, record_type=record_type), cls=DjangoJSONEncoder) + '\n'
+
+
+def _combined_health(row):
+    """A health data row in COMBINED_COLUMNS order (after record_type)"""
+    return [
+        row['patient_id'], row['test_date'], '', '', '',
+        row['cholesterol_total'], row['cholesterol_ldl'], row['cholesterol_hdl'], row['tsh_level'],
+    ]
+
+
+def _csv_parts(patient_id, include_health):
+    """Header line plus (rows, row -> line) pairs for a CSV export"""
+    writer = csv.writer(_Echo())
+
+    if not include_health:
+        return writer.writerow(READING_COLUMNS), [(_readings(patient_id), lambda row: writer.writerow(row.values()))]
+
+    return writer.writerow(COMBINED_COLUMNS), [
+        (_readings(patient_id), lambda row: writer.writerow(['reading', *row.values(), '', '', '', ''])),
+        (_health_data(patient_id), lambda row: writer.writerow(['health_data', *_combined_health(row)])),
+    ]
+
+
+def _ndjson_parts(patient_id, include_health):
+    """No header, plus (rows, row -> line) pairs for an NDJSON export"""
+    parts = [(_readings(patient_id), lambda row: _json_line(row, 'reading'))]
+    if include_health:
+        parts.append((_health_data(patient_id), lambda row: _json_line(row, 'health_data')))
+    return None, parts
+
+
+def _stream(header, parts):
+    if header is not None:
+        yield header
+    for rows, line in parts:
+        for row in rows.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            yield line(row)
+
+
+async def _astream(header, parts):
+    if header is not None:
+        yield header
+    for rows, line in parts:
+        async for row in rows.aiterator(chunk_size=EXPORT_CHUNK_SIZE):
+            yield line(row)
+
+
+def stream_csv(patient_id=None, include_health=False):
+    """Yield CSV lines for one patient (or everyone if patient_id is None)"""
+    return _stream(*_csv_parts(patient_id, include_health))
+
+
+def stream_ndjson(patient_id=None, include_health=False):
+    """Yield one JSON object per line for one patient (or everyone)"""
+    return _stream(*_ndjson_parts(patient_id, include_health))
+
+
+def astream_csv(patient_id=None, include_health=False):
+    """Async generator version of stream_csv()"""
+    return _astream(*_csv_parts(patient_id, include_health))
+
+
+def astream_ndjson(patient_id=None, include_health=False):
+    """Async generator version of stream_ndjson()"""
+    return _astream(*_ndjson_parts(patient_id, include_health))
+
+
+STREAMERS = {
+    'csv': stream_csv,
+    'ndjson': stream_ndjson,
+}
+
+# Used by the async export views: under ASGI, Django 4.2 buffers the whole
+# body of a StreamingHttpResponse built from a sync iterator
+ASTREAMERS = {
+    'csv': astream_csv,
+    'ndjson': astream_ndjson,
+}
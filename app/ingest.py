@@ -0,0 +1,284 @@
+"""
+Bulk loading of sugar readings
+
+Shared by the import_readings management command and anything else that
+needs to write many readings at once. Readings are written with
+bulk_create in one transaction per batch, and clashes with the
+unique (patient, reading_date) constraint are either skipped or turned
+into updates. Anomaly flags, summaries and cached charts are brought up to
+date in the same transaction (bulk_create sends no signals).
+"""
+from datetime import date
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from . import anomalies, chart_cache
+from .forms import SugarReadingForm
+from .summaries import rebuild_summaries
+from .models import Patient, SugarReading
+
+# What to do when a reading already exists for that patient and day
+ON_CONFLICT_CHOICES = ('skip', 'update')
+
+# Per-row outcomes reported by ingest_reading_rows()
+ROW_STATUSES = ('created', 'updated', 'skipped', 'duplicate', 'invalid', 'unknown_patient')
+
+# Fields replaced when on_conflict='update'
+UPDATE_FIELDS = ['sugar_before_breakfast', 'sugar_after_breakfast', 'notes']
+
+# Column names accepted in import files -> model field
+COLUMN_ALIASES = {
+    'patient_id': 'patient_id',
+    'patient': 'patient_id',
+    'reading_date': 'reading_date',
+    'date': 'reading_date',
+    'sugar_before_breakfast': 'sugar_before_breakfast',
+    'fasting': 'sugar_before_breakfast',
+    'sugar_after_breakfast': 'sugar_after_breakfast',
+    'postmeal': 'sugar_after_breakfast',
+    'notes': 'notes',
+}
+
+
+def _sugar_value(value, label):
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{label} must be a whole number")
+    if number < 0:
+        raise ValueError(f"{label} must not be negative")
+    return number
+
+
+def _normalise_row(row):
+    """Map the row's column names to model field names (unknown columns are ignored)"""
+    values = {}
+    for column, value in row.items():
+        field = COLUMN_ALIASES.get(str(column).strip().lower())
+        if field:
+            values[field] = value.strip() if isinstance(value, str) else value
+    return values
+
+
+def parse_reading(row, default_patient_id=None):
+    """
+    Turn one raw row (dict from CSV/JSON) into an unsaved SugarReading
+
+    Raises ValueError with a readable message if the row is invalid.
+    """
+    values = _normalise_row(row)
+
+    patient_id = values.get('patient_id') or default_patient_id
+    try:
+        patient_id = int(patient_id)
+    except (TypeError, ValueError):
+        raise ValueError("patient_id is missing or not a number")
+
+    try:
+        reading_date = date.fromisoformat(str(values.get('reading_date', '')))
+    except ValueError:
+        raise ValueError("reading_date must be a date like 2024-01-31")
+
+    return SugarReading(
+        patient_id=patient_id,
+        reading_date=reading_date,
+        sugar_before_breakfast=_sugar_value(values.get('sugar_before_breakfast'), 'sugar_before_breakfast'),
+        sugar_after_breakfast=_sugar_value(values.get('sugar_after_breakfast'), 'sugar_after_breakfast'),
+        notes=values.get('notes') or '',
+    )
+
+
+def existing_patient_ids(patient_ids):
+    """Which of these patient ids exist (one query)"""
+    return set(Patient.objects.filter(pk__in=set(patient_ids)).values_list('pk', flat=True))
+
+
+def existing_reading_keys(readings):
+    """(patient_id, reading_date) pairs from `readings` that are already stored (one query)"""
+    keys = {(r.patient_id, r.reading_date) for r in readings}
+    if not keys:
+        return set()
+    stored = SugarReading.objects.filter(
+        patient_id__in={key[0] for key in keys},
+        reading_date__in={key[1] for key in keys},
+    ).values_list('patient_id', 'reading_date')
+    return keys.intersection(stored)
+
+
+def pending_changes():
+    """Empty record of derived data to refresh once after many bulk writes"""
+    return {'patient_ids': set(), 'rescore': set(), 'baselines': {}}
+
+
+def finish_bulk_writes(pending):
+    """Do the refresh collected by bulk_write_readings(..., pending=pending), in one transaction"""
+    with transaction.atomic():
+        anomalies.save_baselines(pending['baselines'])
+        readings_changed(pending['patient_ids'], pending['rescore'])
+
+
+def bulk_write_readings(readings, on_conflict='skip', outcomes=None, pending=None):
+    """
+    Write a batch of unsaved readings in a single transaction
+
+    Readings for unknown patients are dropped, and duplicates of the same
+    (patient, reading_date) inside the batch keep only the last one.
+    If an `outcomes` dict is given it is filled with
+    (patient_id, reading_date) -> 'created', 'updated' or 'skipped'.
+
+    Derived data is refreshed in the same transaction. Callers writing many
+    batches (import_readings) pass `pending` from pending_changes() instead:
+    the patients written, their anomaly baselines and those whose flags
+    need a replay are collected there, and finish_bulk_writes() saves each
+    baseline and rebuilds each summary (and replays flags) once, after the
+    last batch.
+
+    Returns:
+        dict with counts: created, updated, skipped, unknown_patient
+    """
+    if on_conflict not in ON_CONFLICT_CHOICES:
+        raise ValueError(f"on_conflict must be one of {', '.join(ON_CONFLICT_CHOICES)}")
+
+    known_patients = existing_patient_ids(r.patient_id for r in readings)
+    unique = {}
+    for reading in readings:
+        if reading.patient_id in known_patients:
+            unique[(reading.patient_id, reading.reading_date)] = reading
+    batch = list(unique.values())
+
+    counts = {
+        'created': 0,
+        'updated': 0,
+        'skipped': len(readings) - len(batch),
+        'unknown_patient': sum(1 for r in readings if r.patient_id not in known_patients),
+    }
+    counts['skipped'] -= counts['unknown_patient']
+    if not batch:
+        return counts
+
+    with transaction.atomic():
+        existing = existing_reading_keys(batch)
+        # New readings are scored before the insert; overwritten ones need a replay afterwards
+        overwritten = {key[0] for key in existing} if on_conflict == 'update' else set()
+        new = [r for r in batch if (r.patient_id, r.reading_date) not in existing]
+        if pending is None:
+            rescore = anomalies.score_bulk_readings(new, rescore=overwritten)
+        else:
+            rescore = anomalies.score_bulk_readings(
+                new, rescore=overwritten | pending['rescore'], states=pending['baselines'],
+            )
+        if on_conflict == 'update':
+            SugarReading.objects.bulk_create(
+                batch,
+                update_conflicts=True,
+                unique_fields=['patient', 'reading_date'],
+                update_fields=UPDATE_FIELDS,
+            )
+            counts['updated'] += len(existing)
+        else:
+            SugarReading.objects.bulk_create(batch, ignore_conflicts=True)
+            counts['skipped'] += len(existing)
+        counts['created'] += len(batch) - len(existing)
+        if pending is not None:
+            pending['patient_ids'].update(r.patient_id for r in batch)
+            pending['rescore'] |= rescore
+        else:
+            readings_changed({r.patient_id for r in batch}, rescore)
+
+    if outcomes is not None:
+        stored = 'updated' if on_conflict == 'update' else 'skipped'
+        for reading in batch:
+            key = (reading.patient_id, reading.reading_date)
+            outcomes[key] = stored if key in existing else 'created'
+
+    return counts
+
+
+def readings_changed(patient_ids=(), rescore=()):
+    """
+    Refresh data derived from readings after a bulk write (inside its transaction)
+
+    bulk_create does not send pre_save/post_save signals, so anything the
+    signal handlers in app/signals.py would normally do is done here instead:
+    patients in `rescore` have their anomaly flags replayed in date order
+    (see anomalies.score_bulk_readings), summaries are rebuilt and cached
+    charts dropped. Rescored patients count as changed too: their summary's
+    updated_at is part of the page version.
+    """
+    if rescore:
+        anomalies.backfill_anomalies(rescore)
+    changed = set(patient_ids) | set(rescore)
+    rebuild_summaries(changed)
+    for patient_id in changed:
+        chart_cache.invalidate(patient_id)
+
+
+def clean_reading_row(row, form_fields):
+    """
+    Validate one API row with the same field rules as SugarReadingForm
+
+    `form_fields` is SugarReadingForm().fields (built once per request).
+    Returns (unsaved SugarReading, None) or (None, {field: [messages]}).
+    """
+    if not isinstance(row, dict):
+        return None, {'__all__': ["Each reading must be a JSON object"]}
+
+    values = _normalise_row(row)
+    errors = {}
+    cleaned = {}
+    try:
+        cleaned['patient_id'] = int(values.get('patient_id'))
+    except (TypeError, ValueError):
+        errors['patient_id'] = ["This field is required and must be a number."]
+
+    for name, field in form_fields.items():
+        try:
+            cleaned[name] = field.clean(values.get(name))
+        except ValidationError as error:
+            errors[name] = error.messages
+
+    if errors:
+        return None, errors
+    return SugarReading(**cleaned), None
+
+
+def ingest_reading_rows(rows, on_conflict='skip'):
+    """
+    Validate and store many readings (across patients) at once
+
+    Valid rows are written with one bulk_write_readings() call. Returns
+    (counts, results) where results has one entry per input row, in
+    order, with its index, status and - for invalid rows - errors.
+    Statuses: created, updated, skipped (already stored), duplicate
+    (the same patient and day appears later in the request), invalid and
+    unknown_patient.
+    """
+    form_fields = SugarReadingForm().fields
+
+    results = []
+    readings = []
+    positions = {}
+    for index, row in enumerate(rows):
+        reading, errors = clean_reading_row(row, form_fields)
+        if errors:
+            results.append({'index': index, 'status': 'invalid', 'errors': errors})
+            continue
+        key = (reading.patient_id, reading.reading_date)
+        if key in positions:
+            # Only the last reading for a patient and day is kept
+            results[positions[key]]['status'] = 'duplicate'
+        positions[key] = index
+        readings.append(reading)
+        results.append({'index': index, 'status': None})
+
+    outcomes = {}
+    if readings:
+        bulk_write_readings(readings, on_conflict, outcomes=outcomes)
+    for key, index in positions.items():
+        results[index]['status'] = outcomes.get(key, 'unknown_patient')
+
+    counts = dict.fromkeys(ROW_STATUSES, 0)
+    for result in results:
+        counts[result['status']] += 1
+    return counts, results
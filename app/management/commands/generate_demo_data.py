@@ -0,0 +1,212 @@
+"""
+Fill the database with realistic made-up patients for demos and benchmarks
+
+Examples:
+    python manage.py generate_demo_data
+    python manage.py generate_demo_data --patients 1000 --years 3
+    python manage.py generate_demo_data --patients 50 --seed 7 --skip-rate 0.2
+
+Each patient gets one sugar reading per day (with some days missed) and
+a lab test every few months. Sugar levels follow the patient's own
+control level (normal, prediabetic or diabetic) with slow drift, weekly
+rhythm and the odd sick day, so charts, summaries and anomaly flags look
+like real data. Rows are written with bulk_create in batches, already
+scored for anomalies; summaries are built for the new patients at the end.
+"""
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from app.anomalies import score_readings
+from app.models import HealthData, Patient, SugarReading
+from app.summaries import rebuild_summaries
+
+FIRST_NAMES = [
+    'Aarav', 'Aisha', 'Alice', 'Ben', 'Carlos', 'Chen', 'Daniel', 'Emma', 'Fatima', 'George',
+    'Hannah', 'Ines', 'Ivan', 'Jamal', 'Julia', 'Kenji', 'Leila', 'Lucas', 'Maria', 'Mohammed',
+    'Nadia', 'Noah', 'Olivia', 'Omar', 'Priya', 'Rahul', 'Rosa', 'Sam', 'Sofia', 'Yusuf',
+]
+LAST_NAMES = [
+    'Ahmed', 'Brown', 'Chen', 'Costa', 'Das', 'Fischer', 'Garcia', 'Haddad', 'Ito', 'Jones',
+    'Khan', 'Kowalski', 'Lopez', 'Martin', 'Mehta', 'Novak', 'Okafor', 'Patel', 'Rossi', 'Sato',
+    'Schmidt', 'Silva', 'Singh', 'Smith', 'Taylor', 'Tran', 'Walker', 'Wang', 'Williams', 'Young',
+]
+
+# (share of patients, typical fasting level, typical rise after breakfast) in mg/dL
+CONTROL_GROUPS = [
+    (0.35, 92, 30),    # normal
+    (0.35, 112, 45),   # prediabetic
+    (0.30, 155, 70),   # diabetic
+]
+
+# Notes written on some days, with how much they move that day's sugar levels
+DAY_NOTES = [
+    ('Skipped breakfast', -10, -35),
+    ('Morning walk', -8, -20),
+    ('Gym session', -12, -25),
+    ('Late dinner yesterday', 12, 15),
+    ('Birthday party', 10, 45),
+    ('Stressful day at work', 10, 20),
+    ('Sick day, had a cold', 30, 45),
+    ('Forgot medication', 25, 40),
+]
+NOTE_RATE = 0.06
+
+# Lab tests (cholesterol / thyroid) roughly this often
+HEALTH_TEST_INTERVAL_DAYS = 90
+
+
+def clamp(value, low, high):
+    return max(low, min(high, value))
+
+
+class Command(BaseCommand):
+    help = "Generate realistic demo patients, sugar readings and health data"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=100, help="Number of patients to create (default 100)")
+        parser.add_argument('--years', type=float, default=2, help="Years of daily readings per patient (default 2)")
+        parser.add_argument('--skip-rate', type=float, default=0.1,
+                            help="Share of days with no reading (default 0.1)")
+        parser.add_argument('--seed', type=int, help="Random seed, for repeatable data")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Rows per INSERT batch (default 5000)")
+
+    def handle(self, *args, **options):
+        if options['patients'] < 1 or options['years'] <= 0:
+            raise CommandError("--patients and --years must be positive")
+        if not 0 <= options['skip_rate'] < 1:
+            raise CommandError("--skip-rate must be between 0 and 1")
+
+        rng = random.Random(options['seed'])
+        batch_size = options['batch_size']
+        days = int(options['years'] * 365)
+        end = timezone.localdate()
+        start = end - timedelta(days=days - 1)
+        started = time.perf_counter()
+
+        patients, readings, health = [], [], []
+        patient_ids = []
+        totals = {'readings': 0, 'health': 0, 'flagged': 0}
+        for _ in range(options['patients']):
+            patient = self.make_patient(rng)
+            patient_readings = list(self.make_readings(rng, patient, start, days, options['skip_rate']))
+            # Score the readings here (in date order) instead of replaying them after the insert
+            for field, value in score_readings(patient_readings).items():
+                setattr(patient, field, value)
+            totals['flagged'] += sum(reading.is_anomaly for reading in patient_readings)
+
+            patients.append(patient)
+            readings.extend(patient_readings)
+            health.extend(self.make_health_data(rng, patient, start, days))
+            if len(readings) >= batch_size:
+                patient_ids += self.write(patients, readings, health, batch_size, totals)
+        patient_ids += self.write(patients, readings, health, batch_size, totals)
+        written = time.perf_counter() - started
+
+        # bulk_create skips the per-reading signals, so build the new patients' summaries
+        rebuild_summaries(patient_ids)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {len(patient_ids)} patients, {totals['readings']} sugar readings "
+            f"({totals['flagged']} unusual) and {totals['health']} health records in {elapsed:.1f}s "
+            f"({totals['readings'] / written:,.0f} readings/s written)"
+        ))
+
+    def write(self, patients, readings, health, batch_size, totals):
+        """Insert the collected patients and their rows, empty the lists and return the new patient ids"""
+        with transaction.atomic():
+            Patient.objects.bulk_create(patients, batch_size=batch_size)
+            SugarReading.objects.bulk_create(readings, batch_size=batch_size)
+            HealthData.objects.bulk_create(health, batch_size=batch_size)
+        totals['readings'] += len(readings)
+        totals['health'] += len(health)
+        patient_ids = [patient.pk for patient in patients]
+        patients.clear()
+        readings.clear()
+        health.clear()
+        return patient_ids
+
+    def make_patient(self, rng):
+        """A patient with a plausible age, height and weight (bulk_create skips save(), so BMI is set here)"""
+        height = clamp(rng.gauss(168, 10), 145, 205)
+        bmi = clamp(rng.gauss(28, 5), 17, 48)
+        patient = Patient(
+            name=f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+            age=int(clamp(rng.gauss(55, 15), 18, 95)),
+            height=Decimal(f'{height:.1f}'),
+            weight=Decimal(f'{bmi * (height / 100) ** 2:.1f}'),
+        )
+        patient.calculate_bmi()
+        patient.bmi = round(patient.bmi, 2)
+        return patient
+
+    def make_readings(self, rng, patient, start, days, skip_rate):
+        """One reading per day around the patient's own level, drifting slowly"""
+        share = rng.random()
+        for weight, fasting_level, rise in CONTROL_GROUPS:
+            share -= weight
+            if share <= 0:
+                break
+        fasting_level = rng.gauss(fasting_level, fasting_level * 0.08)
+        rise = rng.gauss(rise, rise * 0.2)
+        spread = fasting_level * rng.uniform(0.06, 0.12)
+        drift = 0.0
+
+        for day in range(days):
+            # Slow random walk, pulled back towards the patient's usual level
+            drift = 0.97 * drift + rng.gauss(0, 1.5)
+            if rng.random() < skip_rate:
+                continue
+
+            reading_date = start + timedelta(days=day)
+            weekend = 6 if reading_date.weekday() >= 5 else 0
+            fasting = fasting_level + drift + weekend + rng.gauss(0, spread)
+            postmeal = fasting + rise + weekend + rng.gauss(0, spread * 1.5)
+
+            notes = ''
+            if rng.random() < NOTE_RATE:
+                notes, fasting_change, postmeal_change = rng.choice(DAY_NOTES)
+                fasting += fasting_change
+                postmeal += postmeal_change
+
+            yield SugarReading(
+                patient=patient,
+                reading_date=reading_date,
+                sugar_before_breakfast=int(clamp(fasting, 50, 400)),
+                sugar_after_breakfast=int(clamp(postmeal, 60, 500)),
+                notes=notes,
+            )
+
+    def make_health_data(self, rng, patient, start, days):
+        """A lab test every few months; not every test measures everything"""
+        total_base = rng.gauss(200, 30)
+        hdl_base = rng.gauss(50, 10)
+        tsh_base = rng.lognormvariate(0.7, 0.4)
+
+        day = rng.randrange(HEALTH_TEST_INTERVAL_DAYS)
+        while day < days:
+            has_lipids = rng.random() < 0.85
+            has_tsh = rng.random() < 0.5
+            if has_lipids or has_tsh:
+                total = hdl = ldl = tsh = None
+                if has_lipids:
+                    total = int(clamp(rng.gauss(total_base, 12), 110, 350))
+                    hdl = int(clamp(rng.gauss(hdl_base, 4), 20, 110))
+                    ldl = max(30, int(total - hdl - rng.gauss(30, 8)))
+                if has_tsh:
+                    tsh = Decimal(f'{clamp(tsh_base * rng.uniform(0.8, 1.25), 0.05, 20):.2f}')
+                yield HealthData(
+                    patient=patient,
+                    test_date=start + timedelta(days=day),
+                    cholesterol_total=total,
+                    cholesterol_ldl=ldl,
+                    cholesterol_hdl=hdl,
+                    tsh_level=tsh,
+                )
+            day += int(rng.gauss(HEALTH_TEST_INTERVAL_DAYS, 15))
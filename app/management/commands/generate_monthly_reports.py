@@ -0,0 +1,119 @@
+"""
+Write a static HTML report per patient for one month, using several processes
+
+Examples:
+    python manage.py generate_monthly_reports                  # last month, one worker per CPU
+    python manage.py generate_monthly_reports --month 2026-09 --workers 4
+    python manage.py generate_monthly_reports --patient 12 --force --workers 1
+
+Patients with readings in the month are split into chunks; each worker
+process renders a chunk at a time from a few bulk queries (see
+app/reports.py). Reports that already exist are skipped, so a run that
+was stopped or failed part way can simply be started again (--force
+rewrites them). At the end the command prints how many reports each
+worker wrote and how fast.
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from app.reports import parse_month, patients_with_readings, previous_month, render_chunk, report_path
+
+
+class Command(BaseCommand):
+    help = "Generate monthly HTML reports for every patient, in parallel"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--month', help="Month to report as YYYY-MM (default: last month)")
+        parser.add_argument('--output', default='reports', help="Folder for the reports (default 'reports')")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Worker processes (default: one per CPU; 1 runs without a pool)")
+        parser.add_argument('--chunk-size', type=int, default=25,
+                            help="Patients per unit of work (default 25)")
+        parser.add_argument(
+            '--patient', type=int, action='append', dest='patients',
+            help="Only report on this patient (can be repeated)",
+        )
+        parser.add_argument('--force', action='store_true', help="Rewrite reports that already exist")
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['chunk_size'] < 1:
+            raise CommandError("--workers and --chunk-size must be positive")
+        try:
+            first = parse_month(options['month']) if options['month'] else previous_month()
+        except ValueError:
+            raise CommandError("--month must look like 2026-09")
+        output = os.path.abspath(options['output'])
+
+        started = time.perf_counter()
+        patient_ids = patients_with_readings(first, options['patients'])
+        todo = patient_ids if options['force'] else [
+            patient_id for patient_id in patient_ids
+            if not report_path(output, first, patient_id).exists()
+        ]
+        skipped = len(patient_ids) - len(todo)
+        self.stdout.write(
+            f"{first:%B %Y}: {len(patient_ids)} patients with readings, "
+            f"{skipped} reports already written, {len(todo)} to do"
+        )
+        if not todo:
+            return
+
+        size = options['chunk_size']
+        chunks = [todo[i:i + size] for i in range(0, len(todo), size)]
+        workers = min(options['workers'], len(chunks))
+        results, failed = self.run(chunks, first, output, workers)
+        elapsed = time.perf_counter() - started
+
+        # Throughput per worker process (busy time only, not waiting for work)
+        per_worker = {}
+        for result in results:
+            totals = per_worker.setdefault(result['pid'], {'chunks': 0, 'reports': 0, 'bytes': 0, 'seconds': 0.0})
+            totals['chunks'] += 1
+            for field in ('reports', 'bytes', 'seconds'):
+                totals[field] += result[field]
+        for pid, totals in sorted(per_worker.items()):
+            rate = totals['reports'] / totals['seconds'] if totals['seconds'] else 0
+            self.stdout.write(
+                f"  worker {pid}: {totals['reports']} reports in {totals['chunks']} chunks, "
+                f"{totals['bytes'] / 1e6:.1f} MB, {totals['seconds']:.1f}s busy ({rate:.1f} reports/s)"
+            )
+
+        written = sum(totals['reports'] for totals in per_worker.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {written} reports to {os.path.join(output, f'{first:%Y-%m}')} with {workers} "
+            f"worker(s) in {elapsed:.1f}s ({written / elapsed:.1f} reports/s)"
+        ))
+        if failed:
+            raise CommandError(
+                f"{len(failed)} of {len(chunks)} chunks failed (first error: {failed[0]}); "
+                "run the command again to finish the missing reports"
+            )
+
+    def run(self, chunks, first, output, workers):
+        """Render every chunk; returns (results, errors) - one failed chunk does not stop the others"""
+        results, failed = [], []
+        if workers == 1:
+            for chunk in chunks:
+                try:
+                    results.append(render_chunk(chunk, first, output))
+                except Exception as error:
+                    failed.append(f"{type(error).__name__}: {error}")
+            return results, failed
+
+        # Workers are started fresh ("spawn") and set Django up themselves, so they
+        # never share this process's database connection
+        connections.close_all()
+        with ProcessPoolExecutor(workers, mp_context=get_context('spawn'), initializer=django.setup) as pool:
+            futures = [pool.submit(render_chunk, chunk, first, output) for chunk in chunks]
+            for future in as_completed(futures):
+                try:
+                    results.append(future.result())
+                except Exception as error:
+                    failed.append(f"{type(error).__name__}: {error}")
+        return results, failed
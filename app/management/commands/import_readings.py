@@ -0,0 +1,182 @@
+"""
+Bulk import of glucometer readings from CSV, NDJSON or JSON files
+
+Examples:
+    python manage.py import_readings clinic.csv
+    python manage.py import_readings export.ndjson --on-conflict update
+    python manage.py import_readings meter.json --patient 12 --batch-size 5000
+
+Files are read as a stream and written in batches, so memory use depends
+on --batch-size, not on the size of the file. Patient summaries are
+rebuilt once after the last batch, and readings that arrive older than what
+is already stored (e.g. a newest-first file) have their patients' anomaly
+flags replayed in date order then too.
+"""
+import csv
+import json
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.ingest import ON_CONFLICT_CHOICES, bulk_write_readings, finish_bulk_writes, parse_reading, pending_changes
+
+# Bytes read at a time from JSON array files
+JSON_CHUNK_SIZE = 64 * 1024
+
+# Largest single JSON object we are willing to buffer while looking for its end
+JSON_MAX_OBJECT_SIZE = 1024 * 1024
+
+
+def iter_csv(handle):
+    """Rows of a CSV file with a header line"""
+    yield from csv.DictReader(handle)
+
+
+def iter_ndjson(handle):
+    """Rows of a newline-delimited JSON file (one object per line)"""
+    for line_number, line in enumerate(handle, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as error:
+            raise CommandError(f"Line {line_number}: invalid JSON ({error.msg})")
+
+
+def iter_json_array(handle):
+    """Rows of a JSON file holding one big list, decoded one object at a time"""
+    decoder = json.JSONDecoder()
+    buffer = handle.read(JSON_CHUNK_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError("JSON file must contain a list of readings")
+    buffer = buffer[1:]
+
+    while True:
+        buffer = buffer.lstrip()
+        if buffer.startswith(','):
+            buffer = buffer[1:].lstrip()
+        if buffer.startswith(']'):
+            return
+
+        if buffer:
+            try:
+                row, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                # Object is cut off at the end of the buffer - read more below
+                if len(buffer) > JSON_MAX_OBJECT_SIZE:
+                    raise CommandError("Invalid JSON: could not decode the next reading")
+            else:
+                yield row
+                buffer = buffer[end:]
+                continue
+
+        chunk = handle.read(JSON_CHUNK_SIZE)
+        if not chunk:
+            raise CommandError("Unexpected end of JSON file")
+        buffer += chunk
+
+
+READERS = {
+    'csv': iter_csv,
+    'ndjson': iter_ndjson,
+    'json': iter_json_array,
+}
+
+EXTENSIONS = {
+    '.csv': 'csv',
+    '.ndjson': 'ndjson',
+    '.jsonl': 'ndjson',
+    '.json': 'json',
+}
+
+
+class Command(BaseCommand):
+    help = "Import sugar readings in bulk from a CSV, NDJSON or JSON file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import")
+        parser.add_argument(
+            '--format', choices=sorted(READERS),
+            help="File format (default: guessed from the file extension)",
+        )
+        parser.add_argument(
+            '--on-conflict', choices=ON_CONFLICT_CHOICES, default='skip',
+            help="What to do if the patient already has a reading for that day",
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help="Readings written per transaction",
+        )
+        parser.add_argument(
+            '--patient', type=int,
+            help="Patient id to use for rows without a patient_id column",
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        if not path.exists():
+            raise CommandError(f"File not found: {path}")
+
+        file_format = options['format'] or EXTENSIONS.get(path.suffix.lower())
+        if file_format not in READERS:
+            raise CommandError("Could not tell the file format - use --format")
+
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError("--batch-size must be at least 1")
+
+        totals = {'read': 0, 'invalid': 0, 'created': 0, 'updated': 0, 'skipped': 0, 'unknown_patient': 0}
+        started = time.perf_counter()
+        batch = []
+        # Summaries and anomaly replays are collected over all batches and done once per patient
+        pending = pending_changes()
+
+        try:
+            with path.open(newline='', encoding='utf-8-sig') as handle:
+                for row_number, row in enumerate(READERS[file_format](handle), start=1):
+                    totals['read'] += 1
+                    try:
+                        if not isinstance(row, dict):
+                            raise ValueError("row is not an object")
+                        batch.append(parse_reading(row, default_patient_id=options['patient']))
+                    except ValueError as error:
+                        totals['invalid'] += 1
+                        if options['verbosity'] >= 2:
+                            self.stderr.write(f"Row {row_number}: {error}")
+
+                    if len(batch) >= batch_size:
+                        self._write(batch, options, totals, started, pending)
+                        batch = []
+
+                if batch:
+                    self._write(batch, options, totals, started, pending)
+        finally:
+            # Also after a failed import: the batches written so far stay
+            if options['verbosity'] >= 1:
+                self.stdout.write(
+                    f"  Updating summaries for {len(pending['patient_ids'])} patients "
+                    f"(rescoring anomalies for {len(pending['rescore'])})"
+                )
+            finish_bulk_writes(pending)
+
+        elapsed = time.perf_counter() - started
+        rate = totals['read'] / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {totals['read']} rows in {elapsed:.1f}s ({rate:,.0f} rows/s): "
+            f"{totals['created']} created, {totals['updated']} updated, "
+            f"{totals['skipped']} skipped, {totals['unknown_patient']} unknown patient, "
+            f"{totals['invalid']} invalid"
+        ))
+
+    def _write(self, batch, options, totals, started, pending):
+        """Write one batch and print progress"""
+        counts = bulk_write_readings(batch, on_conflict=options['on_conflict'], pending=pending)
+        for key, value in counts.items():
+            totals[key] += value
+
+        if options['verbosity'] >= 1:
+            elapsed = time.perf_counter() - started
+            rate = totals['read'] / elapsed if elapsed else 0
+            self.stdout.write(f"  {totals['read']} rows processed ({rate:,.0f} rows/s)")
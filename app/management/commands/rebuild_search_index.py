@@ -0,0 +1,29 @@
+"""
+Recreate the full-text search index over patient names and reading notes
+
+Examples:
+    python manage.py rebuild_search_index
+
+The index is kept in sync by SQL triggers, so this is only needed to
+repair it (for example after restoring a database copied without them).
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.search import install_search_index, is_enabled, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Recreate the FTS5 search index over patient names and reading notes"
+
+    def handle(self, *args, **options):
+        if not is_enabled():
+            raise CommandError("Full-text search needs SQLite (FTS5); other databases use plain LIKE searches")
+
+        started = time.perf_counter()
+        # Put back any missing table or trigger (this re-fills the index), otherwise just re-fill it
+        if not install_search_index():
+            rebuild_search_index()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Search index rebuilt in {elapsed:.2f}s"))
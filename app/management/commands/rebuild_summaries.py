@@ -0,0 +1,31 @@
+"""
+Recompute per-patient summaries (PatientSummary) from raw readings
+
+Examples:
+    python manage.py rebuild_summaries
+    python manage.py rebuild_summaries --patient 12 --patient 40
+
+Run once after migrating, and daily (e.g. from cron) so the 7/30/90-day
+windows of patients without new readings move forward with the calendar.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from app.summaries import rebuild_summaries
+
+
+class Command(BaseCommand):
+    help = "Recompute per-patient glycemic summaries from their readings"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--patient', type=int, action='append', dest='patients',
+            help="Only rebuild this patient's summary (can be repeated)",
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        written = rebuild_summaries(options['patients'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} summaries in {elapsed:.1f}s"))
@@ -0,0 +1,286 @@
+"""
+Request metrics kept in memory and served at /metrics (Prometheus text format)
+
+MetricsMiddleware records every request under its URL name (for example
+"app:dashboard" or "admin:index"):
+
+    caretrack_request_duration_seconds   whole request, including other middleware
+    caretrack_requests_total             responses by method and status code
+    caretrack_sql_queries                SQL queries run by the request
+    caretrack_sql_duration_seconds       time spent in those queries
+    caretrack_template_render_seconds    time spent rendering templates
+
+Code that is worth watching on its own is wrapped with timed(), e.g. chart
+data and diet plan building.
+
+Histograms are fixed bucket counters behind one lock, so recording a value
+is a bisect and a few additions - cheap enough for every request. Values
+live in each worker process and start from zero when it restarts; with
+several workers, each scrape shows the worker that answered it.
+"""
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+from functools import wraps
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from django.http import HttpResponse
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template
+from django.views.decorators.http import require_GET
+
+# Upper bounds of the histogram buckets
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+# Every metric: name -> (type, help text, histogram buckets)
+METRICS = {
+    'caretrack_request_duration_seconds': ('histogram', 'Time to answer a request', SECONDS_BUCKETS),
+    'caretrack_requests_total': ('counter', 'Responses sent', None),
+    'caretrack_sql_queries': ('histogram', 'SQL queries per request', QUERY_BUCKETS),
+    'caretrack_sql_duration_seconds': ('histogram', 'Time spent in SQL per request', SECONDS_BUCKETS),
+    'caretrack_template_render_seconds': ('histogram', 'Time spent rendering templates per request', SECONDS_BUCKETS),
+    'caretrack_chart_build_seconds': ('histogram', 'Time to build chart data', SECONDS_BUCKETS),
+    'caretrack_diet_plan_seconds': ('histogram', 'Time to build or look up a diet plan', SECONDS_BUCKETS),
+}
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram:
+    """Counts of observed values per bucket, plus their sum"""
+
+    __slots__ = ('buckets', 'counts', 'sum')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last one is +Inf
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+# (metric name, sorted label pairs) -> Histogram or counter value
+_values = {}
+_lock = threading.Lock()
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+
+def _observe(key, value):
+    with _lock:
+        histogram = _values.get(key)
+        if histogram is None:
+            histogram = _values[key] = Histogram(METRICS[key[0]][2])
+        histogram.observe(value)
+
+
+def observe(name, value, **labels):
+    """Add a value to a histogram"""
+    _observe(_key(name, labels), value)
+
+
+def increment(name, amount=1, **labels):
+    """Add to a counter"""
+    key = _key(name, labels)
+    with _lock:
+        _values[key] = _values.get(key, 0) + amount
+
+
+def timed(name, **labels):
+    """Decorator: record how long each call takes in histogram `name`"""
+    key = _key(name, labels)  # worked out once, not on every call
+
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            started = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                _observe(key, perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+def reset():
+    """Forget everything recorded so far (this process only)"""
+    with _lock:
+        _values.clear()
+
+
+# Per-request totals. A context variable follows the request into
+# sync_to_async threads, so async views are counted too.
+class RequestStats:
+    __slots__ = ('queries', 'sql_seconds', 'templates', 'template_seconds')
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.templates = 0
+        self.template_seconds = 0.0
+
+
+_current = ContextVar('caretrack_request_stats', default=None)
+
+
+def record_queries(execute, sql, params, many, context):
+    """Database execute wrapper: count and time queries for the current request"""
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.sql_seconds += perf_counter() - started
+
+
+def install_query_recorder(connection):
+    """Add record_queries to a database connection (once - connections can reconnect)"""
+    if record_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_queries)
+
+
+class TimedTemplate(Template):
+    """Django template that adds its render time to the current request"""
+
+    def render(self, context=None, request=None):
+        started = perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats = _current.get()
+            if stats is not None:
+                stats.templates += 1
+                stats.template_seconds += perf_counter() - started
+
+
+class InstrumentedTemplates(DjangoTemplates):
+    """The normal Django template backend, with render times recorded (see TEMPLATES)"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            # Same error as DjangoTemplates raises: names this backend, keeps the debug page details
+            error = TemplateDoesNotExist(*exc.args, tried=exc.tried, backend=self, chain=exc.chain)
+            if hasattr(exc, 'template_debug'):
+                error.template_debug = exc.template_debug
+            raise error from exc
+
+
+class MetricsMiddleware:
+    """Record latency, SQL and template time for every request (put it first in MIDDLEWARE)"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, response, stats, perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, response, stats, perf_counter() - started)
+        return response
+
+    def record(self, request, response, stats, seconds):
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        observe('caretrack_request_duration_seconds', seconds, view=view)
+        increment('caretrack_requests_total', view=view, method=request.method,
+                  status=str(response.status_code))
+        observe('caretrack_sql_queries', stats.queries, view=view)
+        observe('caretrack_sql_duration_seconds', stats.sql_seconds, view=view)
+        if stats.templates:
+            observe('caretrack_template_render_seconds', stats.template_seconds, view=view)
+
+
+def _label_text(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_metrics():
+    """Everything recorded in this process, in Prometheus text exposition format"""
+    with _lock:
+        snapshot = [
+            (name, labels, (list(value.counts), value.sum) if isinstance(value, Histogram) else value)
+            for (name, labels), value in _values.items()
+        ]
+
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        series = sorted((labels, value) for metric, labels, value in snapshot if metric == name)
+        if not series:
+            continue
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in series:
+            if kind == 'counter':
+                lines.append(f'{name}{_label_text(labels)} {value}')
+                continue
+            counts, total = value
+            cumulative = 0
+            for bound, count in zip(list(buckets) + ['+Inf'], counts):
+                cumulative += count
+                le = bound if bound == '+Inf' else _number(bound)
+                lines.append(f'{name}_bucket{_label_text(labels, [("le", le)])} {cumulative}')
+            lines.append(f'{name}_sum{_label_text(labels)} {_number(total)}')
+            lines.append(f'{name}_count{_label_text(labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+@require_GET
+def metrics_view(request):
+    """GET /metrics - scraped by Prometheus"""
+    from .chart_cache import cache_stats  # chart cache hit/miss counters, kept by chart_cache
+
+    chart_stats = cache_stats()
+    chart_lines = []
+    for counter in ('hits', 'misses', 'invalidations'):
+        chart_lines += [
+            f'# HELP caretrack_chart_cache_{counter}_total Chart cache {counter}',
+            f'# TYPE caretrack_chart_cache_{counter}_total counter',
+            f'caretrack_chart_cache_{counter}_total {chart_stats[counter]}',
+        ]
+    return HttpResponse(render_metrics() + '\n'.join(chart_lines) + '\n', content_type=CONTENT_TYPE)
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.30 on 2026-10-17 21:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='healthdata',
+            index=models.Index(fields=['patient', '-test_date'], name='health_patient_test_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['-created_at'], name='patient_created_at_idx'),
+        ),
+        # The unique (patient, reading_date) index already starts with patient, so the
+        # foreign key index is dropped. Only the index goes: altering the field in the
+        # database would make SQLite copy the whole table.
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    'DROP INDEX "app_sugarreading_patient_id_95eed9d4"',
+                    reverse_sql='CREATE INDEX "app_sugarreading_patient_id_95eed9d4" ON "app_sugarreading" ("patient_id")',
+                ),
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='sugarreading',
+                    name='patient',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='sugar_readings', to='app.patient'),
+                ),
+            ],
+        ),
+    ]
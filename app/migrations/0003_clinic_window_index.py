@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-17 21:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0002_access_pattern_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sugarreading',
+            index=models.Index(fields=['reading_date', 'patient', 'sugar_before_breakfast', 'sugar_after_breakfast'], name='sugar_date_values_idx'),
+        ),
+    ]
@@ -0,0 +1,115 @@
+# Generated by Django 4.2.30 on 2026-10-17 21:08
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import Avg, Count, Max, Min, OuterRef, Q, Subquery
+from django.utils import timezone
+import django.db.models.deletion
+
+# Copied from the app as it was when this migration was written, so later
+# changes there cannot break it (mg/dL; rolling windows in days)
+FASTING_LOW = 70
+FASTING_HIGH = 100
+POSTMEAL_HIGH = 140
+SUMMARY_WINDOWS = (7, 30, 90)
+
+
+def _fasting_status(value):
+    return 'Low' if value < FASTING_LOW else 'Normal' if value <= FASTING_HIGH else 'High'
+
+
+def _postmeal_status(value):
+    return 'Normal' if value < POSTMEAL_HIGH else 'High'
+
+
+def build_summaries(apps, schema_editor):
+    """
+    Fill the new table from existing readings, so lists are right straight after migrating
+
+    Uses historical models only (two grouped queries and a bulk insert). The
+    rebuild_summaries command recomputes every summary with the current code.
+    """
+    Patient = apps.get_model('app', 'Patient')
+    PatientSummary = apps.get_model('app', 'PatientSummary')
+    SugarReading = apps.get_model('app', 'SugarReading')
+    today = timezone.localdate()
+
+    windows = {}
+    for days in SUMMARY_WINDOWS:
+        in_window = Q(reading_date__gte=today - timedelta(days=days - 1))
+        windows[f'avg_fasting_{days}d'] = Avg('sugar_before_breakfast', filter=in_window)
+        windows[f'avg_postmeal_{days}d'] = Avg('sugar_after_breakfast', filter=in_window)
+    stats = {
+        row.pop('patient_id'): row
+        for row in SugarReading.objects.order_by().values('patient_id').annotate(
+            reading_count=Count('id'),
+            min_fasting=Min('sugar_before_breakfast'),
+            max_fasting=Max('sugar_before_breakfast'),
+            min_postmeal=Min('sugar_after_breakfast'),
+            max_postmeal=Max('sugar_after_breakfast'),
+            last_reading_date=Max('reading_date'),
+            **windows,
+        )
+    }
+    newest = SugarReading.objects.filter(patient_id=OuterRef('patient_id')).order_by('-reading_date')
+    latest = {
+        patient_id: (fasting, postmeal)
+        for patient_id, fasting, postmeal in SugarReading.objects.filter(
+            reading_date=Subquery(newest.values('reading_date')[:1])
+        ).values_list('patient_id', 'sugar_before_breakfast', 'sugar_after_breakfast')
+    }
+
+    summaries = []
+    for patient_id in Patient.objects.values_list('pk', flat=True):
+        summary = PatientSummary(patient_id=patient_id, windows_as_of=today, **stats.get(patient_id, {}))
+        if patient_id in latest:
+            summary.last_fasting, summary.last_postmeal = latest[patient_id]
+            summary.last_fasting_status = _fasting_status(summary.last_fasting)
+            summary.last_postmeal_status = _postmeal_status(summary.last_postmeal)
+        if summary.avg_fasting_90d is not None:
+            # ADAG estimate from the 90 day mean of both values
+            mean = (summary.avg_fasting_90d + summary.avg_postmeal_90d) / 2
+            summary.estimated_hba1c = round((mean + 46.7) / 28.7, 1)
+        summaries.append(summary)
+    PatientSummary.objects.bulk_create(summaries, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0003_clinic_window_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatientSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reading_count', models.PositiveIntegerField(default=0)),
+                ('avg_fasting_7d', models.FloatField(blank=True, null=True)),
+                ('avg_postmeal_7d', models.FloatField(blank=True, null=True)),
+                ('avg_fasting_30d', models.FloatField(blank=True, null=True)),
+                ('avg_postmeal_30d', models.FloatField(blank=True, null=True)),
+                ('avg_fasting_90d', models.FloatField(blank=True, null=True)),
+                ('avg_postmeal_90d', models.FloatField(blank=True, null=True)),
+                ('min_fasting', models.PositiveIntegerField(blank=True, null=True)),
+                ('max_fasting', models.PositiveIntegerField(blank=True, null=True)),
+                ('min_postmeal', models.PositiveIntegerField(blank=True, null=True)),
+                ('max_postmeal', models.PositiveIntegerField(blank=True, null=True)),
+                ('last_reading_date', models.DateField(blank=True, db_index=True, null=True)),
+                ('last_fasting', models.PositiveIntegerField(blank=True, null=True)),
+                ('last_postmeal', models.PositiveIntegerField(blank=True, null=True)),
+                ('last_fasting_status', models.CharField(blank=True, max_length=10)),
+                ('last_postmeal_status', models.CharField(blank=True, max_length=10)),
+                ('estimated_hba1c', models.FloatField(blank=True, help_text='Estimated HbA1c (%) from the 90-day average sugar level', null=True)),
+                ('windows_as_of', models.DateField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('patient', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='summary', to='app.patient')),
+            ],
+            options={
+                'verbose_name_plural': 'patient summaries',
+            },
+        ),
+        migrations.RunPython(build_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.2.30 on 2026-10-17 21:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_patient_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='baseline_fasting_mean',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='baseline_fasting_var',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='baseline_postmeal_mean',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='baseline_postmeal_var',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='baseline_readings',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='sugarreading',
+            name='anomaly_score',
+            field=models.FloatField(blank=True, help_text="How many standard deviations the reading was from the patient's baseline", null=True),
+        ),
+        migrations.AddField(
+            model_name='sugarreading',
+            name='is_anomaly',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='sugarreading',
+            index=models.Index(condition=models.Q(('is_anomaly', True)), fields=['patient', '-reading_date'], name='sugar_anomaly_idx'),
+        ),
+    ]
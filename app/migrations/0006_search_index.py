@@ -0,0 +1,23 @@
+from django.db import migrations
+
+from app.search import drop_search_index, install_search_index
+
+
+def create_index(apps, schema_editor):
+    install_search_index(schema_editor.connection)
+
+
+def remove_index(apps, schema_editor):
+    drop_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_reading_anomalies'),
+    ]
+
+    operations = [
+        # SQLite FTS5 tables and sync triggers (see app/search.py); no-op on other databases
+        migrations.RunPython(create_index, remove_index),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-17 21:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='healthdata',
+            index=models.Index(fields=['test_date'], name='health_test_date_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-17 22:10
+
+from django.db import migrations, models
+from django.db.models import F
+import django.utils.timezone
+
+
+def copy_created_at(apps, schema_editor):
+    """Start existing rows at created_at (earlier edits were not recorded)"""
+    HealthData = apps.get_model('app', 'HealthData')
+    HealthData.objects.update(updated_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0007_admin_date_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='healthdata',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copy_created_at, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,67 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Avg, Case, Count, Max, Min, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
+from datetime import timedelta
+
+# Normal sugar ranges (mg/dL) used to classify readings
+# Fasting (before breakfast) normal range: 70-100 mg/dL
+# Post-meal (after breakfast) normal range: Less than 140 mg/dL
+FASTING_LOW = 70
+FASTING_HIGH = 100
+POSTMEAL_HIGH = 140
+
+
+def fasting_status_expression(field='sugar_before_breakfast'):
+    """SQL CASE expression giving 'Low', 'Normal' or 'High' (NULL if no value) for a fasting value"""
+    return Case(
+        When(**{f'{field}__lt': FASTING_LOW}, then=Value('Low')),
+        When(**{f'{field}__lte': FASTING_HIGH}, then=Value('Normal')),
+        When(**{f'{field}__gt': FASTING_HIGH}, then=Value('High')),
+        default=None,
+        output_field=models.CharField(),
+    )
+
+
+def postmeal_status_expression(field='sugar_after_breakfast'):
+    """SQL CASE expression giving 'Normal' or 'High' (NULL if no value) for a post-meal value"""
+    return Case(
+        When(**{f'{field}__lt': POSTMEAL_HIGH}, then=Value('Normal')),
+        When(**{f'{field}__gte': POSTMEAL_HIGH}, then=Value('High')),
+        default=None,
+        output_field=models.CharField(),
+    )
+
+
+class PatientQuerySet(models.QuerySet):
+    """Extra queryset methods for patients"""
+
+    def with_reading_summary(self):
+        """
+        Add the latest reading, its status and the reading count to each patient
+
+        Everything is done with subqueries, so listing any number of patients
+        stays a single query (no query per patient).
+        """
+        readings = SugarReading.objects.filter(patient=OuterRef('pk'))
+        latest = readings.order_by('-reading_date')
+        return self.annotate(
+            last_reading_date=Subquery(latest.values('reading_date')[:1]),
+            last_fasting=Subquery(latest.values('sugar_before_breakfast')[:1]),
+            last_postmeal=Subquery(latest.values('sugar_after_breakfast')[:1]),
+            reading_count=Coalesce(
+                Subquery(
+                    readings.order_by().values('patient')
+                    .annotate(count=Count('id')).values('count')
+                ),
+                0,
+            ),
+        ).annotate(
+            last_fasting_status=fasting_status_expression('last_fasting'),
+            last_postmeal_status=postmeal_status_expression('last_postmeal'),
+        )
+
 
 # Model 1: Patient Information
 class Patient(models.Model):
@@ -41,6 +102,17 @@ class Patient(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)  # Set once when created
     updated_at = models.DateTimeField(auto_now=True)      # Updates every time we save
     
+    # Running baseline of this patient's sugar levels (exponentially weighted,
+    # updated on every new reading - see app/anomalies.py)
+    baseline_readings = models.PositiveIntegerField(default=0)
+    baseline_fasting_mean = models.FloatField(blank=True, null=True)
+    baseline_fasting_var = models.FloatField(default=0)
+    baseline_postmeal_mean = models.FloatField(blank=True, null=True)
+    baseline_postmeal_var = models.FloatField(default=0)
+    
+    # Custom manager: Patient.objects.with_reading_summary()
+    objects = PatientQuerySet.as_manager()
+    
     def calculate_bmi(self):
         """Calculate BMI: weight(kg) / (height(m))^2"""
         if self.weight and self.height:
@@ -58,6 +130,48 @@ class Patient(models.Model):
     
     class Meta:
         ordering = ['-created_at']  # Newest first
+        indexes = [
+            # Patient list is always ordered newest first
+            models.Index(fields=['-created_at'], name='patient_created_at_idx'),
+        ]
+
+
+class SugarReadingQuerySet(models.QuerySet):
+    """Extra queryset methods for sugar readings"""
+
+    def with_status(self):
+        """Add fasting_status and postmeal_status, calculated by the database"""
+        return self.annotate(
+            fasting_status=fasting_status_expression(),
+            postmeal_status=postmeal_status_expression(),
+        )
+
+    def in_window(self, days):
+        """Only readings from the last `days` days (None means all time)"""
+        if days is None:
+            return self
+        since = timezone.localdate() - timedelta(days=days - 1)
+        return self.filter(reading_date__gte=since)
+
+    @staticmethod
+    def _summary_aggregates():
+        return {
+            'readings_count': Count('id'),
+            'avg_fasting': Avg('sugar_before_breakfast'),
+            'avg_postmeal': Avg('sugar_after_breakfast'),
+            'min_fasting': Min('sugar_before_breakfast'),
+            'max_fasting': Max('sugar_before_breakfast'),
+            'min_postmeal': Min('sugar_after_breakfast'),
+            'max_postmeal': Max('sugar_after_breakfast'),
+        }
+
+    def summary(self):
+        """Count, average, min and max of both sugar levels in one aggregate query"""
+        return self.aggregate(**self._summary_aggregates())
+
+    async def asummary(self):
+        """Async version of summary()"""
+        return await self.aaggregate(**self._summary_aggregates())
 
 
 # Model 2: Sugar Readings
@@ -68,7 +182,8 @@ class SugarReading(models.Model):
     patient = models.ForeignKey(
         Patient,
         on_delete=models.CASCADE,  # If patient deleted, delete all their readings
-        related_name='sugar_readings'
+        related_name='sugar_readings',
+        db_index=False,  # The unique (patient, reading_date) index already starts with patient
     )
     
     # Date of reading
@@ -86,21 +201,41 @@ class SugarReading(models.Model):
     # Optional fields
     notes = models.TextField(blank=True, help_text="Any additional notes")
     
+    # Set when the reading is far from the patient's usual levels (see app/anomalies.py)
+    is_anomaly = models.BooleanField(default=False)
+    anomaly_score = models.FloatField(
+        blank=True,
+        null=True,
+        help_text="How many standard deviations the reading was from the patient's baseline"
+    )
+    
     created_at = models.DateTimeField(auto_now_add=True)
     
+    # Custom manager: SugarReading.objects.with_status()
+    objects = SugarReadingQuerySet.as_manager()
+    
+    def save(self, *args, **kwargs):
+        """Save inside a transaction so the post_save handlers (patient summary) commit with it"""
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+    
     def get_status(self):
         """Determine if sugar levels are normal, high, or low"""
-        # Fasting (before breakfast) normal range: 70-100 mg/dL
-        # Post-meal (after breakfast) normal range: Less than 140 mg/dL
+        # Use the values from with_status() if the database already worked them out
+        if hasattr(self, 'fasting_status') and hasattr(self, 'postmeal_status'):
+            return {
+                'fasting': self.fasting_status,
+                'postmeal': self.postmeal_status
+            }
         
-        if self.sugar_before_breakfast < 70:
+        if self.sugar_before_breakfast < FASTING_LOW:
             fasting_status = "Low"
-        elif 70 <= self.sugar_before_breakfast <= 100:
+        elif FASTING_LOW <= self.sugar_before_breakfast <= FASTING_HIGH:
             fasting_status = "Normal"
         else:
             fasting_status = "High"
         
-        if self.sugar_after_breakfast < 140:
+        if self.sugar_after_breakfast < POSTMEAL_HIGH:
             postmeal_status = "Normal"
         else:
             postmeal_status = "High"
@@ -116,6 +251,22 @@ class SugarReading(models.Model):
     class Meta:
         ordering = ['-reading_date']  # Most recent first
         unique_together = ['patient', 'reading_date']  # One reading per day per patient
+        # "This patient's readings by date" uses the unique (patient, reading_date)
+        # index. Every index here is updated on each insert, so keep the list short
+        # (see benchmarks/index_benchmark.py for read and write timings).
+        indexes = [
+            # Covers clinic-wide queries over a date window (all patients)
+            models.Index(
+                fields=['reading_date', 'patient', 'sugar_before_breakfast', 'sugar_after_breakfast'],
+                name='sugar_date_values_idx',
+            ),
+            # Small partial index: only flagged readings, for "unusual readings" lists
+            models.Index(
+                fields=['patient', '-reading_date'],
+                name='sugar_anomaly_idx',
+                condition=models.Q(is_anomaly=True),
+            ),
+        ]
 
 
 # Model 3: Additional Health Data (Optional)
@@ -159,10 +310,69 @@ class HealthData(models.Model):
     )
     
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)  # Part of the patient pages' ETag
     
     def __str__(self):
         return f"{self.patient.name} - Health Data {self.test_date}"
     
     class Meta:
         ordering = ['-test_date']
+        indexes = [
+            # Latest health data for a patient
+            models.Index(fields=['patient', '-test_date'], name='health_patient_test_date_idx'),
+            # Admin date hierarchy and date filter over all patients
+            models.Index(fields=['test_date'], name='health_test_date_idx'),
+        ]
 # Create your models here.
+
+
+# Model 4: Precomputed Patient Summary
+class PatientSummary(models.Model):
+    """Rolling sugar statistics per patient, kept up to date on every reading change"""
+    
+    patient = models.OneToOneField(
+        Patient,
+        on_delete=models.CASCADE,
+        related_name='summary'
+    )
+    
+    reading_count = models.PositiveIntegerField(default=0)
+    
+    # Rolling averages (mg/dL) over the last 7/30/90 days
+    avg_fasting_7d = models.FloatField(blank=True, null=True)
+    avg_postmeal_7d = models.FloatField(blank=True, null=True)
+    avg_fasting_30d = models.FloatField(blank=True, null=True)
+    avg_postmeal_30d = models.FloatField(blank=True, null=True)
+    avg_fasting_90d = models.FloatField(blank=True, null=True)
+    avg_postmeal_90d = models.FloatField(blank=True, null=True)
+    
+    # All-time lowest/highest values
+    min_fasting = models.PositiveIntegerField(blank=True, null=True)
+    max_fasting = models.PositiveIntegerField(blank=True, null=True)
+    min_postmeal = models.PositiveIntegerField(blank=True, null=True)
+    max_postmeal = models.PositiveIntegerField(blank=True, null=True)
+    
+    # Latest reading and its status
+    last_reading_date = models.DateField(blank=True, null=True, db_index=True)
+    last_fasting = models.PositiveIntegerField(blank=True, null=True)
+    last_postmeal = models.PositiveIntegerField(blank=True, null=True)
+    last_fasting_status = models.CharField(max_length=10, blank=True)
+    last_postmeal_status = models.CharField(max_length=10, blank=True)
+    
+    # Estimated HbA1c (%) from the 90-day average
+    estimated_hba1c = models.FloatField(
+        blank=True,
+        null=True,
+        help_text="Estimated HbA1c (%) from the 90-day average sugar level"
+    )
+    
+    # Day the rolling windows were calculated for
+    windows_as_of = models.DateField(blank=True, null=True)
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Summary for patient {self.patient_id}"
+    
+    class Meta:
+        verbose_name_plural = 'patient summaries'
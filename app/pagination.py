@@ -0,0 +1,173 @@
+"""
+Keyset (cursor) pagination for sugar readings
+
+Readings are ordered newest first on (reading_date, id). Instead of
+OFFSET/LIMIT we remember the last row of a page and ask the database for
+rows "older than" it, so every page costs the same no matter how deep
+the user scrolls.
+
+EstimatedCountPaginator is for page-numbered lists (the admin) over very
+large tables, where an exact COUNT(*) on every page view costs more than
+the page itself.
+"""
+from datetime import date
+
+from django.core.paginator import Paginator
+from django.db.models import Max, Min, Q
+from django.utils.functional import cached_property
+
+# How many readings to show on one history page
+PAGE_SIZE = 50
+
+# Above this many rows EstimatedCountPaginator estimates unfiltered lists
+ESTIMATE_COUNT_THRESHOLD = 10000
+
+
+def encode_cursor(reading):
+    """Turn a reading into a cursor string like '2024-05-01.123'"""
+    return f"{reading.reading_date.isoformat()}.{reading.pk}"
+
+
+def decode_cursor(value):
+    """Turn a cursor string back into (reading_date, id), or None if invalid"""
+    if not value:
+        return None
+    try:
+        date_part, id_part = value.split('.', 1)
+        return date.fromisoformat(date_part), int(id_part)
+    except ValueError:
+        return None
+
+
+class KeysetPage:
+    """One page of readings plus the cursors needed to move around"""
+
+    def __init__(self, object_list, next_cursor, previous_cursor, start_index, per_page):
+        self.object_list = object_list
+        self.next_cursor = next_cursor          # Cursor for older readings
+        self.previous_cursor = previous_cursor  # Cursor for newer readings
+        self.start_index = start_index          # Row number of the first reading
+        self.per_page = per_page
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    @property
+    def end_index(self):
+        return self.start_index + len(self.object_list) - 1
+
+    @property
+    def next_start(self):
+        return self.end_index + 1
+
+    @property
+    def previous_start(self):
+        return max(self.start_index - self.per_page, 1)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def _page_query(queryset, after_key, before_key, per_page):
+    """Queryset for one page (plus one extra row) and whether it walks backwards"""
+    if before_key:
+        # Walk backwards: fetch the nearest newer rows, then flip them
+        reading_date, pk = before_key
+        return queryset.filter(
+            Q(reading_date__gt=reading_date) | Q(reading_date=reading_date, pk__gt=pk)
+        ).order_by('reading_date', 'id')[:per_page + 1], True
+
+    if after_key:
+        reading_date, pk = after_key
+        queryset = queryset.filter(
+            Q(reading_date__lt=reading_date) | Q(reading_date=reading_date, pk__lt=pk)
+        )
+    # Fetch one extra row to know if there is another page
+    return queryset.order_by('-reading_date', '-id')[:per_page + 1], False
+
+
+def _build_page(rows, backwards, after_key, start, per_page):
+    """KeysetPage from fetched rows (None if a backwards walk found nothing)"""
+    if backwards:
+        has_newer = len(rows) > per_page
+        rows = rows[:per_page]
+        rows.reverse()
+        has_older = True
+        if not rows:
+            return None
+    else:
+        has_older = len(rows) > per_page
+        rows = rows[:per_page]
+        has_newer = after_key is not None
+
+    # Back on the newest page, numbering always restarts at 1
+    start = max(start, 1) if has_newer else 1
+    next_cursor = encode_cursor(rows[-1]) if rows and has_older else None
+    previous_cursor = encode_cursor(rows[0]) if rows and has_newer else None
+
+    return KeysetPage(rows, next_cursor, previous_cursor, start, per_page)
+
+
+def paginate_readings(queryset, after=None, before=None, start=1, per_page=PAGE_SIZE):
+    """
+    Return a KeysetPage of readings ordered newest first
+
+    Args:
+        queryset: SugarReading queryset (usually patient.sugar_readings.all())
+        after: cursor - show readings older than this one
+        before: cursor - show readings newer than this one
+        start: row number of the first reading on the page (display only)
+        per_page: readings per page
+    """
+    after_key = decode_cursor(after)
+    page_query, backwards = _page_query(queryset, after_key, decode_cursor(before), per_page)
+    page = _build_page(list(page_query), backwards, after_key, start, per_page)
+    if page is None:
+        # Cursor is newer than everything we have - show the first page
+        return paginate_readings(queryset, per_page=per_page)
+    return page
+
+
+async def apaginate_readings(queryset, after=None, before=None, start=1, per_page=PAGE_SIZE):
+    """Async version of paginate_readings() for async views"""
+    after_key = decode_cursor(after)
+    page_query, backwards = _page_query(queryset, after_key, decode_cursor(before), per_page)
+    page = _build_page([row async for row in page_query], backwards, after_key, start, per_page)
+    if page is None:
+        return await apaginate_readings(queryset, per_page=per_page)
+    return page
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that does not COUNT(*) a whole unfiltered table
+
+    Unfiltered lists are counted exactly up to ESTIMATE_COUNT_THRESHOLD rows
+    (COUNT over a LIMITed subquery); beyond that the count is estimated from
+    the smallest and largest primary key (two index lookups). As soon as a
+    filter, search or date drill-down is active the count is exact, so every
+    page of the narrowed list can be reached.
+    """
+
+    threshold = ESTIMATE_COUNT_THRESHOLD
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not hasattr(queryset, 'query') or queryset.query.where:
+            return super().count
+
+        counted = queryset.order_by()[:self.threshold + 1].count()
+        if counted <= self.threshold:
+            return counted
+
+        bounds = queryset.model._default_manager.aggregate(low=Min('pk'), high=Max('pk'))
+        return max(bounds['high'] - bounds['low'] + 1, counted)
@@ -0,0 +1,197 @@
+"""
+Monthly patient reports as static HTML files
+
+A report covers one patient for one calendar month: every reading, the
+month's statistics (the same metrics as the dashboard), an inline SVG
+chart, the latest lab results and the diet plan for the month's average
+levels. Reports are plain HTML files with no scripts or external files,
+written to
+
+    <output>/<YYYY-MM>/patient_<id>.html
+
+build_reports() renders a whole chunk of patients from four bulk queries
+(the generate_monthly_reports command spreads chunks over worker
+processes). Each file is written under a temporary name and then renamed,
+so an interrupted run never leaves a half-written report and can simply
+be started again.
+"""
+import calendar
+import os
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.safestring import mark_safe
+
+from . import analytics
+from .diet_plans import diet_plan_context
+from .models import FASTING_HIGH, POSTMEAL_HIGH, HealthData, Patient, SugarReading
+
+# Chart size and plot margins (SVG pixels)
+CHART_WIDTH = 720
+CHART_HEIGHT = 240
+CHART_MARGIN = {'left': 40, 'right': 12, 'top': 12, 'bottom': 28}
+
+
+def parse_month(text):
+    """First day of the month given as 'YYYY-MM' (ValueError if invalid)"""
+    year, month = text.split('-')
+    return date(int(year), int(month), 1)
+
+
+def previous_month():
+    """First day of last month (the default report month)"""
+    today = timezone.localdate()
+    return date(today.year - (today.month == 1), (today.month - 2) % 12 + 1, 1)
+
+
+def month_bounds(first):
+    """(first, last) day of the month starting on `first`"""
+    return first, first.replace(day=calendar.monthrange(first.year, first.month)[1])
+
+
+def report_path(output_dir, first, patient_id):
+    return Path(output_dir) / first.strftime('%Y-%m') / f'patient_{patient_id}.html'
+
+
+def patients_with_readings(first, patient_ids=None):
+    """Ids of patients with at least one reading in the month, in order"""
+    readings = SugarReading.objects.filter(reading_date__range=month_bounds(first))
+    if patient_ids is not None:
+        readings = readings.filter(patient_id__in=list(patient_ids))
+    return list(readings.order_by('patient_id').values_list('patient_id', flat=True).distinct())
+
+
+def svg_chart(first, readings):
+    """Line chart of fasting and post-meal levels over the month, as inline SVG"""
+    last_day = month_bounds(first)[1].day
+    values = [row['sugar_before_breakfast'] for row in readings] + [row['sugar_after_breakfast'] for row in readings]
+    low = 40
+    high = max(250, -(-(max(values) + 10) // 50) * 50)  # round up to a multiple of 50
+
+    left, top = CHART_MARGIN['left'], CHART_MARGIN['top']
+    plot_width = CHART_WIDTH - left - CHART_MARGIN['right']
+    plot_height = CHART_HEIGHT - top - CHART_MARGIN['bottom']
+
+    def x(day):
+        return left + (day - 1) / max(last_day - 1, 1) * plot_width
+
+    def y(value):
+        return top + (high - min(max(value, low), high)) / (high - low) * plot_height
+
+    def line(field, color):
+        points = ' '.join(f"{x(row['reading_date'].day):.1f},{y(row[field]):.1f}" for row in readings)
+        dots = ''.join(f'<circle cx="{x(row["reading_date"].day):.1f}" cy="{y(row[field]):.1f}" r="2.5" fill="{color}"/>'
+                       for row in readings)
+        return f'<polyline points="{points}" fill="none" stroke="{color}" stroke-width="2"/>{dots}'
+
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{CHART_WIDTH}" height="{CHART_HEIGHT}" '
+             f'viewBox="0 0 {CHART_WIDTH} {CHART_HEIGHT}" font-family="sans-serif" font-size="10">']
+    for value in range(50, high + 1, 50):
+        parts.append(f'<line x1="{left}" y1="{y(value):.1f}" x2="{left + plot_width}" y2="{y(value):.1f}" stroke="#eee"/>'
+                     f'<text x="{left - 6}" y="{y(value) + 3:.1f}" text-anchor="end" fill="#666">{value}</text>')
+    for value, color in ((FASTING_HIGH, 'green'), (POSTMEAL_HIGH, 'orange')):
+        parts.append(f'<line x1="{left}" y1="{y(value):.1f}" x2="{left + plot_width}" y2="{y(value):.1f}" '
+                     f'stroke="{color}" stroke-dasharray="4 3"/>')
+    for day in sorted({1, 8, 15, 22, last_day}):
+        parts.append(f'<text x="{x(day):.1f}" y="{CHART_HEIGHT - 10}" text-anchor="middle" fill="#666">'
+                     f'{first.replace(day=day):%d %b}</text>')
+    parts.append(line('sugar_before_breakfast', 'blue'))
+    parts.append(line('sugar_after_breakfast', 'red'))
+    parts.append('</svg>')
+    return mark_safe(''.join(parts))
+
+
+def _month_status(readings):
+    """(status, unsaved reading) for the month's average levels - picks the diet plan"""
+    average = SugarReading(
+        sugar_before_breakfast=round(sum(row['sugar_before_breakfast'] for row in readings) / len(readings)),
+        sugar_after_breakfast=round(sum(row['sugar_after_breakfast'] for row in readings) / len(readings)),
+    )
+    return average.get_status(), average
+
+
+def build_reports(patient_ids, first):
+    """
+    Render the month's report for each patient, yielding (patient_id, html)
+
+    All data for the chunk comes from four queries: patients, readings,
+    metrics (analytics.batch_metrics) and latest lab results.
+    Patients without readings in the month are skipped.
+    """
+    bounds = month_bounds(first)
+    patients = Patient.objects.filter(pk__in=patient_ids).in_bulk()
+
+    readings = {}
+    rows = (
+        SugarReading.objects.filter(patient_id__in=patient_ids, reading_date__range=bounds)
+        .with_status().order_by('patient_id', 'reading_date')
+        .values('patient_id', 'reading_date', 'sugar_before_breakfast', 'sugar_after_breakfast',
+                'fasting_status', 'postmeal_status', 'is_anomaly', 'notes')
+    )
+    for row in rows:
+        readings.setdefault(row['patient_id'], []).append(row)
+
+    metrics = analytics.batch_metrics(patient_ids, between=bounds)
+
+    # Latest lab results up to the end of the month (a few rows per patient)
+    health = {}
+    for record in (HealthData.objects.filter(patient_id__in=patient_ids, test_date__lte=bounds[1])
+                   .order_by('patient_id', '-test_date')):
+        health.setdefault(record.patient_id, record)
+
+    generated = timezone.now()
+    for patient_id in patient_ids:
+        patient_readings = readings.get(patient_id)
+        if not patient_readings:
+            continue
+        patient = patients[patient_id]
+        status, average = _month_status(patient_readings)
+        context = {
+            'patient': patient,
+            'month': first,
+            'last_day': bounds[1],
+            'readings': patient_readings,
+            'days_with_readings': len(patient_readings),
+            'unusual_count': sum(row['is_anomaly'] for row in patient_readings),
+            'average': average,
+            'status': status,
+            'metrics': metrics.get(patient_id),
+            'chart': svg_chart(first, patient_readings),
+            'health': health.get(patient_id),
+            'generated': generated,
+            **diet_plan_context(status, patient),
+        }
+        yield patient_id, render_to_string('app/monthly_report.html', context)
+
+
+def write_report(path, html):
+    """Write a report atomically (temporary file in the same folder, then rename)"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    handle, temporary = tempfile.mkstemp(dir=path.parent, prefix='.', suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'w', encoding='utf-8') as file:
+            file.write(html)
+        os.chmod(temporary, 0o644)  # mkstemp files are private to the owner
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def render_chunk(patient_ids, first, output_dir):
+    """
+    Build and write the reports for a chunk of patients (runs in a worker process)
+
+    Returns a dict with the worker's pid, reports written, bytes and seconds.
+    """
+    started = time.perf_counter()
+    written = size = 0
+    for patient_id, html in build_reports(patient_ids, first):
+        write_report(report_path(output_dir, first, patient_id), html)
+        written += 1
+        size += len(html)
+    return {'pid': os.getpid(), 'reports': written, 'bytes': size, 'seconds': time.perf_counter() - started}
@@ -0,0 +1,157 @@
+"""
+Full-text search over patient names and reading notes (SQLite FTS5)
+
+Two FTS5 tables index the existing columns without copying them
+("external content" tables):
+
+    app_patient_fts   -> app_patient.name
+    app_reading_fts   -> app_sugarreading.notes
+
+SQL triggers keep them in step with every insert, update and delete,
+including bulk_create, queryset.update() and cascading deletes, which
+skip Django signals. SQLite drops triggers when a migration rebuilds a
+table, so install_search_index() runs again after every migrate and puts
+back (and re-fills) anything that is missing.
+
+Searches are turned into prefix queries ("ali smi" finds "Alice Smith")
+and used as id subqueries, so they combine with any other filter or
+ordering. On other databases the helpers fall back to icontains.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import SugarReading
+
+# FTS table -> (table it indexes, indexed column)
+SEARCH_TABLES = {
+    'app_patient_fts': ('app_patient', 'name'),
+    'app_reading_fts': ('app_sugarreading', 'notes'),
+}
+
+# Case and accent insensitive words, with prefix indexes for 2 and 3 letter prefixes
+FTS_OPTIONS = "tokenize='unicode61 remove_diacritics 2', prefix='2 3'"
+
+PATIENT_IDS_SQL = 'SELECT rowid FROM app_patient_fts WHERE app_patient_fts MATCH %s'
+READING_IDS_SQL = 'SELECT rowid FROM app_reading_fts WHERE app_reading_fts MATCH %s'
+READING_PATIENT_IDS_SQL = (
+    'SELECT r.patient_id FROM app_reading_fts f '
+    'JOIN app_sugarreading r ON r.id = f.rowid WHERE app_reading_fts MATCH %s'
+)
+
+
+def _trigger_sql(fts, table, column):
+    """CREATE TRIGGER statements that mirror changes to `table` into `fts`"""
+    delete_old = f"INSERT INTO {fts}({fts}, rowid, {column}) VALUES ('delete', old.id, old.{column});"
+    insert_new = f"INSERT INTO {fts}(rowid, {column}) VALUES (new.id, new.{column});"
+    return {
+        f'{fts}_insert': f"CREATE TRIGGER {fts}_insert AFTER INSERT ON {table} BEGIN {insert_new} END",
+        f'{fts}_delete': f"CREATE TRIGGER {fts}_delete AFTER DELETE ON {table} BEGIN {delete_old} END",
+        f'{fts}_update': (
+            f"CREATE TRIGGER {fts}_update AFTER UPDATE OF {column} ON {table} "
+            f"BEGIN {delete_old} {insert_new} END"
+        ),
+    }
+
+
+def is_enabled(conn=connection):
+    """FTS5 search is only used on SQLite"""
+    return conn.vendor == 'sqlite'
+
+
+def install_search_index(conn=connection):
+    """
+    Create the FTS tables and triggers if any are missing, then re-fill them
+
+    Safe to call repeatedly - when everything is in place it only reads
+    sqlite_master. Returns True if anything had to be (re)created.
+    """
+    if not is_enabled(conn):
+        return False
+
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")
+        existing = {row[0] for row in cursor.fetchall()}
+
+        changed = False
+        for fts, (table, column) in SEARCH_TABLES.items():
+            if table not in existing:
+                continue
+            if fts not in existing:
+                cursor.execute(
+                    f"CREATE VIRTUAL TABLE {fts} USING fts5({column}, "
+                    f"content='{table}', content_rowid='id', {FTS_OPTIONS})"
+                )
+                changed = True
+            for name, sql in _trigger_sql(fts, table, column).items():
+                if name not in existing:
+                    cursor.execute(sql)
+                    changed = True
+
+    if changed:
+        rebuild_search_index(conn)
+    return changed
+
+
+def rebuild_search_index(conn=connection):
+    """Re-fill the FTS tables from app_patient and app_sugarreading"""
+    if not is_enabled(conn):
+        return
+    with conn.cursor() as cursor:
+        for fts in SEARCH_TABLES:
+            cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def drop_search_index(conn=connection):
+    """Remove the FTS tables and triggers"""
+    if not is_enabled(conn):
+        return
+    with conn.cursor() as cursor:
+        for fts, (table, column) in SEARCH_TABLES.items():
+            for name in _trigger_sql(fts, table, column):
+                cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+            cursor.execute(f"DROP TABLE IF EXISTS {fts}")
+
+
+def match_expression(text):
+    """
+    FTS5 query for what the user typed: every word must match as a prefix
+
+    Returns None if `text` has no searchable words. Words are quoted, so
+    FTS5 operators typed by the user are treated as plain text.
+    """
+    words = re.findall(r'\w+', text)
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def patients_matching(text, include_notes=True):
+    """Q() for patients whose name - or, optionally, any reading note - matches `text`"""
+    if not is_enabled():
+        found = Q(name__icontains=text)
+        if include_notes:
+            found |= Q(pk__in=SugarReading.objects.filter(notes__icontains=text).values('patient_id'))
+        return found
+
+    expression = match_expression(text)
+    if expression is None:
+        return Q(pk__in=[])
+    found = Q(pk__in=RawSQL(PATIENT_IDS_SQL, [expression]))
+    if include_notes:
+        found |= Q(pk__in=RawSQL(READING_PATIENT_IDS_SQL, [expression]))
+    return found
+
+
+def readings_matching(text):
+    """Q() for readings whose note or patient's name matches `text`"""
+    if not is_enabled():
+        return Q(notes__icontains=text) | Q(patient__name__icontains=text)
+
+    expression = match_expression(text)
+    if expression is None:
+        return Q(pk__in=[])
+    return Q(pk__in=RawSQL(READING_IDS_SQL, [expression])) | Q(patient_id__in=RawSQL(PATIENT_IDS_SQL, [expression]))
+
@@ -0,0 +1,65 @@
+"""
+Signal handlers that keep derived data in step with sugar readings
+"""
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_save
+from django.dispatch import receiver
+
+from . import anomalies, chart_cache, metrics, search, summaries
+from .models import Patient, SugarReading
+
+
+@receiver(pre_save, sender=SugarReading)
+def reading_scored(sender, instance, raw=False, **kwargs):
+    """Compare a new reading with the patient's baseline before it is inserted"""
+    if raw or not instance._state.adding:
+        return
+    anomalies.score_new_reading(instance)
+
+
+@receiver(post_save, sender=SugarReading)
+@receiver(post_delete, sender=SugarReading)
+def reading_changed(sender, instance, **kwargs):
+    """A reading was added, edited or deleted - drop the patient's cached charts"""
+    chart_cache.invalidate(instance.patient_id)
+
+
+@receiver(post_save, sender=SugarReading)
+def reading_saved(sender, instance, created, raw=False, **kwargs):
+    """Update the patient's summary (runs inside SugarReading.save's transaction)"""
+    if raw:
+        return
+    summaries.reading_saved(instance, created)
+
+
+@receiver(post_delete, sender=SugarReading)
+def reading_deleted(sender, instance, origin=None, **kwargs):
+    """Update the patient's summary, unless the whole patient is being deleted"""
+    if isinstance(origin, Patient):
+        return
+    summaries.reading_deleted(instance)
+
+
+@receiver(post_migrate)
+def search_index_installed(sender, using, **kwargs):
+    """Put back search triggers a migration may have dropped (SQLite table rebuilds)"""
+    if sender.name == 'app':
+        search.install_search_index(connections[using])
+
+
+@receiver(connection_created)
+def sqlite_tuned(sender, connection, **kwargs):
+    """Apply the SQLite PRAGMAs of the current database profile to a new connection"""
+    if connection.vendor != 'sqlite' or not settings.SQLITE_PRAGMAS:
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+@receiver(connection_created)
+def queries_recorded(sender, connection, **kwargs):
+    """Count and time this connection's queries for /metrics"""
+    metrics.install_query_recorder(connection)
@@ -0,0 +1,266 @@
+"""
+Incrementally maintained per-patient summaries (PatientSummary)
+
+When a reading is saved or deleted the patient's summary is updated in the
+same transaction:
+
+    - reading_count and all-time min/max are adjusted incrementally
+      (min/max are only re-aggregated when the deleted/edited value could
+      have been the extreme)
+    - the 7/30/90-day averages, estimated HbA1c and latest status are
+      re-aggregated over at most 90 days of indexed rows (one reading per
+      day), so the cost is constant however long the history is
+
+Rolling windows are relative to the day they were calculated
+(windows_as_of). A patient who stops logging gets no new writes, so
+pages that show the windows call refresh_windows() first, which
+recalculates them if they are from an earlier day. rebuild_summaries() -
+and the rebuild_summaries management command - recompute everything from
+raw readings; run it daily to keep admin lists sorted by eHbA1c current,
+or to repair any drift (e.g. after bulk loads).
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Avg, Count, Max, Min, Q
+from django.utils import timezone
+
+from .models import Patient, PatientSummary, SugarReading
+
+# Rolling windows kept in the summary (days)
+SUMMARY_WINDOWS = (7, 30, 90)
+
+# Patients handled per batch by rebuild_summaries()
+REBUILD_CHUNK_SIZE = 500
+
+# Fields that depend on the day the windows were calculated
+WINDOW_FIELDS = [
+    'avg_fasting_7d', 'avg_postmeal_7d',
+    'avg_fasting_30d', 'avg_postmeal_30d',
+    'avg_fasting_90d', 'avg_postmeal_90d',
+    'estimated_hba1c', 'windows_as_of',
+]
+
+SUMMARY_FIELDS = [
+    'reading_count',
+    'avg_fasting_7d', 'avg_postmeal_7d',
+    'avg_fasting_30d', 'avg_postmeal_30d',
+    'avg_fasting_90d', 'avg_postmeal_90d',
+    'min_fasting', 'max_fasting', 'min_postmeal', 'max_postmeal',
+    'last_reading_date', 'last_fasting', 'last_postmeal',
+    'last_fasting_status', 'last_postmeal_status',
+    'estimated_hba1c', 'windows_as_of', 'updated_at',
+]
+
+
+def estimate_hba1c(mean_glucose):
+    """Estimated HbA1c (%) from mean glucose in mg/dL (ADAG: eAG = 28.7 x A1c - 46.7)"""
+    if mean_glucose is None:
+        return None
+    return round((mean_glucose + 46.7) / 28.7, 1)
+
+
+def _window_aggregates(today):
+    """Avg() expressions for every rolling window, to use in one aggregate query"""
+    aggregates = {}
+    for days in SUMMARY_WINDOWS:
+        in_window = Q(reading_date__gte=today - timedelta(days=days - 1))
+        aggregates[f'avg_fasting_{days}d'] = Avg('sugar_before_breakfast', filter=in_window)
+        aggregates[f'avg_postmeal_{days}d'] = Avg('sugar_after_breakfast', filter=in_window)
+    return aggregates
+
+
+def _apply_windows(summary, values, today):
+    """Copy window averages onto the summary and derive the HbA1c estimate"""
+    for days in SUMMARY_WINDOWS:
+        for kind in ('fasting', 'postmeal'):
+            field = f'avg_{kind}_{days}d'
+            setattr(summary, field, values.get(field))
+
+    # Each reading has one fasting and one post-meal value, so the overall mean is their average
+    if summary.avg_fasting_90d is not None:
+        summary.estimated_hba1c = estimate_hba1c((summary.avg_fasting_90d + summary.avg_postmeal_90d) / 2)
+    else:
+        summary.estimated_hba1c = None
+    summary.windows_as_of = today
+
+
+def _refresh_windows(summary, today):
+    """Re-aggregate the rolling windows (bounded to 90 days of rows)"""
+    windows = SugarReading.objects.filter(
+        patient_id=summary.patient_id,
+        reading_date__gte=today - timedelta(days=max(SUMMARY_WINDOWS) - 1),
+    ).aggregate(**_window_aggregates(today))
+    _apply_windows(summary, windows, today)
+
+
+def _refresh_recent(summary):
+    """Re-aggregate the rolling windows and latest reading"""
+    _refresh_windows(summary, timezone.localdate())
+    readings = SugarReading.objects.filter(patient_id=summary.patient_id)
+
+    latest = (
+        readings.with_status().order_by('-reading_date')
+        .values('reading_date', 'sugar_before_breakfast', 'sugar_after_breakfast',
+                'fasting_status', 'postmeal_status').first()
+    )
+    summary.last_reading_date = latest['reading_date'] if latest else None
+    summary.last_fasting = latest['sugar_before_breakfast'] if latest else None
+    summary.last_postmeal = latest['sugar_after_breakfast'] if latest else None
+    summary.last_fasting_status = latest['fasting_status'] if latest else ''
+    summary.last_postmeal_status = latest['postmeal_status'] if latest else ''
+
+
+def _refresh_extremes(summary):
+    """Recompute all-time min/max and count (needed when an extreme value goes away)"""
+    values = SugarReading.objects.filter(patient_id=summary.patient_id).aggregate(
+        reading_count=Count('id'),
+        min_fasting=Min('sugar_before_breakfast'),
+        max_fasting=Max('sugar_before_breakfast'),
+        min_postmeal=Min('sugar_after_breakfast'),
+        max_postmeal=Max('sugar_after_breakfast'),
+    )
+    for field, value in values.items():
+        setattr(summary, field, value)
+
+
+def _lower(current, value):
+    return value if current is None else min(current, value)
+
+
+def _higher(current, value):
+    return value if current is None else max(current, value)
+
+
+def reading_saved(reading, created):
+    """Update the patient's summary after a reading was added or edited"""
+    with transaction.atomic():
+        summary, summary_created = PatientSummary.objects.select_for_update().get_or_create(
+            patient_id=reading.patient_id
+        )
+        if summary_created or not created:
+            # New summary, or an edit that may have moved the min/max either way
+            _refresh_extremes(summary)
+        else:
+            summary.reading_count += 1
+            summary.min_fasting = _lower(summary.min_fasting, reading.sugar_before_breakfast)
+            summary.max_fasting = _higher(summary.max_fasting, reading.sugar_before_breakfast)
+            summary.min_postmeal = _lower(summary.min_postmeal, reading.sugar_after_breakfast)
+            summary.max_postmeal = _higher(summary.max_postmeal, reading.sugar_after_breakfast)
+        _refresh_recent(summary)
+        summary.save()
+
+
+def reading_deleted(reading):
+    """Update the patient's summary after a reading was deleted"""
+    with transaction.atomic():
+        summary = PatientSummary.objects.select_for_update().filter(patient_id=reading.patient_id).first()
+        if summary is None:
+            return
+
+        was_extreme = reading.sugar_before_breakfast in (summary.min_fasting, summary.max_fasting) or \
+            reading.sugar_after_breakfast in (summary.min_postmeal, summary.max_postmeal)
+        if was_extreme:
+            _refresh_extremes(summary)
+        else:
+            summary.reading_count = max(summary.reading_count - 1, 0)
+        _refresh_recent(summary)
+        summary.save()
+
+
+def refresh_windows(summary):
+    """
+    Bring a summary's rolling windows up to today (no-op if already current)
+
+    Windows are otherwise only recalculated when a reading is written, so
+    without this a patient who stopped logging would keep showing the
+    averages of the day of their last reading. Costs one aggregate over at
+    most 90 days of rows, once per patient per day. updated_at is left alone:
+    the readings themselves did not change. Returns the summary.
+    """
+    today = timezone.localdate()
+    if summary is None or summary.windows_as_of == today:
+        return summary
+
+    calculated_on = summary.windows_as_of
+    _refresh_windows(summary, today)
+    # Skipped if a reading was written meanwhile (that already refreshed the windows)
+    PatientSummary.objects.filter(pk=summary.pk, windows_as_of=calculated_on).update(
+        **{field: getattr(summary, field) for field in WINDOW_FIELDS}
+    )
+    return summary
+
+
+def rebuild_summaries(patient_ids=None):
+    """
+    Recompute summaries from raw readings (all patients, or just `patient_ids`)
+
+    Works in chunks of patients with two grouped queries and one bulk upsert
+    per chunk. Returns the number of summaries written.
+    """
+    today = timezone.localdate()
+    patients = Patient.objects.order_by('pk').values_list('pk', flat=True)
+    if patient_ids is not None:
+        patients = patients.filter(pk__in=list(patient_ids))
+
+    written = 0
+    chunk = []
+    for patient_id in patients.iterator(chunk_size=REBUILD_CHUNK_SIZE):
+        chunk.append(patient_id)
+        if len(chunk) >= REBUILD_CHUNK_SIZE:
+            written += _rebuild_chunk(chunk, today)
+            chunk = []
+    if chunk:
+        written += _rebuild_chunk(chunk, today)
+    return written
+
+
+def _rebuild_chunk(patient_ids, today):
+    stats = {
+        row['patient_id']: row
+        for row in SugarReading.objects.filter(patient_id__in=patient_ids)
+        .order_by().values('patient_id')
+        .annotate(
+            reading_count=Count('id'),
+            min_fasting=Min('sugar_before_breakfast'),
+            max_fasting=Max('sugar_before_breakfast'),
+            min_postmeal=Min('sugar_after_breakfast'),
+            max_postmeal=Max('sugar_after_breakfast'),
+            **_window_aggregates(today),
+        )
+    }
+    latest = {
+        row['pk']: row
+        for row in Patient.objects.filter(pk__in=patient_ids).with_reading_summary()
+        .values('pk', 'last_reading_date', 'last_fasting', 'last_postmeal',
+                'last_fasting_status', 'last_postmeal_status')
+    }
+
+    now = timezone.now()
+    summaries = []
+    for patient_id in patient_ids:
+        values = stats.get(patient_id, {})
+        summary = PatientSummary(
+            patient_id=patient_id,
+            reading_count=values.get('reading_count', 0),
+            min_fasting=values.get('min_fasting'),
+            max_fasting=values.get('max_fasting'),
+            min_postmeal=values.get('min_postmeal'),
+            max_postmeal=values.get('max_postmeal'),
+            last_reading_date=latest[patient_id]['last_reading_date'],
+            last_fasting=latest[patient_id]['last_fasting'],
+            last_postmeal=latest[patient_id]['last_postmeal'],
+            last_fasting_status=latest[patient_id]['last_fasting_status'] or '',
+            last_postmeal_status=latest[patient_id]['last_postmeal_status'] or '',
+            updated_at=now,
+        )
+        _apply_windows(summary, values, today)
+        summaries.append(summary)
+
+    PatientSummary.objects.bulk_create(
+        summaries,
+        update_conflicts=True,
+        unique_fields=['patient'],
+        update_fields=SUMMARY_FIELDS,
+    )
+    return len(summaries)
@@ -1,3 +1,669 @@
-from django.test import TestCase
+import json
+import re
+import statistics
+import tempfile
+from datetime import date, timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import analytics, async_views, chart_cache
+from .anomalies import ANOMALY_MIN_READINGS, BASELINE_FIELDS, backfill_anomalies, ewma_step, score_readings
+from .models import FASTING_HIGH, FASTING_LOW, POSTMEAL_HIGH, HealthData, Patient, PatientSummary, SugarReading
+from .pagination import paginate_readings
+from .search import SEARCH_TABLES, patients_matching
+from .summaries import SUMMARY_FIELDS, rebuild_summaries, refresh_windows
+
+
+def make_patient(name='Test Patient'):
+    return Patient.objects.create(name=name, age=50, weight=80, height=175)
+
+
+def add_readings(patient, values, end=None):
+    """Save one reading per day ending on `end` (today), oldest first; values are (fasting, postmeal)"""
+    end = end or timezone.localdate()
+    readings = []
+    for days_ago, (fasting, postmeal) in zip(range(len(values) - 1, -1, -1), values):
+        readings.append(SugarReading.objects.create(
+            patient=patient,
+            reading_date=end - timedelta(days=days_ago),
+            sugar_before_breakfast=fasting,
+            sugar_after_breakfast=postmeal,
+        ))
+    return readings
+
+
+def post_batch(client, readings, on_conflict='skip'):
+    return client.post(
+        reverse('app:readings_batch_api'),
+        json.dumps({'on_conflict': on_conflict, 'readings': readings}),
+        content_type='application/json',
+    )
+
+
+class ReadingSeriesTests(TestCase):
+    """JSON series behind the dashboard chart, and its ETag"""
+
+    def setUp(self):
+        self.patient = make_patient()
+        self.today = add_readings(self.patient, [(90, 130)] * 5)[-1]
+        self.url = reverse('app:reading_series', args=[self.patient.pk])
+
+    def test_unchanged_readings_answer_304(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_batch_update_changes_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        post_batch(self.client, [{
+            'patient_id': self.patient.pk,
+            'reading_date': self.today.reading_date.isoformat(),
+            'sugar_before_breakfast': 250,
+            'sugar_after_breakfast': 260,
+        }], on_conflict='update')
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['fasting'][-1], 250)
+
+    def test_edit_changes_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        self.today.sugar_before_breakfast = 180
+        self.today.save()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['fasting'][-1], 180)
+
+    def test_data_version_is_read_once_per_request(self):
+        with mock.patch.object(chart_cache, 'data_version', wraps=chart_cache.data_version) as data_version:
+            self.client.get(self.url)
+        data_version.assert_called_once_with(self.patient.pk)
+
+    def test_dashboard_series_url_changes_with_the_data(self):
+        dashboard = reverse('app:dashboard', args=[self.patient.pk])
+        before = re.search(r'data-url="([^"]+)"', self.client.get(dashboard).content.decode())[1]
+        self.today.sugar_before_breakfast = 180
+        self.today.save()
+
+        after = re.search(r'data-url="([^"]+)"', self.client.get(dashboard).content.decode())[1]
+        self.assertIn('&amp;v=', before)
+        self.assertNotEqual(before, after)
+
+
+
+class ReadingStatusTests(TestCase):
+    """with_status() in SQL agrees with get_status() in Python"""
+
+    def test_status_at_the_boundaries(self):
+        fasting = [FASTING_LOW - 1, FASTING_LOW, FASTING_HIGH, FASTING_HIGH + 1]
+        postmeal = [POSTMEAL_HIGH - 1, POSTMEAL_HIGH]
+        add_readings(make_patient(), [(value, postmeal[day % 2]) for day, value in enumerate(fasting)])
+
+        readings = SugarReading.objects.order_by('reading_date')
+        in_python = [reading.get_status() for reading in readings]
+        in_sql = [reading.get_status() for reading in readings.with_status()]
+
+        self.assertEqual(in_sql, in_python)
+        self.assertEqual(
+            [(status['fasting'], status['postmeal']) for status in in_python],
+            [('Low', 'Normal'), ('Normal', 'High'), ('Normal', 'Normal'), ('High', 'High')],
+        )
+
+
+class ConditionalPageTests(TestCase):
+    """Patient pages answer 304 until something they show changes"""
+
+    def setUp(self):
+        self.patient = make_patient()
+        add_readings(self.patient, [(90, 130)] * 3)
+        self.health = HealthData.objects.create(patient=self.patient, cholesterol_total=180)
+        self.pages = [
+            reverse('app:patient_detail', args=[self.patient.pk]),
+            reverse('app:dashboard', args=[self.patient.pk]),
+            reverse('app:history', args=[self.patient.pk]),
+        ]
+
+    def etags(self):
+        return [self.client.get(url)['ETag'] for url in self.pages]
+
+    def statuses(self, etags):
+        return [self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code for url, etag in zip(self.pages, etags)]
+
+    def test_unchanged_pages_answer_304(self):
+        self.assertEqual(self.statuses(self.etags()), [304, 304, 304])
+
+    def test_new_reading_changes_every_page(self):
+        etags = self.etags()
+        add_readings(self.patient, [(150, 200)], end=timezone.localdate() + timedelta(days=1))
+        self.assertEqual(self.statuses(etags), [200, 200, 200])
+
+    def test_health_data_edit_changes_the_detail_page(self):
+        etag = self.etags()[0]
+        self.health.cholesterol_total = 999
+        self.health.save()
+
+        response = self.client.get(self.pages[0], HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '999')
+
+    def test_health_data_delete_changes_the_detail_page(self):
+        HealthData.objects.create(patient=self.patient, cholesterol_total=200,
+                                  test_date=timezone.localdate() - timedelta(days=30))
+        etag = self.etags()[0]
+        self.health.delete()
+        self.assertEqual(self.client.get(self.pages[0], HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class KeysetPaginationTests(TestCase):
+    """History pages walked with cursors"""
+
+    def setUp(self):
+        self.patient = make_patient()
+        add_readings(self.patient, [(90, 130)] * 12)
+        self.readings = self.patient.sugar_readings.all()
+
+    def test_pages_cover_every_reading_once_newest_first(self):
+        seen = []
+        page = paginate_readings(self.readings, per_page=5)
+        while True:
+            seen.extend(page)
+            if not page.has_next:
+                break
+            page = paginate_readings(self.readings, after=page.next_cursor, start=page.next_start, per_page=5)
+
+        self.assertEqual(seen, list(self.readings.order_by('-reading_date', '-id')))
+        self.assertEqual((page.start_index, page.end_index), (11, 12))
+
+    def test_previous_cursor_returns_the_page_before(self):
+        first = paginate_readings(self.readings, per_page=5)
+        second = paginate_readings(self.readings, after=first.next_cursor, start=first.next_start, per_page=5)
+        back = paginate_readings(self.readings, before=second.previous_cursor, start=second.previous_start, per_page=5)
+
+        self.assertEqual(list(back), list(first))
+        self.assertFalse(back.has_previous)
+        self.assertEqual(back.start_index, 1)
+
+    def test_invalid_cursor_shows_the_first_page(self):
+        page = paginate_readings(self.readings, after='not-a-cursor', per_page=5)
+        self.assertEqual(list(page), list(paginate_readings(self.readings, per_page=5)))
+
+
+class ImportReadingsTests(TestCase):
+    """import_readings command: formats and per-row outcomes"""
+
+    def setUp(self):
+        self.patient = make_patient()
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+
+    def run_import(self, name, content, *args):
+        path = Path(self.folder.name) / name
+        path.write_text(content, encoding='utf-8')
+        out = StringIO()
+        call_command('import_readings', str(path), *args, stdout=out)
+        return out.getvalue()
+
+    def test_csv_outcomes(self):
+        SugarReading.objects.create(patient=self.patient, reading_date=date(2024, 1, 1),
+                                    sugar_before_breakfast=90, sugar_after_breakfast=130)
+        output = self.run_import('meter.csv', (
+            "patient,date,fasting,postmeal\n"
+            f"{self.patient.pk},2024-01-01,100,140\n"  # already stored
+            f"{self.patient.pk},2024-01-02,95,135\n"
+            f"{self.patient.pk},2024-01-03,abc,135\n"
+            "99999,2024-01-02,95,135\n"
+        ))
+
+        self.assertIn("4 rows", output)
+        self.assertIn("1 created, 0 updated, 1 skipped, 1 unknown patient, 1 invalid", output)
+        self.assertEqual(
+            list(self.patient.sugar_readings.order_by('reading_date').values_list('sugar_before_breakfast', flat=True)),
+            [90, 95],
+        )
+
+    def test_json_update_replaces_stored_values(self):
+        SugarReading.objects.create(patient=self.patient, reading_date=date(2024, 1, 1),
+                                    sugar_before_breakfast=90, sugar_after_breakfast=130)
+        rows = [
+            {'reading_date': '2024-01-01', 'sugar_before_breakfast': 110, 'sugar_after_breakfast': 150},
+            {'reading_date': '2024-01-02', 'sugar_before_breakfast': 100, 'sugar_after_breakfast': 140},
+        ]
+        output = self.run_import('meter.json', json.dumps(rows), '--patient', str(self.patient.pk),
+                                 '--on-conflict', 'update', '--batch-size', '1')
+
+        self.assertIn("1 created, 1 updated", output)
+        self.assertEqual(self.patient.sugar_readings.get(reading_date=date(2024, 1, 1)).sugar_before_breakfast, 110)
+        self.assertEqual(self.patient.summary.reading_count, 2)
+
+    def test_newest_first_file_is_scored_like_a_replay(self):
+        values = [(95, 135), (100, 140), (98, 138)] * 4 + [(260, 140), (97, 137)]
+        lines = ["date,fasting,postmeal"] + [
+            f"{date(2024, 1, 1) + timedelta(days=day)},{fasting},{postmeal}"
+            for day, (fasting, postmeal) in reversed(list(enumerate(values)))
+        ]
+        self.run_import('meter.csv', "\n".join(lines), '--patient', str(self.patient.pk), '--batch-size', '4')
+
+        imported = list(self.patient.sugar_readings.order_by('reading_date').values_list('is_anomaly', 'anomaly_score'))
+        backfill_anomalies([self.patient.pk])
+        replayed = list(self.patient.sugar_readings.order_by('reading_date').values_list('is_anomaly', 'anomaly_score'))
+        self.assertEqual(imported, replayed)
+        self.assertTrue(imported[-2][0])
+        summary = PatientSummary.objects.get(patient=self.patient)
+        self.assertEqual((summary.reading_count, summary.last_fasting), (len(values), 97))
+
+    def test_ndjson_skips_blank_lines(self):
+        line = json.dumps({'patient_id': self.patient.pk, 'date': '2024-01-01', 'fasting': 90, 'postmeal': 130})
+        output = self.run_import('meter.ndjson', f"{line}\n\n")
+
+        self.assertIn("Imported 1 rows", output)
+        self.assertEqual(self.patient.sugar_readings.count(), 1)
+
+
+class ExportTests(TestCase):
+    """CSV/NDJSON exports, sync and async"""
+
+    def setUp(self):
+        self.patient = make_patient()
+        add_readings(self.patient, [(95, 135), (100, 140), (98, 138)])
+        HealthData.objects.create(patient=self.patient, test_date=date(2024, 1, 1), cholesterol_total=190)
+
+    def async_export(self, query):
+        request = RequestFactory().get(f'/export/{self.patient.pk}/', query)
+        response = async_to_sync(async_views.export_patient)(request, patient_id=self.patient.pk)
+
+        async def body():
+            return b''.join([chunk async for chunk in response.streaming_content])
+
+        return response, async_to_sync(body)()
+
+    def test_async_export_streams_the_same_rows(self):
+        for query in ({}, {'health': '1'}, {'format': 'ndjson', 'health': '1'}):
+            with self.subTest(query=query):
+                expected = self.client.get(reverse('app:export_patient', args=[self.patient.pk]), query)
+                response, content = self.async_export(query)
+
+                self.assertTrue(response.is_async)
+                self.assertEqual(content, b''.join(expected.streaming_content))
+                self.assertEqual(response['Content-Disposition'], expected['Content-Disposition'])
+
+
+class HomePageTests(TestCase):
+    """Patient list with each patient's latest reading from PatientSummary"""
+
+    def home_queries(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('app:home'), params)
+        return response, len(queries)
+
+    def test_query_count_does_not_grow_with_patients(self):
+        for number in range(2):
+            add_readings(make_patient(f'Patient {number}'), [(90, 130), (100, 150)])
+        _, few = self.home_queries()
+        for number in range(2, 8):
+            add_readings(make_patient(f'Patient {number}'), [(90, 130), (100, 150)])
+        _, many = self.home_queries()
+
+        self.assertEqual(few, many)
+
+    def test_latest_reading_comes_from_the_summary(self):
+        add_readings(make_patient(), [(90, 130), (126, 210)])
+        response, _ = self.home_queries()
+
+        summary = response.context['patients'][0].summary
+        self.assertEqual((summary.last_fasting, summary.last_postmeal), (126, 210))
+        self.assertEqual((summary.last_fasting_status, summary.last_postmeal_status), ('High', 'High'))
+        self.assertContains(response, '126 mg/dL')
+
+    def test_sort_by_last_reading_puts_patients_without_readings_last(self):
+        recent = make_patient('Recent')
+        older = make_patient('Older')
+        make_patient('No readings')
+        add_readings(recent, [(90, 130)])
+        add_readings(older, [(90, 130)], end=timezone.localdate() - timedelta(days=10))
+        response, _ = self.home_queries(sort='-last_reading')
+
+        self.assertEqual([patient.name for patient in response.context['patients']], ['Recent', 'Older', 'No readings'])
+
+
+class SearchTests(TestCase):
+    """FTS5 search stays in step with every write, including ones that skip signals"""
+
+    def setUp(self):
+        self.patient = make_patient('Alice Smith')
+        self.reading = add_readings(self.patient, [(90, 130)])[0]
+        self.reading.notes = 'felt dizzy after jogging'
+        self.reading.save()
+
+    def found(self, text, include_notes=True):
+        return set(Patient.objects.filter(patients_matching(text, include_notes)).values_list('name', flat=True))
+
+    def assert_index_matches_tables(self):
+        # FTS5 checks an external content index against its table
+        with connection.cursor() as cursor:
+            for fts in SEARCH_TABLES:
+                cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('integrity-check')")
+
+    def test_inserts_are_searchable(self):
+        other = make_patient('Bob Jones')
+        SugarReading.objects.bulk_create([SugarReading(
+            patient=other, reading_date=date(2024, 1, 1),
+            sugar_before_breakfast=90, sugar_after_breakfast=130, notes='skipped breakfast',
+        )])
+
+        self.assertEqual(self.found('ali smi'), {'Alice Smith'})
+        self.assertEqual(self.found('jones'), {'Bob Jones'})
+        self.assertEqual(self.found('breakfast'), {'Bob Jones'})
+        self.assertEqual(self.found('breakfast', include_notes=False), set())
+        self.assert_index_matches_tables()
+
+    def test_queryset_update_of_notes(self):
+        SugarReading.objects.filter(pk=self.reading.pk).update(notes='late dinner')
+
+        self.assertEqual(self.found('dizzy'), set())
+        self.assertEqual(self.found('dinner'), {'Alice Smith'})
+        self.assert_index_matches_tables()
+
+    def test_patient_rename(self):
+        self.patient.name = 'Alice Brown'
+        self.patient.save()
+        Patient.objects.filter(pk=make_patient('Bob Jones').pk).update(name='Robert Jones')
+
+        self.assertEqual(self.found('smith'), set())
+        self.assertEqual(self.found('brown'), {'Alice Brown'})
+        self.assertEqual(self.found('bob'), set())
+        self.assertEqual(self.found('robert'), {'Robert Jones'})
+        self.assert_index_matches_tables()
+
+    def test_cascade_delete_removes_patient_and_notes(self):
+        self.patient.delete()
+
+        self.assertEqual(self.found('alice'), set())
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM app_reading_fts WHERE app_reading_fts MATCH 'dizzy'")
+            self.assertEqual(cursor.fetchone()[0], 0)
+        self.assert_index_matches_tables()
+
+    def test_fts_syntax_is_plain_text(self):
+        make_patient('Ann Andrews')
+        make_patient('Nora Orton')
+        self.reading.notes = 'not fasting'
+        self.reading.save()
+
+        self.assertEqual(self.found('AND'), {'Ann Andrews'})
+        self.assertEqual(self.found('or'), {'Nora Orton'})
+        self.assertEqual(self.found('NOT fasting'), {'Alice Smith'})
+        self.assertEqual(self.found('alice OR bob'), set())
+        self.assertEqual(self.found('"'), set())
+        self.assertEqual(self.found('"ann'), {'Ann Andrews'})
+        self.assertEqual(self.found('smith*) ^('), {'Alice Smith'})
+
+
+class SummaryTests(TestCase):
+    """Incremental PatientSummary updates agree with a full rebuild"""
+
+    def setUp(self):
+        self.patient = make_patient()
+        self.readings = add_readings(self.patient, [(80 + i % 50, 120 + i * 7 % 90) for i in range(100)])
+
+    def summary_values(self):
+        fields = [field for field in SUMMARY_FIELDS if field != 'updated_at']
+        return PatientSummary.objects.filter(patient=self.patient).values(*fields).get()
+
+    def assertMatchesRebuild(self):
+        incremental = self.summary_values()
+        rebuild_summaries([self.patient.pk])
+        self.assertEqual(incremental, self.summary_values())
+
+    def test_adding_readings(self):
+        self.assertEqual(self.summary_values()['reading_count'], 100)
+        self.assertMatchesRebuild()
+
+    def test_editing_an_extreme_value(self):
+        highest = max(self.readings, key=lambda reading: reading.sugar_after_breakfast)
+        highest.sugar_after_breakfast = 125
+        highest.save()
+        self.assertMatchesRebuild()
+
+    def test_deleting_readings(self):
+        self.readings[-1].delete()  # the latest reading
+        min(self.readings, key=lambda reading: reading.sugar_before_breakfast).delete()
+        self.readings[50].delete()
+        self.assertMatchesRebuild()
+
+    def test_deleting_every_reading(self):
+        self.patient.sugar_readings.all().delete()
+        self.assertEqual(self.summary_values()['reading_count'], 0)
+        self.assertMatchesRebuild()
+
+    def test_stale_windows_are_recalculated(self):
+        yesterday = timezone.localdate() - timedelta(days=1)
+        PatientSummary.objects.filter(patient=self.patient).update(windows_as_of=yesterday, avg_fasting_7d=1)
+
+        refresh_windows(PatientSummary.objects.get(patient=self.patient))
+        self.assertEqual(self.summary_values()['windows_as_of'], timezone.localdate())
+        self.assertMatchesRebuild()
+
+
+def reference_metrics(rows):
+    """The analytics metrics worked out one reading at a time; rows are (date, fasting, postmeal)"""
+    values = [fasting for _, fasting, _ in rows] + [postmeal for _, _, postmeal in rows]
+    mean = statistics.mean(values)
+    below = sum(fasting < FASTING_LOW for _, fasting, _ in rows)
+    above = sum(fasting > FASTING_HIGH for _, fasting, _ in rows)
+    above += sum(postmeal >= POSTMEAL_HIGH for _, _, postmeal in rows)
+
+    days = [day.toordinal() for day, _, _ in rows]
+    daily = [(fasting + postmeal) / 2 for _, fasting, postmeal in rows]
+    day_mean, daily_mean = statistics.mean(days), statistics.mean(daily)
+    spread = sum((day - day_mean) ** 2 for day in days)
+    slope = sum((day - day_mean) * (value - daily_mean) for day, value in zip(days, daily)) / spread if spread else None
+    return {
+        'readings': len(rows),
+        'mean': mean,
+        'sd': statistics.stdev(values),
+        'in_range': 100 * (len(values) - below - above) / len(values),
+        'below_range': 100 * below / len(values),
+        'above_range': 100 * above / len(values),
+        'slope': slope,
+    }
+
+
+class AnalyticsTests(TestCase):
+    """NumPy grouped metrics agree with a plain Python calculation"""
+
+    def setUp(self):
+        today = timezone.localdate()
+        self.rows = {}
+        for number, (count, step) in enumerate([(40, 1), (25, 3), (1, 1)]):
+            patient = make_patient(f'Patient {number}')
+            self.rows[patient.pk] = [
+                (today - timedelta(days=i * step), 60 + (i * 17 + number * 5) % 90, 100 + (i * 29) % 120)
+                for i in range(count)
+            ][::-1]
+            SugarReading.objects.bulk_create([
+                SugarReading(patient=patient, reading_date=day,
+                             sugar_before_breakfast=fasting, sugar_after_breakfast=postmeal)
+                for day, fasting, postmeal in self.rows[patient.pk]
+            ])
+
+    def assertMetricsMatch(self, metrics, rows):
+        expected = reference_metrics(rows)
+        self.assertEqual(metrics['readings'], expected['readings'])
+        for name in ('mean', 'sd', 'in_range', 'below_range', 'above_range'):
+            self.assertAlmostEqual(metrics[name], expected[name], delta=0.051, msg=name)
+        if expected['slope'] is None:
+            self.assertIsNone(metrics['slope'])
+        else:
+            self.assertAlmostEqual(metrics['slope'], expected['slope'], delta=0.0051)
+
+    def test_batch_metrics_match_per_patient_calculation(self):
+        metrics = analytics.batch_metrics()
+        self.assertEqual(set(metrics), set(self.rows))
+        for patient_id, rows in self.rows.items():
+            self.assertMetricsMatch(metrics[patient_id], rows)
+
+    def test_window_limits_the_readings(self):
+        cutoff = timezone.localdate() - timedelta(days=29)
+        for patient_id, rows in self.rows.items():
+            recent = [row for row in rows if row[0] >= cutoff]
+            self.assertMetricsMatch(analytics.patient_metrics(patient_id, days=30), recent)
+
+    def test_no_readings_in_the_window(self):
+        patient = make_patient('No readings')
+        self.assertIsNone(analytics.patient_metrics(patient.pk))
+        self.assertNotIn(patient.pk, analytics.batch_metrics())
+
+
+class AnomalyTests(TestCase):
+    """EWMA scoring of new readings against the patient's baseline"""
+
+    def setUp(self):
+        self.patient = make_patient()
+
+    def flags(self):
+        return list(self.patient.sugar_readings.order_by('reading_date').values_list('is_anomaly', flat=True))
+
+    def test_ewma_step(self):
+        self.assertEqual(ewma_step(None, 0.0, 100), (0.0, 100.0, 0.0))
+        score, mean, var = ewma_step(100.0, 0.0, 110)
+        self.assertEqual(score, 1.0)  # 10 mg/dL against the minimum standard deviation
+        self.assertAlmostEqual(mean, 101.0)
+        self.assertAlmostEqual(var, 9.0)
+
+    def test_spike_after_steady_readings_is_flagged(self):
+        readings = add_readings(self.patient, [(95, 135), (100, 140), (98, 138)] * 4 + [(260, 140), (97, 137)])
+        spike = SugarReading.objects.get(pk=readings[-2].pk)
+
+        self.assertTrue(spike.is_anomaly)
+        self.assertGreaterEqual(spike.anomaly_score, 3.0)
+        self.assertEqual(sum(self.flags()), 1)
+        self.patient.refresh_from_db()
+        self.assertEqual(self.patient.baseline_readings, len(readings))
+
+    def test_no_flags_until_the_baseline_is_trusted(self):
+        add_readings(self.patient, [(95, 135)] * (ANOMALY_MIN_READINGS - 1) + [(300, 350)])
+        self.assertFalse(any(self.flags()))
+
+    def test_small_changes_of_a_steady_patient_are_not_flagged(self):
+        add_readings(self.patient, [(100, 140)] * 10 + [(120, 160)])
+        self.assertFalse(any(self.flags()))
+
+    def test_backfill_replays_readings_in_date_order(self):
+        values = [(95, 135), (100, 140), (98, 138)] * 4 + [(260, 140)]
+        add_readings(self.patient, values[1:])
+        # Backdated reading, entered last: the live baseline saw it out of order
+        add_readings(self.patient, values[:1], end=timezone.localdate() - timedelta(days=len(values) - 1))
+
+        expected = [SugarReading(sugar_before_breakfast=fasting, sugar_after_breakfast=postmeal)
+                    for fasting, postmeal in values]
+        baseline = score_readings(expected)
+        self.assertEqual(backfill_anomalies([self.patient.pk]), (1, 1))
+
+        stored = self.patient.sugar_readings.order_by('reading_date').values_list('is_anomaly', 'anomaly_score')
+        self.assertEqual(list(stored), [(reading.is_anomaly, reading.anomaly_score) for reading in expected])
+        self.patient.refresh_from_db()
+        self.assertAlmostEqual(self.patient.baseline_fasting_mean, baseline['baseline_fasting_mean'])
+
+
+class ReadingsBatchApiTests(TestCase):
+    """Batch upload API: validation, per-row outcomes and derived data"""
+
+    def setUp(self):
+        self.patient = make_patient()
+        self.today = timezone.localdate()
+
+    def row(self, days_ago=0, fasting=95, postmeal=135, patient_id=None):
+        return {
+            'patient_id': patient_id or self.patient.pk,
+            'reading_date': (self.today - timedelta(days=days_ago)).isoformat(),
+            'sugar_before_breakfast': fasting,
+            'sugar_after_breakfast': postmeal,
+        }
+
+    def scores(self, patient):
+        return list(patient.sugar_readings.order_by('reading_date').values_list('is_anomaly', 'anomaly_score'))
+
+    def test_rejects_malformed_requests(self):
+        url = reverse('app:readings_batch_api')
+        self.assertEqual(self.client.post(url, 'not json', content_type='application/json').status_code, 400)
+        self.assertEqual(self.client.post(url, '{"rows": []}', content_type='application/json').status_code, 400)
+        self.assertEqual(post_batch(self.client, [], on_conflict='replace').status_code, 400)
+        with mock.patch('app.views.BATCH_MAX_READINGS', 2):
+            self.assertEqual(post_batch(self.client, [self.row(n) for n in range(3)]).status_code, 413)
+        self.assertEqual(SugarReading.objects.count(), 0)
+
+    def test_requires_json_and_a_csrf_token(self):
+        url = reverse('app:readings_batch_api')
+        body = json.dumps({'readings': [self.row()]})
+        # A cross-site form can send JSON-looking text/plain without a preflight
+        self.assertEqual(self.client.post(url, body, content_type='text/plain').status_code, 415)
+
+        device = Client(enforce_csrf_checks=True)
+        self.assertEqual(device.post(url, body, content_type='application/json').status_code, 403)
+        device.get(reverse('app:add_patient'))  # any page with a form sets the cookie
+        token = device.cookies['csrftoken'].value
+        response = device.post(url, body, content_type='application/json', HTTP_X_CSRFTOKEN=token)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(SugarReading.objects.count(), 1)
+
+    def test_row_outcomes(self):
+        add_readings(self.patient, [(90, 130)])
+        response = post_batch(self.client, [
+            self.row(0),                    # already stored
+            self.row(1, fasting=100),       # replaced by the next row
+            self.row(1, fasting=105),
+            self.row(2, fasting='high'),
+            self.row(3, patient_id=99999),
+        ])
+
+        body = response.json()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['status'] for result in body['results']],
+                         ['skipped', 'duplicate', 'created', 'invalid', 'unknown_patient'])
+        self.assertIn('sugar_before_breakfast', body['results'][3]['errors'])
+        self.assertEqual(body['counts']['created'], 1)
+        kept = self.patient.sugar_readings.get(reading_date=self.today - timedelta(days=1))
+        self.assertEqual(kept.sugar_before_breakfast, 105)
+
+    def test_update_replaces_values_and_summary(self):
+        add_readings(self.patient, [(90, 130)])
+        body = post_batch(self.client, [self.row(0, fasting=180)], on_conflict='update').json()
+
+        self.assertEqual(body['results'][0]['status'], 'updated')
+        self.assertEqual(PatientSummary.objects.get(patient=self.patient).last_fasting, 180)
+
+    def test_uploaded_readings_are_scored_like_saved_ones(self):
+        values = [(95, 135), (100, 140), (98, 138)] * 4 + [(260, 140), (97, 137)]
+        saved = make_patient('Saved one by one')
+        add_readings(saved, values)
+
+        days_ago = range(len(values) - 1, -1, -1)
+        rows = [self.row(n, fasting, postmeal) for n, (fasting, postmeal) in zip(days_ago, values)]
+        post_batch(self.client, rows[:8])
+        post_batch(self.client, rows[8:])
+
+        self.assertEqual(self.scores(self.patient), self.scores(saved))
+        self.assertTrue(self.scores(self.patient)[-2][0])
+        self.assertEqual(
+            Patient.objects.filter(pk=self.patient.pk).values(*BASELINE_FIELDS).get(),
+            Patient.objects.filter(pk=saved.pk).values(*BASELINE_FIELDS).get(),
+        )
+
+    def test_backdated_and_updated_readings_are_replayed_in_date_order(self):
+        add_readings(self.patient, [(95, 135), (100, 140), (98, 138)] * 4)
+        post_batch(self.client, [self.row(20, 96, 136), self.row(2, 300, 140)], on_conflict='update')
+        uploaded = self.scores(self.patient)
+
+        backfill_anomalies([self.patient.pk])
+        self.assertEqual(uploaded, self.scores(self.patient))
+        self.assertTrue(uploaded[-3][0])
@@ -1,5 +1,9 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# Read-heavy pages: async views under ASGI, sync views under WSGI
+read_views = async_views if settings.ASYNC_VIEWS else views
 
 # App name for namespacing
 app_name = 'app'
@@ -10,16 +14,28 @@ urlpatterns = [
     
     # Patient URLs
     path('patient/add/', views.add_patient, name='add_patient'),
-    path('patient/<int:pk>/', views.patient_detail, name='patient_detail'),
+    path('patient/<int:pk>/', read_views.patient_detail, name='patient_detail'),
     path('patient/<int:pk>/edit/', views.edit_patient, name='edit_patient'),
     
     # Sugar Reading URLs
     path('reading/add/<int:patient_id>/', views.add_sugar_reading, name='add_sugar_reading'),
-    path('reading/<int:pk>/', views.reading_detail, name='reading_detail'),
+    path('reading/<int:pk>/', read_views.reading_detail, name='reading_detail'),
     
     # Dashboard and History
-    path('dashboard/<int:patient_id>/', views.dashboard, name='dashboard'),
-    path('history/<int:patient_id>/', views.history, name='history'),
+    path('dashboard/<int:patient_id>/', read_views.dashboard, name='dashboard'),
+    path('history/<int:patient_id>/', read_views.history, name='history'),
+    
+    # Clinic-wide analytics
+    path('analytics/', views.analytics, name='analytics'),
+    
+    # Export (CSV / NDJSON)
+    path('export/', read_views.export_all, name='export_all'),
+    path('export/<int:patient_id>/', read_views.export_patient, name='export_patient'),
+    
+    # JSON API
+    path('api/patient/<int:patient_id>/readings/', views.reading_series, name='reading_series'),
+    path('api/analytics/', views.analytics_api, name='analytics_api'),
+    path('api/readings/batch/', views.readings_batch_api, name='readings_batch_api'),
     
     # Health Data URLs
     path('health/add/<int:patient_id>/', views.add_health_data, name='add_health_data'),
@@ -1,18 +1,80 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_GET, require_POST
+from django.core.paginator import Paginator
+from django.db.models import Count, F
 from .models import Patient, SugarReading, HealthData
 from .forms import PatientForm, SugarReadingForm, HealthDataForm
-import plotly.graph_objects as go
+import json
 from datetime import datetime, timedelta
-from .diet_plans import get_detailed_diet_plan
+from .diet_plans import diet_plan_context
+from .pagination import paginate_readings
+from . import chart_cache
+from .metrics import timed
+from .exports import EXPORT_FORMATS, STREAMERS
+from .cohort import COHORT_WINDOWS, DEFAULT_COHORT_WINDOW, get_cohort_summary
+from .search import patients_matching
+from .ingest import ON_CONFLICT_CHOICES, ingest_reading_rows
+from .conditional import by_patient_id, by_pk, by_reading, conditional_page
+from .summaries import refresh_windows
+
+# Home page: patients per page and sort options (?sort=<key> -> (label, order_by))
+PATIENTS_PER_PAGE = 12
+PATIENT_SORTS = {
+    'newest': ('Newest first', ['-created_at', '-pk']),
+    'name': ('Name (A-Z)', ['name', 'pk']),
+    '-name': ('Name (Z-A)', ['-name', '-pk']),
+    'bmi': ('BMI (lowest first)', [F('bmi').asc(nulls_last=True), 'pk']),
+    '-bmi': ('BMI (highest first)', [F('bmi').desc(nulls_last=True), '-pk']),
+    '-last_reading': ('Last reading (recent first)', [F('summary__last_reading_date').desc(nulls_last=True), '-pk']),
+    'last_reading': ('Last reading (oldest first)', [F('summary__last_reading_date').asc(nulls_last=True), 'pk']),
+}
+DEFAULT_PATIENT_SORT = 'newest'
+
+# Dashboard statistic windows: ?window=<key> -> (days, label). None means all time.
+DASHBOARD_WINDOWS = {
+    '7': (7, 'Last 7 days'),
+    '30': (30, 'Last 30 days'),
+    '90': (90, 'Last 90 days'),
+    '365': (365, 'Last year'),
+    'all': (None, 'All time'),
+}
+DEFAULT_DASHBOARD_WINDOW = '30'
+
+# Reading series JSON: default/maximum number of readings and browser cache lifetime (seconds).
+# The dashboard adds the data version (&v=) to the series URL, so max-age never serves stale data
+SERIES_DEFAULT_LIMIT = 30
+SERIES_MAX_LIMIT = 1000
+SERIES_MAX_AGE = 60
+
+# Most readings accepted by one batch API request
+BATCH_MAX_READINGS = 5000
 
 # View 1: Home Page
 def home(request):
-    """Display home page with list of all patients"""
-    patients = Patient.objects.all()
+    """Display home page with a searchable, sortable, paginated list of patients"""
+    query = request.GET.get('q', '').strip()
+    sort = request.GET.get('sort', DEFAULT_PATIENT_SORT)
+    if sort not in PATIENT_SORTS:
+        sort = DEFAULT_PATIENT_SORT
+    
+    # Latest reading, its status and reading count come from the precomputed summary (one join, no N+1)
+    patients = Patient.objects.select_related('summary')
+    if query:
+        # Full-text index over names and reading notes (no LIKE '%...%' scan)
+        patients = patients.filter(patients_matching(query))
+    patients = patients.order_by(*PATIENT_SORTS[sort][1])
+    
+    page = Paginator(patients, PATIENTS_PER_PAGE).get_page(request.GET.get('page'))
     
     context = {
-        'patients': patients,
+        'patients': page.object_list,
+        'page': page,
+        'query': query,
+        'sort': sort,
+        'sort_options': [(key, label) for key, (label, _) in PATIENT_SORTS.items()],
     }
     
     return render(request, 'app/home.html', context)
@@ -39,15 +101,19 @@ def add_patient(request):
 
 
 # View 3: Patient Detail
+@conditional_page('patient_detail', by_pk)
 def patient_detail(request, pk):
     """Display detailed information about a patient"""
     patient = get_object_or_404(Patient, pk=pk)
     
-    # Get latest sugar reading
-    latest_reading = patient.sugar_readings.first()
+    # Get recent readings (last 7 days) with status worked out by the database
+    recent_readings = list(patient.sugar_readings.with_status()[:7])
     
-    # Get recent readings (last 7 days)
-    recent_readings = patient.sugar_readings.all()[:7]
+    # Latest sugar reading is the first of the recent ones (no extra query)
+    latest_reading = recent_readings[0] if recent_readings else None
+    
+    # Most recent readings flagged as unusual for this patient (small partial index)
+    unusual_readings = list(patient.sugar_readings.filter(is_anomaly=True)[:5])
     
     # Get health data
     health_data = patient.health_data.first()
@@ -56,6 +122,7 @@ def patient_detail(request, pk):
         'patient': patient,
         'latest_reading': latest_reading,
         'recent_readings': recent_readings,
+        'unusual_readings': unusual_readings,
         'health_data': health_data,
     }
     
@@ -111,82 +178,273 @@ def add_sugar_reading(request, patient_id):
 
 
 # View 6: Reading Detail
+@conditional_page('reading_detail', by_reading)
 def reading_detail(request, pk):
     """Display detailed information about a specific reading"""
-    reading = get_object_or_404(SugarReading, pk=pk)
+    reading = get_object_or_404(
+        SugarReading.objects.with_status().select_related('patient'), pk=pk
+    )
     status = reading.get_status()
     patient = reading.patient
     
-    # Get detailed diet plan
-    diet_plan = get_detailed_diet_plan(
-        status=status,
-        patient_age=patient.age,
-        bmi=float(patient.bmi) if patient.bmi else 25.0
-    )
-    
     context = {
         'reading': reading,
         'status': status,
-        'diet_plan': diet_plan,  # Changed from meal_suggestions
         'patient': patient,
+        # Detailed diet plan (replaces the old meal_suggestions)
+        **diet_plan_context(status, patient),
     }
     
     return render(request, 'app/reading_detail.html', context)
 
 
 # View 7: Dashboard with Graphs
+def _dashboard_window(request):
+    """(key, days, label) of the window picked with ?window= (falls back to the default)"""
+    window_key = request.GET.get('window', DEFAULT_DASHBOARD_WINDOW)
+    if window_key not in DASHBOARD_WINDOWS:
+        window_key = DEFAULT_DASHBOARD_WINDOW
+    window_days, window_label = DASHBOARD_WINDOWS[window_key]
+    return window_key, window_days, window_label
+
+
+@conditional_page('dashboard', by_patient_id, daily=True)
 def dashboard(request, patient_id):
     """Display patient dashboard with graphs"""
-    patient = get_object_or_404(Patient, pk=patient_id)
-    
-    # Get all readings for this patient
-    readings = patient.sugar_readings.all()[:30]  # Last 30 readings
-    
-    # Create graph if there are readings
-    graph_html = None
-    if readings:
-        graph_html = create_sugar_graph(readings)
-    
-    # Calculate statistics
-    if readings:
-        fasting_values = [r.sugar_before_breakfast for r in readings]
-        postmeal_values = [r.sugar_after_breakfast for r in readings]
-        
-        stats = {
-            'avg_fasting': sum(fasting_values) / len(fasting_values),
-            'avg_postmeal': sum(postmeal_values) / len(postmeal_values),
-            'min_fasting': min(fasting_values),
-            'max_fasting': max(fasting_values),
-            'min_postmeal': min(postmeal_values),
-            'max_postmeal': max(postmeal_values),
-        }
-    else:
+    patient = get_object_or_404(Patient.objects.select_related('summary'), pk=patient_id)
+    
+    # Which time window to summarise (7/30/90/365 days or all time)
+    window_key, window_days, window_label = _dashboard_window(request)
+    
+    # Calculate statistics with one aggregate query for the window
+    stats = patient.sugar_readings.in_window(window_days).summary()
+    readings_count = stats['readings_count']
+    
+    # No readings in the window (patient stopped logging): summarise their most
+    # recent readings instead - the same ones the chart shows
+    between = None
+    empty_window_label = None
+    if not readings_count and window_days is not None:
+        dates = list(patient.sugar_readings.values_list('reading_date', flat=True)[:SERIES_DEFAULT_LIMIT])
+        if dates:
+            between = (dates[-1], dates[0])
+            stats = patient.sugar_readings.filter(reading_date__range=between).summary()
+            readings_count = stats['readings_count']
+            empty_window_label, window_label = window_label, f'Last {readings_count} readings'
+    if not readings_count:
         stats = None
     
+    # Variability, time in range and trend for the same window (numpy is only loaded here)
+    trend = None
+    if stats:
+        from .analytics import patient_metrics
+        trend = patient_metrics(patient.pk, None if between else window_days, between)
+    
+    # Rolling averages and estimated HbA1c are precomputed (None if there are no readings yet),
+    # and recalculated here if they are from an earlier day
+    summary = refresh_windows(getattr(patient, 'summary', None))
+    
+    # The graph is drawn in the browser from the reading_series JSON endpoint
     context = {
         'patient': patient,
-        'graph_html': graph_html,
+        'summary': summary,
+        'series_limit': SERIES_DEFAULT_LIMIT,
         'stats': stats,
-        'readings_count': readings.count(),
+        'trend': trend,
+        'readings_count': readings_count,
+        'windows': DASHBOARD_WINDOWS,
+        'window_key': window_key,
+        'window_label': window_label,
+        'empty_window_label': empty_window_label,
+        'last_reading_date': between[1] if between else None,
     }
     
     return render(request, 'app/dashboard.html', context)
 
 
+# View 7b: Reading Series (JSON for the dashboard chart)
+def _reading_series_limit(request):
+    """Number of readings requested with ?limit= (clamped to a sane range)"""
+    try:
+        limit = int(request.GET.get('limit', SERIES_DEFAULT_LIMIT))
+    except ValueError:
+        limit = SERIES_DEFAULT_LIMIT
+    return min(max(limit, 1), SERIES_MAX_LIMIT)
+
+
+def _reading_series_etag(request, patient_id):
+    """
+    ETag for the series: changes whenever the patient's readings change
+    
+    Built from the summary's updated_at (chart_cache.data_version), which every
+    add, edit and delete updates - including batch and import updates. The
+    version is kept on the request so the view can reuse it for the chart cache.
+    """
+    request.series_version = chart_cache.data_version(patient_id)
+    return f"{request.series_version}-{_reading_series_limit(request)}"
+
+
+@timed('caretrack_chart_build_seconds', chart='reading_series')
+def build_reading_series(patient_id, limit):
+    """Columnar arrays (oldest first) of a patient's last `limit` readings"""
+    rows = list(
+        SugarReading.objects.filter(patient_id=patient_id)
+        .order_by('-reading_date')
+        .values_list('reading_date', 'sugar_before_breakfast', 'sugar_after_breakfast')[:limit]
+    )
+    rows.reverse()
+    return {
+        'patient_id': patient_id,
+        'dates': [row[0].isoformat() for row in rows],
+        'fasting': [row[1] for row in rows],
+        'postmeal': [row[2] for row in rows],
+    }
+
+
+@require_GET
+@cache_control(private=True, max_age=SERIES_MAX_AGE)
+@condition(etag_func=_reading_series_etag)
+def reading_series(request, patient_id):
+    """Return a patient's readings as compact JSON for client-side charts"""
+    patient = get_object_or_404(Patient, pk=patient_id)
+    limit = _reading_series_limit(request)
+    
+    if limit == SERIES_DEFAULT_LIMIT:
+        # The dashboard's default series is shared by every visitor, so cache it
+        series = chart_cache.get_or_build(
+            'reading_series', patient.pk, lambda: build_reading_series(patient.pk, limit),
+            version=request.series_version,
+        )
+    else:
+        series = build_reading_series(patient.pk, limit)
+    
+    return JsonResponse(series)
+
+
 # View 8: History Page
+@conditional_page('history', by_patient_id)
 def history(request, patient_id):
     """Display complete history of readings"""
     patient = get_object_or_404(Patient, pk=patient_id)
-    readings = patient.sugar_readings.all()
-    
+
+    # One page of readings using keyset pagination (cost stays the same on every page)
+    try:
+        start = int(request.GET.get('start', 1))
+    except ValueError:
+        start = 1
+    page = paginate_readings(
+        patient.sugar_readings.with_status(),
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        start=start,
+    )
+
+    # Totals for the whole history (one reading per day, so this is also the days tracked)
+    totals = patient.sugar_readings.aggregate(total_readings=Count('id'))
+
     context = {
         'patient': patient,
-        'readings': readings,
+        'readings': page.object_list,
+        'page': page,
+        'totals': totals,
     }
     
     return render(request, 'app/history.html', context)
 
 
+# View 8b: Export readings (streamed, so memory stays flat for any history size)
+def _export_response(request, patient_id, filename, streamers=STREAMERS):
+    """Build a streaming CSV/NDJSON response from ?format= and ?health=1"""
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        export_format = 'csv'
+    include_health = request.GET.get('health') in ('1', 'true', 'yes')
+
+    rows = streamers[export_format](patient_id=patient_id, include_health=include_health)
+    response = StreamingHttpResponse(rows, content_type=EXPORT_FORMATS[export_format])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+    return response
+
+
+@require_GET
+def export_patient(request, patient_id):
+    """Download one patient's complete history"""
+    patient = get_object_or_404(Patient, pk=patient_id)
+    return _export_response(request, patient.pk, f'caretrack-patient-{patient.pk}')
+
+
+@require_GET
+def export_all(request):
+    """Download the complete history of every patient"""
+    return _export_response(request, None, 'caretrack-all-patients')
+
+
+# View 10: Clinic-wide Analytics
+def _cohort_days(request):
+    """Window in days from ?days= (falls back to the default window)"""
+    try:
+        days = int(request.GET.get('days', DEFAULT_COHORT_WINDOW))
+    except ValueError:
+        days = DEFAULT_COHORT_WINDOW
+    return days if days in COHORT_WINDOWS else DEFAULT_COHORT_WINDOW
+
+
+def analytics(request):
+    """Display glycemic analytics across all patients"""
+    summary = get_cohort_summary(_cohort_days(request))
+    
+    context = {
+        'summary': summary,
+        'windows': COHORT_WINDOWS,
+    }
+    
+    return render(request, 'app/analytics.html', context)
+
+
+@require_GET
+def analytics_api(request):
+    """Clinic-wide analytics as JSON"""
+    return JsonResponse(get_cohort_summary(_cohort_days(request)))
+
+
+# View 10b: Batch Reading Upload (JSON API for devices and mobile sync)
+@require_POST
+def readings_batch_api(request):
+    """
+    Store many readings (for any patients) in one request
+    
+    Body: {"on_conflict": "skip" | "update", "readings": [{"patient_id": 1,
+    "reading_date": "2024-01-31", "sugar_before_breakfast": 95,
+    "sugar_after_breakfast": 130, "notes": ""}, ...]}
+    
+    Requests are CSRF-checked like the site's forms (send the csrftoken
+    cookie set by any form page back in an X-CSRFToken header) and must be
+    application/json, which other sites cannot send without a CORS preflight.
+    Responds with totals and one result per reading, in the same order.
+    """
+    if request.content_type != 'application/json':
+        return JsonResponse({'error': 'Content-Type must be application/json'}, status=415)
+    
+    try:
+        payload = json.loads(request.body)
+    except (ValueError, UnicodeDecodeError):
+        return JsonResponse({'error': 'Request body must be valid JSON'}, status=400)
+    
+    if not isinstance(payload, dict) or not isinstance(payload.get('readings'), list):
+        return JsonResponse({'error': 'Expected an object with a "readings" list'}, status=400)
+    
+    on_conflict = payload.get('on_conflict', 'skip')
+    if on_conflict not in ON_CONFLICT_CHOICES:
+        return JsonResponse({'error': f'on_conflict must be one of: {", ".join(ON_CONFLICT_CHOICES)}'}, status=400)
+    
+    readings = payload['readings']
+    if len(readings) > BATCH_MAX_READINGS:
+        return JsonResponse({'error': f'At most {BATCH_MAX_READINGS} readings per request'}, status=413)
+    
+    counts, results = ingest_reading_rows(readings, on_conflict)
+    return JsonResponse({'counts': counts, 'results': results})
+
+
 # View 9: Add Health Data
 def add_health_data(request, patient_id):
     """Add cholesterol and thyroid data"""
@@ -212,58 +470,6 @@ def add_health_data(request, patient_id):
     return render(request, 'app/health_data_form.html', context)
 
 
-# Helper Function: Create Graph using Plotly
-def create_sugar_graph(readings):
-    """Create an interactive line graph of sugar levels"""
-    
-    # Extract data from readings (reverse to show oldest to newest)
-    dates = [r.reading_date for r in reversed(readings)]
-    fasting = [r.sugar_before_breakfast for r in reversed(readings)]
-    postmeal = [r.sugar_after_breakfast for r in reversed(readings)]
-    
-    # Create figure
-    fig = go.Figure()
-    
-    # Add fasting sugar line
-    fig.add_trace(go.Scatter(
-        x=dates,
-        y=fasting,
-        mode='lines+markers',
-        name='Fasting Sugar',
-        line=dict(color='blue', width=2),
-        marker=dict(size=8)
-    ))
-    
-    # Add post-meal sugar line
-    fig.add_trace(go.Scatter(
-        x=dates,
-        y=postmeal,
-        mode='lines+markers',
-        name='Post-Meal Sugar',
-        line=dict(color='red', width=2),
-        marker=dict(size=8)
-    ))
-    
-    # Add reference lines for normal ranges
-    fig.add_hline(y=100, line_dash="dash", line_color="green", 
-                  annotation_text="Normal Fasting (100)")
-    fig.add_hline(y=140, line_dash="dash", line_color="orange",
-                  annotation_text="Normal Post-Meal (140)")
-    
-    # Update layout
-    fig.update_layout(
-        title='Sugar Level Trends',
-        xaxis_title='Date',
-        yaxis_title='Sugar Level (mg/dL)',
-        hovermode='x unified',
-        template='plotly_white',
-        height=500,
-    )
-    
-    # Convert to HTML
-    return fig.to_html(full_html=False, include_plotlyjs='cdn')
-
-
 # Helper Function: Get Meal Suggestions
 def get_meal_suggestions(status):
     """Provide meal suggestions based on sugar status"""
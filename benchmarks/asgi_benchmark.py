@@ -0,0 +1,189 @@
+"""
+Concurrency benchmark: sync views under WSGI vs async views under ASGI
+
+Seeds a throwaway SQLite database, starts the app under gunicorn (WSGI,
+sync views) and then under uvicorn (ASGI, async views from
+app/async_views.py) with the same number of worker processes, and hits
+patient_detail, dashboard, history and reading_detail from many
+concurrent clients. Prints requests/second and p50/p99 latency per
+concurrency level.
+
+Needs gunicorn and uvicorn installed (pip install gunicorn uvicorn).
+
+Usage (from the project root):
+    python benchmarks/asgi_benchmark.py [--patients 200] [--days 365] [--workers 2]
+                                        [--concurrency 1 16 64] [--duration 10]
+"""
+import argparse
+import http.client
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'CareTrack.settings')
+
+HOST = '127.0.0.1'
+PORT = 8765
+
+
+def seed(database_path, patients, days):
+    """Migrate a fresh database and bulk insert patients with one reading per day"""
+    os.environ['CARETRACK_DB_PATH'] = database_path
+    import django
+    django.setup()
+    from django.core.management import call_command
+    from app.models import Patient, SugarReading
+    from app.summaries import rebuild_summaries
+
+    call_command('migrate', verbosity=0)
+    rng = random.Random(42)
+    Patient.objects.bulk_create(
+        Patient(name=f'Patient {i}', age=rng.randint(18, 90), weight=rng.randint(50, 120),
+                height=rng.randint(150, 195), bmi=25)
+        for i in range(patients)
+    )
+    start = date.today() - timedelta(days=days - 1)
+    patient_ids = list(Patient.objects.values_list('pk', flat=True))
+    for patient_id in patient_ids:
+        SugarReading.objects.bulk_create(
+            SugarReading(patient_id=patient_id, reading_date=start + timedelta(days=day),
+                         sugar_before_breakfast=max(40, int(rng.gauss(110, 25))),
+                         sugar_after_breakfast=max(60, int(rng.gauss(150, 35))))
+            for day in range(days)
+        )
+    rebuild_summaries()
+    reading_ids = list(SugarReading.objects.values_list('pk', flat=True)[:5000])
+    return patient_ids, reading_ids
+
+
+def request_paths(patient_ids, reading_ids, count, rng):
+    """A shuffled mix of the four read-heavy pages"""
+    paths = []
+    for _ in range(count):
+        patient_id = rng.choice(patient_ids)
+        paths.extend([
+            f'/patient/{patient_id}/',
+            f'/dashboard/{patient_id}/',
+            f'/history/{patient_id}/',
+            f'/reading/{rng.choice(reading_ids)}/',
+        ])
+    rng.shuffle(paths)
+    return paths
+
+
+def start_server(kind, workers, database_path):
+    env = dict(os.environ, CARETRACK_DB_PATH=database_path, DJANGO_SETTINGS_MODULE='CareTrack.settings')
+    if kind == 'wsgi':
+        env['CARETRACK_ASYNC_VIEWS'] = '0'
+        command = [sys.executable, '-m', 'gunicorn', 'CareTrack.wsgi:application',
+                   '--bind', f'{HOST}:{PORT}', '--workers', str(workers),
+                   '--worker-class', 'gthread', '--threads', '8', '--log-level', 'warning']
+    else:
+        command = [sys.executable, '-m', 'uvicorn', 'CareTrack.asgi:application',
+                   '--host', HOST, '--port', str(PORT), '--workers', str(workers), '--log-level', 'warning']
+    process = subprocess.Popen(command, cwd=PROJECT_ROOT, env=env)
+
+    for _ in range(100):
+        try:
+            connection = http.client.HTTPConnection(HOST, PORT, timeout=1)
+            connection.request('GET', '/')
+            connection.getresponse().read()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError(f"{kind} server did not start")
+
+
+def load(paths, concurrency, duration):
+    """Run `concurrency` keep-alive clients for `duration` seconds; return (latencies, errors)"""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(offset):
+        connection = http.client.HTTPConnection(HOST, PORT, timeout=30)
+        mine = []
+        index = offset
+        while time.perf_counter() < deadline:
+            path = paths[index % len(paths)]
+            index += concurrency
+            started = time.perf_counter()
+            try:
+                connection.request('GET', path)
+                response = connection.getresponse()
+                response.read()
+                if response.status != 200:
+                    raise OSError(response.status)
+            except (OSError, http.client.HTTPException):
+                with lock:
+                    errors[0] += 1
+                connection.close()
+                connection = http.client.HTTPConnection(HOST, PORT, timeout=30)
+                continue
+            mine.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(mine)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--patients', type=int, default=200)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 16, 64])
+    parser.add_argument('--duration', type=float, default=10, help="Seconds per run")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        database_path = str(Path(directory) / 'bench.sqlite3')
+        patient_ids, reading_ids = seed(database_path, args.patients, args.days)
+        paths = request_paths(patient_ids, reading_ids, 2000, random.Random(7))
+        print(f"Seeded {args.patients} patients x {args.days} days; {args.workers} worker processes\n")
+
+        results = {}
+        for kind in ('wsgi', 'asgi'):
+            server = start_server(kind, args.workers, database_path)
+            try:
+                load(paths, 4, 2)  # warm up
+                for concurrency in args.concurrency:
+                    latencies, errors = load(paths, concurrency, args.duration)
+                    results[kind, concurrency] = (latencies, errors)
+            finally:
+                server.terminate()
+                server.wait()
+
+    print(f"{'server':<28}{'clients':>8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for (kind, concurrency), (latencies, errors) in results.items():
+        label = 'WSGI gunicorn (sync views)' if kind == 'wsgi' else 'ASGI uvicorn (async views)'
+        if not latencies:
+            print(f"{label:<28}{concurrency:>8}{'-':>10}{'-':>10}{'-':>10}{errors:>8}")
+            continue
+        print(f"{label:<28}{concurrency:>8}{len(latencies) / args.duration:>10.1f}"
+              f"{statistics.median(latencies) * 1000:>10.1f}{percentile(latencies, 0.99) * 1000:>10.1f}{errors:>8}")
+
+
+if __name__ == '__main__':
+    main()
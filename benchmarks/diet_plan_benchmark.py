@@ -0,0 +1,89 @@
+"""
+Diet plan benchmark: per-call time and memory allocations
+
+Compares building a plan on every call (what reading_detail used to do,
+via build_diet_plan) with the precomputed lookup in get_detailed_diet_plan,
+and shows what the /metrics timer around the lookup adds.
+
+Usage (from the project root):
+    python benchmarks/diet_plan_benchmark.py [--calls 100000]
+"""
+import argparse
+import sys
+import timeit
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.diet_plans import (  # noqa: E402
+    build_diet_plan,
+    get_detailed_diet_plan,
+    get_diet_plan_key,
+)
+
+# A mix of inputs covering every condition and band
+CASES = [
+    ({'fasting': 'High', 'postmeal': 'High'}, 65, 32.0),
+    ({'fasting': 'Low', 'postmeal': 'Normal'}, 25, 17.5),
+    ({'fasting': 'Normal', 'postmeal': 'Normal'}, 45, 22.0),
+    ({'fasting': 'Normal', 'postmeal': 'High'}, 50, 27.0),
+]
+
+
+def rebuild(status, age, bmi):
+    """Old behaviour: build a brand new plan for every request"""
+    return build_diet_plan(*get_diet_plan_key(status, age, bmi))
+
+
+def run(function, calls):
+    for i in range(calls):
+        status, age, bmi = CASES[i % len(CASES)]
+        function(status, age, bmi)
+
+
+def allocated_per_call(function, calls=1000):
+    """Average bytes allocated (peak above baseline) by one call"""
+    tracemalloc.start()
+    total = 0
+    for i in range(calls):
+        status, age, bmi = CASES[i % len(CASES)]
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+        function(status, age, bmi)
+        _, peak = tracemalloc.get_traced_memory()
+        total += peak - baseline
+    tracemalloc.stop()
+    return total / calls
+
+
+def measure(function, calls):
+    seconds = min(timeit.repeat(lambda: run(function, calls), number=1, repeat=3))
+    return {
+        'us_per_call': seconds / calls * 1e6,
+        'bytes_per_call': allocated_per_call(function),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--calls', type=int, default=100_000)
+    args = parser.parse_args()
+
+    results = {
+        'before (build per call)': measure(rebuild, args.calls),
+        # The lookup itself, without the /metrics timer wrapped around it
+        'after (precomputed)': measure(get_detailed_diet_plan.__wrapped__, args.calls),
+        'after + metrics timer': measure(get_detailed_diet_plan, args.calls),
+    }
+
+    print(f"{'mode':<26}{'time/call':>12}{'allocated/call':>18}")
+    for mode, result in results.items():
+        print(f"{mode:<26}{result['us_per_call']:>9.2f} us{result['bytes_per_call']:>12.0f} bytes")
+
+    before, after, _ = results.values()
+    print(f"\nSpeed-up: {before['us_per_call'] / after['us_per_call']:.0f}x per call")
+
+
+if __name__ == '__main__':
+    main()
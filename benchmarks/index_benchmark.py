@@ -0,0 +1,251 @@
+"""
+Index benchmark: query plans, read timings and insert speed for each set of indexes
+
+Seeds a throwaway SQLite database and measures three sets of indexes:
+
+    without    - the current models minus the access-pattern indexes from
+                 0002_access_pattern_indexes
+    current    - the indexes the models define today
+    redundant  - current plus two SugarReading indexes the models leave
+                 out: a covering (patient, reading_date, values) index
+                 and the patient foreign key index (dropped in
+                 0002_access_pattern_indexes). The unique
+                 (patient, reading_date) index starts with the same
+                 columns as both.
+
+For each set it prints EXPLAIN QUERY PLAN and median timings for the
+queries behind the patient pages. It also prints how many readings per
+second a batched bulk insert writes, as import_readings and the batch API
+do. Every index on SugarReading is updated on each insert.
+
+Usage (from the project root):
+    python benchmarks/index_benchmark.py [--patients 500] [--days 1095] [--repeat 20] [--insert 20000]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'CareTrack.settings')
+
+INDEX_MIGRATION = 'app.migrations.0002_access_pattern_indexes'
+
+# Readings per transaction when measuring inserts (same as import_readings' default)
+INSERT_BATCH_SIZE = 1000
+
+
+def setup_django(database_path):
+    from django.conf import settings
+    settings.DATABASES['default']['NAME'] = database_path
+    import django
+    django.setup()
+
+
+def migrate():
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+
+
+def access_pattern_indexes():
+    """(model name, index) for the indexes added by the index migration that the models still define"""
+    from importlib import import_module
+    from django.apps import apps
+    from django.db import migrations
+
+    indexes = []
+    for operation in import_module(INDEX_MIGRATION).Migration.operations:
+        if not isinstance(operation, migrations.AddIndex):
+            continue
+        model = apps.get_model('app', operation.model_name)
+        if operation.index.name in {index.name for index in model._meta.indexes}:
+            indexes.append((operation.model_name, operation.index))
+    return indexes
+
+
+def redundant_indexes():
+    """(model name, index) for SugarReading indexes left out as prefixes of the unique index"""
+    from django.db import models
+
+    return [
+        ('sugarreading', models.Index(
+            fields=['patient', 'reading_date', 'sugar_before_breakfast', 'sugar_after_breakfast'],
+            name='sugar_patient_date_values_idx',
+        )),
+        ('sugarreading', models.Index(fields=['patient'], name='sugar_patient_idx')),
+    ]
+
+
+def set_indexes(indexes, enabled):
+    """Add or drop (model name, index) pairs, then re-ANALYZE"""
+    from django.apps import apps
+    from django.db import connection
+
+    with connection.schema_editor() as editor:
+        for model_name, index in indexes:
+            model = apps.get_model('app', model_name)
+            if enabled:
+                editor.add_index(model, index)
+            else:
+                editor.remove_index(model, index)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+def seed(patients, days):
+    """Bulk insert patients, one reading per day each, and monthly health data"""
+    from app.models import HealthData, Patient, SugarReading
+
+    rng = random.Random(42)
+    start = date.today() - timedelta(days=days)
+    Patient.objects.bulk_create(
+        Patient(name=f'Patient {i}', age=rng.randint(18, 90),
+                weight=rng.randint(50, 120), height=rng.randint(150, 195), bmi=25)
+        for i in range(patients)
+    )
+    for patient_id in list(Patient.objects.values_list('pk', flat=True)):
+        SugarReading.objects.bulk_create(
+            (SugarReading(
+                patient_id=patient_id,
+                reading_date=start + timedelta(days=day),
+                sugar_before_breakfast=max(40, int(rng.gauss(110, 25))),
+                sugar_after_breakfast=max(60, int(rng.gauss(150, 35))),
+            ) for day in range(days)),
+            batch_size=2000,
+        )
+        HealthData.objects.bulk_create(
+            HealthData(patient_id=patient_id, test_date=start + timedelta(days=day),
+                       cholesterol_total=rng.randint(150, 260))
+            for day in range(0, days, 30)
+        )
+
+
+def view_queries(patient_id):
+    """The ORM calls each view makes, as (label, callable) pairs"""
+    from django.db.models import Count
+    from app import chart_cache
+    from app.models import Patient, SugarReading
+    from app.pagination import paginate_readings
+    from app.views import build_reading_series
+
+    patient = Patient.objects.get(pk=patient_id)
+    readings = patient.sugar_readings
+    return [
+        ('home: patient list', lambda: list(Patient.objects.all()[:20])),
+        ('patient_detail: recent readings', lambda: list(readings.with_status()[:7])),
+        ('patient_detail: latest health data', lambda: patient.health_data.first()),
+        ('dashboard: 90 day stats', lambda: readings.in_window(90).summary()),
+        ('dashboard: all time stats', lambda: readings.summary()),
+        ('dashboard: chart series', lambda: build_reading_series(patient_id, 30)),
+        ('dashboard: data version', lambda: chart_cache.data_version(patient_id)),
+        ('history: deep page', lambda: paginate_readings(
+            readings.with_status(), after=f'{date.today() - timedelta(days=700)}.{10 ** 12}').object_list),
+        ('history: totals', lambda: readings.aggregate(total_readings=Count('id'))),
+        ('export rows', lambda: list(
+            SugarReading.objects.filter(patient_id=patient_id).order_by('reading_date')
+            .values_list('reading_date', 'sugar_before_breakfast'))),
+    ]
+
+
+def run(label, patient_id, repeat):
+    """Time each query and print its plan"""
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    print(f"\n=== {label} ===")
+    results = {}
+    for name, query in view_queries(patient_id):
+        with CaptureQueriesContext(connection) as captured:
+            query()
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            query()
+            timings.append((time.perf_counter() - started) * 1000)
+        results[name] = statistics.median(timings)
+
+        print(f"\n{name}: {results[name]:.3f} ms")
+        with connection.cursor() as cursor:
+            for executed in captured.captured_queries:
+                cursor.execute('EXPLAIN QUERY PLAN ' + executed['sql'])
+                for row in cursor.fetchall():
+                    print(f"    {row[-1]}")
+    return results
+
+
+def insert_speed(total):
+    """Readings per second written by batched bulk inserts (rows are deleted again afterwards)"""
+    from django.db import transaction
+    from app.models import Patient, SugarReading
+
+    # Days after the seeded history, so nothing clashes with existing readings
+    first_day = date.today() + timedelta(days=1)
+    patient_ids = list(Patient.objects.values_list('pk', flat=True))
+    rng = random.Random(7)
+    readings = [
+        SugarReading(
+            patient_id=patient_ids[i % len(patient_ids)],
+            reading_date=first_day + timedelta(days=i // len(patient_ids)),
+            sugar_before_breakfast=max(40, int(rng.gauss(110, 25))),
+            sugar_after_breakfast=max(60, int(rng.gauss(150, 35))),
+        )
+        for i in range(total)
+    ]
+
+    started = time.perf_counter()
+    for i in range(0, total, INSERT_BATCH_SIZE):
+        with transaction.atomic():
+            SugarReading.objects.bulk_create(readings[i:i + INSERT_BATCH_SIZE])
+    elapsed = time.perf_counter() - started
+
+    SugarReading.objects.filter(reading_date__gte=first_day).delete()
+    print(f"\ninsert: {total / elapsed:,.0f} readings/s ({total} readings, {INSERT_BATCH_SIZE} per transaction)")
+    return total / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--patients', type=int, default=500)
+    parser.add_argument('--days', type=int, default=3 * 365)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--insert', type=int, default=20000, help='Readings written by the insert test')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        setup_django(str(Path(directory) / 'bench.sqlite3'))
+
+        migrate()
+        started = time.perf_counter()
+        seed(args.patients, args.days)
+        print(f"Seeded {args.patients} patients x {args.days} days in {time.perf_counter() - started:.1f}s")
+
+        from app.models import Patient
+        patient_id = Patient.objects.order_by('pk').values_list('pk', flat=True)[args.patients // 2]
+
+        results = {}
+        inserts = {}
+        set_indexes(access_pattern_indexes(), enabled=False)
+        results['without'] = run('without (no 0002 indexes)', patient_id, args.repeat)
+        inserts['without'] = insert_speed(args.insert)
+
+        set_indexes(access_pattern_indexes(), enabled=True)
+        results['current'] = run('current indexes', patient_id, args.repeat)
+        inserts['current'] = insert_speed(args.insert)
+
+        set_indexes(redundant_indexes(), enabled=True)
+        results['redundant'] = run('redundant (current + dropped prefix indexes)', patient_id, args.repeat)
+        inserts['redundant'] = insert_speed(args.insert)
+
+    print(f"\n{'query':<40}" + ''.join(f'{label:>14}' for label in results))
+    for name in results['current']:
+        print(f"{name:<40}" + ''.join(f"{timings[name]:>11.3f} ms" for timings in results.values()))
+    print(f"{'insert (readings/s)':<40}" + ''.join(f'{speed:>14,.0f}' for speed in inserts.values()))
+
+
+if __name__ == '__main__':
+    main()
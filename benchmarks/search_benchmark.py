@@ -0,0 +1,127 @@
+"""
+Search benchmark: LIKE '%...%' scans vs the FTS5 index
+
+Seeds a throwaway SQLite database with patients and readings with notes,
+then times the home page search (names + reading notes) and the admin
+searches both ways.
+
+Usage (from the project root):
+    python benchmarks/search_benchmark.py [--patients 20000] [--readings 20] [--repeat 20]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'CareTrack.settings')
+
+FIRST_NAMES = ['Aarav', 'Priya', 'John', 'Maria', 'Chen', 'Fatima', 'Olga', 'Kwame', 'Lucia', 'Ravi', 'Emma', 'Yusuf']
+LAST_NAMES = ['Sharma', 'Smith', 'Garcia', 'Wang', 'Khan', 'Ivanova', 'Mensah', 'Rossi', 'Reddy', 'Brown', 'Demir']
+NOTE_WORDS = [
+    'felt', 'dizzy', 'tired', 'after', 'walk', 'skipped', 'breakfast', 'insulin', 'dose', 'late', 'dinner',
+    'sweets', 'party', 'stress', 'work', 'exercise', 'headache', 'fever', 'travel', 'good', 'sleep', 'missed',
+]
+QUERIES = ['smith', 'pri sha', 'dizzy', 'headache fever', 'nomatch']
+
+
+def setup_django(database_path):
+    from django.conf import settings
+    settings.DATABASES['default']['NAME'] = database_path
+    import django
+    django.setup()
+
+
+def seed(patients, readings_per_patient):
+    """Bulk insert patients with random names and readings with random notes"""
+    from django.core.management import call_command
+    from app.models import Patient, SugarReading
+
+    call_command('migrate', verbosity=0)
+    rng = random.Random(42)
+    Patient.objects.bulk_create(
+        (Patient(name=f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {i}', age=rng.randint(18, 90),
+                 weight=70, height=170, bmi=24) for i in range(patients)),
+        batch_size=2000,
+    )
+    start = date.today() - timedelta(days=readings_per_patient)
+    SugarReading.objects.bulk_create(
+        (SugarReading(
+            patient_id=patient_id,
+            reading_date=start + timedelta(days=day),
+            sugar_before_breakfast=rng.randint(70, 180),
+            sugar_after_breakfast=rng.randint(100, 250),
+            notes=' '.join(rng.sample(NOTE_WORDS, 3)) if rng.random() < 0.3 else '',
+        ) for patient_id in Patient.objects.values_list('pk', flat=True) for day in range(readings_per_patient)),
+        batch_size=5000,
+    )
+
+
+def like_patients(text):
+    from django.db.models import Q
+    from app.models import Patient, SugarReading
+    return Patient.objects.filter(
+        Q(name__icontains=text)
+        | Q(pk__in=SugarReading.objects.filter(notes__icontains=text).values('patient_id'))
+    )
+
+
+def fts_patients(text):
+    from app.models import Patient
+    from app.search import patients_matching
+    return Patient.objects.filter(patients_matching(text))
+
+
+def like_readings(text):
+    from django.db.models import Q
+    from app.models import SugarReading
+    return SugarReading.objects.filter(Q(notes__icontains=text) | Q(patient__name__icontains=text))
+
+
+def fts_readings(text):
+    from app.models import SugarReading
+    from app.search import readings_matching
+    return SugarReading.objects.filter(readings_matching(text))
+
+
+def timed(query, repeat):
+    """Median ms to fetch the first page (12 rows) and count the matches, like the views do"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        list(query()[:12])
+        query().count()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--patients', type=int, default=20000)
+    parser.add_argument('--readings', type=int, default=20, help="Readings per patient")
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        setup_django(str(Path(directory) / 'bench.sqlite3'))
+        started = time.perf_counter()
+        seed(args.patients, args.readings)
+        print(f"Seeded {args.patients} patients x {args.readings} readings in {time.perf_counter() - started:.1f}s\n")
+
+        print(f"{'search':<38}{'LIKE':>12}{'FTS5':>12}{'matches':>10}")
+        for label, like, fts in [('home (names + notes)', like_patients, fts_patients),
+                                 ('admin readings', like_readings, fts_readings)]:
+            for text in QUERIES:
+                matches = fts(text).count()
+                like_ms = timed(lambda: like(text), args.repeat)
+                fts_ms = timed(lambda: fts(text), args.repeat)
+                print(f"{label + ': ' + text:<38}{like_ms:>9.2f} ms{fts_ms:>9.2f} ms{matches:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""
+Concurrency benchmark: many processes adding readings while others read dashboards
+
+Seeds a throwaway SQLite database, then runs writer processes that POST
+to add_sugar_reading and reader processes that GET the dashboard, all
+at the same time, through Django's test client (full view, form,
+signal and template code, no HTTP server). Each run is repeated with
+the default SQLite settings and with CARETRACK_DB_PROFILE=production
+(WAL, synchronous=NORMAL, busy timeout, bigger cache, mmap).
+
+Prints requests/second, p50/p99 latency and how many requests failed
+with "database is locked" for writers and readers separately.
+
+Usage (from the project root):
+    python benchmarks/sqlite_concurrency_benchmark.py [--patients 50] [--days 365]
+                                                      [--writers 4] [--readers 4] [--duration 10]
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'CareTrack.settings')
+
+PROFILES = ['development', 'production']
+
+# Each writer gets its own block of dates, so POSTs never clash on (patient, date)
+DATES_PER_WRITER = 20000
+FIRST_DATE = date(1950, 1, 1)
+
+
+def setup_django(database_path, profile):
+    os.environ['CARETRACK_DB_PATH'] = database_path
+    os.environ['CARETRACK_DB_PROFILE'] = profile
+    import django
+    django.setup()
+
+
+def seed(database_path, patients, days):
+    """Migrate a fresh database and bulk insert patients with one reading per day"""
+    setup_django(database_path, 'development')
+    from django.core.management import call_command
+    from app.models import Patient, SugarReading
+    from app.summaries import rebuild_summaries
+
+    call_command('migrate', verbosity=0)
+    rng = random.Random(42)
+    Patient.objects.bulk_create(
+        Patient(name=f'Patient {i}', age=rng.randint(18, 90), weight=rng.randint(50, 120),
+                height=rng.randint(150, 195), bmi=25)
+        for i in range(patients)
+    )
+    start = date.today() - timedelta(days=days - 1)
+    for patient_id in Patient.objects.values_list('pk', flat=True):
+        SugarReading.objects.bulk_create(
+            SugarReading(patient_id=patient_id, reading_date=start + timedelta(days=day),
+                         sugar_before_breakfast=max(40, int(rng.gauss(110, 25))),
+                         sugar_after_breakfast=max(60, int(rng.gauss(150, 35))))
+            for day in range(days)
+        )
+    rebuild_summaries()
+
+
+def worker(role, number, database_path, profile, patient_ids, start_at, stop_at, results):
+    """One process: loop POSTing readings (writer) or GETting dashboards (reader) until stop_at"""
+    setup_django(database_path, profile)
+    from django.db import OperationalError
+    from django.test import Client
+
+    # Failed requests are counted below; don't print a traceback for each one
+    logging.getLogger('django.request').setLevel(logging.CRITICAL)
+    client = Client(HTTP_HOST='localhost')
+    rng = random.Random(number)
+    latencies, locked, failed = [], 0, 0
+    first_date = FIRST_DATE + timedelta(days=number * DATES_PER_WRITER)
+
+    while time.time() < start_at:
+        time.sleep(0.01)
+
+    sent = 0
+    while time.time() < stop_at:
+        patient_id = rng.choice(patient_ids)
+        began = time.perf_counter()
+        try:
+            if role == 'writer':
+                response = client.post(f'/reading/add/{patient_id}/', {
+                    'reading_date': (first_date + timedelta(days=sent)).isoformat(),
+                    'sugar_before_breakfast': rng.randint(70, 180),
+                    'sugar_after_breakfast': rng.randint(90, 250),
+                    'notes': '',
+                })
+                ok = response.status_code == 302
+            else:
+                response = client.get(f'/dashboard/{patient_id}/')
+                ok = response.status_code == 200
+        except OperationalError as error:
+            ok = False
+            if 'locked' in str(error):
+                locked += 1
+            else:
+                failed += 1
+        else:
+            if not ok:
+                failed += 1
+        if ok:
+            latencies.append(time.perf_counter() - began)
+        sent += 1
+
+    results.put((role, latencies, locked, failed))
+
+
+def run(database_path, profile, patient_ids, writers, readers, duration):
+    """Start all workers together, wait for them, return per-role totals"""
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    start_at = time.time() + 3  # let every process import Django first
+    stop_at = start_at + duration
+    processes = [
+        context.Process(target=worker, args=(role, number, database_path, profile,
+                                             patient_ids, start_at, stop_at, results))
+        for number, role in enumerate(['writer'] * writers + ['reader'] * readers)
+    ]
+    for process in processes:
+        process.start()
+
+    totals = {'writer': ([], 0, 0), 'reader': ([], 0, 0)}
+    for _ in processes:
+        role, latencies, locked, failed = results.get()
+        all_latencies, all_locked, all_failed = totals[role]
+        totals[role] = (all_latencies + latencies, all_locked + locked, all_failed + failed)
+    for process in processes:
+        process.join()
+    return totals
+
+
+def report(profile, totals, duration):
+    for role, (latencies, locked, failed) in totals.items():
+        if latencies:
+            latencies.sort()
+            p50 = statistics.median(latencies) * 1000
+            p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+        else:
+            p50 = p99 = 0
+        print(f'{profile:>12} {role + "s":>8} {len(latencies) / duration:>9.1f} '
+              f'{p50:>9.1f} {p99:>9.1f} {locked:>8} {failed:>7}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--patients', type=int, default=50)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        seed_path = os.path.join(directory, 'seed.sqlite3')
+        print(f'Seeding {args.patients} patients x {args.days} days ...')
+        seed(seed_path, args.patients, args.days)
+        from app.models import Patient
+        patient_ids = list(Patient.objects.values_list('pk', flat=True))
+        seed_bytes = Path(seed_path).read_bytes()
+
+        print(f'{args.writers} writer and {args.readers} reader processes, {args.duration:.0f} s per profile\n')
+        print(f'{"profile":>12} {"role":>8} {"req/s":>9} {"p50 ms":>9} {"p99 ms":>9} {"locked":>8} {"failed":>7}')
+        for profile in PROFILES:
+            # Every profile starts from an identical copy of the seeded database
+            database_path = os.path.join(directory, f'{profile}.sqlite3')
+            Path(database_path).write_bytes(seed_bytes)
+            totals = run(database_path, profile, patient_ids, args.writers, args.readers, args.duration)
+            report(profile, totals, args.duration)
+
+
+if __name__ == '__main__':
+    main()
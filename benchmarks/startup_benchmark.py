@@ -0,0 +1,100 @@
+"""
+Worker startup benchmark: import time and resident memory of CareTrack.wsgi
+
+Each sample runs in a fresh Python process that imports CareTrack.wsgi and
+loads the URLconf (which imports app.views, as a worker does on its first
+request). Two modes are compared:
+
+    before  - also imports plotly.graph_objects, like app/views.py used to
+              (needs the plotly package installed)
+    after   - the current code, which never imports plotly: the dashboard
+              chart is drawn in the browser with plotly.js and the monthly
+              reports draw their own SVG
+
+Usage (from the project root):
+    python benchmarks/startup_benchmark.py [--runs 5]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+# Code run in each child process; prints a JSON dict with the measurements
+CHILD_SCRIPT = """
+import json, os, sys, time
+sys.path.insert(0, {root!r})
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'CareTrack.settings')
+
+def rss_mb():
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+start = time.perf_counter()
+import CareTrack.wsgi
+from django.urls import get_resolver
+get_resolver().url_patterns  # Imports app.views like the first request would
+if {eager!r}:
+    import plotly.graph_objects
+elapsed = time.perf_counter() - start
+
+print(json.dumps({{
+    'import_seconds': elapsed,
+    'rss_mb': rss_mb(),
+    'plotly_loaded': 'plotly' in sys.modules,
+}}))
+"""
+
+
+def sample(eager):
+    """Run one fresh interpreter and return its measurements"""
+    script = CHILD_SCRIPT.format(root=str(PROJECT_ROOT), eager=eager)
+    output = subprocess.run(
+        [sys.executable, '-c', script],
+        check=True, capture_output=True, text=True, cwd=PROJECT_ROOT,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def measure(eager, runs):
+    samples = [sample(eager) for _ in range(runs)]
+    return {
+        'import_seconds': statistics.median(s['import_seconds'] for s in samples),
+        'rss_mb': statistics.median(s['rss_mb'] for s in samples),
+        'plotly_loaded': samples[0]['plotly_loaded'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--runs', type=int, default=5, help='Processes per mode (median is reported)')
+    args = parser.parse_args()
+
+    results = {
+        'before (eager plotly)': measure(eager=True, runs=args.runs),
+        'after (no server-side plotly)': measure(eager=False, runs=args.runs),
+    }
+
+    print(f"{'mode':<32}{'import time':>14}{'RSS':>12}{'plotly loaded':>16}")
+    for mode, result in results.items():
+        print(
+            f"{mode:<32}{result['import_seconds'] * 1000:>11.1f} ms"
+            f"{result['rss_mb']:>9.1f} MB{str(result['plotly_loaded']):>16}"
+        )
+
+    before, after = results.values()
+    print(
+        f"\nSaved {(before['import_seconds'] - after['import_seconds']) * 1000:.1f} ms "
+        f"and {before['rss_mb'] - after['rss_mb']:.1f} MB per worker"
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+"""
+End-to-end benchmark of every URL in app/urls.py
+
+Requests each page and API through Django's test client (middleware,
+view, ORM, templates - no HTTP server) and reports p50/p95 latency, the
+number of SQL queries and the size of the response. Results are saved
+as JSON, and --compare prints the change against an earlier run.
+
+By default a throwaway database is filled with generate_demo_data;
+--database runs against an existing one instead (it is not modified,
+except that the batch API upserts readings that already exist). Pages
+are measured for the patient with the most readings.
+
+Usage (from the project root):
+    python benchmarks/view_benchmark.py [--patients 100] [--years 2] [--iterations 20]
+                                        [--output view_benchmark.json] [--compare old.json]
+    python benchmarks/view_benchmark.py --database db.sqlite3 --only dashboard --only history
+    python benchmarks/view_benchmark.py --cold       # clear caches before every request
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'CareTrack.settings')
+
+# Readings sent in each batch API request
+BATCH_API_READINGS = 100
+
+# Query strings measured in addition to each URL's plain GET
+EXTRA_REQUESTS = {
+    'home': ['?q=smi', '?sort=last_reading'],
+    'dashboard': ['?window=all'],
+    'export_patient': ['?format=ndjson&health=1'],
+}
+
+
+def percentile(sorted_values, percent):
+    """Nearest-rank percentile of an already sorted list"""
+    rank = max(1, math.ceil(percent / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def setup(args, directory):
+    """Point Django at the database to measure, generating demo data if needed"""
+    if args.database:
+        os.environ['CARETRACK_DB_PATH'] = str(Path(args.database).resolve())
+    else:
+        os.environ['CARETRACK_DB_PATH'] = os.path.join(directory, 'benchmark.sqlite3')
+
+    import django
+    django.setup()
+    from django.core.management import call_command
+
+    if not args.database:
+        print(f'Generating {args.patients} patients x {args.years} years of demo data ...')
+        call_command('migrate', verbosity=0)
+        call_command('generate_demo_data', patients=args.patients, years=args.years, seed=args.seed)
+
+
+def build_requests(patient, reading):
+    """(name, method, url, body) for every URL pattern in app/urls.py, plus EXTRA_REQUESTS"""
+    from django.urls import reverse
+    from app import urls
+
+    readings = list(
+        patient.sugar_readings.order_by('-reading_date')
+        .values('reading_date', 'sugar_before_breakfast', 'sugar_after_breakfast', 'notes')[:BATCH_API_READINGS]
+    )
+    batch_body = json.dumps({
+        'on_conflict': 'update',
+        'readings': [dict(row, patient_id=patient.pk, reading_date=row['reading_date'].isoformat())
+                     for row in readings],
+    })
+
+    requests = []
+    for pattern in urls.urlpatterns:
+        kwargs = {}
+        for argument in pattern.pattern.converters:
+            # reading_detail's pk is a reading; every other pk / patient_id is a patient
+            kwargs[argument] = reading.pk if pattern.name == 'reading_detail' else patient.pk
+        url = reverse(f'{urls.app_name}:{pattern.name}', kwargs=kwargs)
+
+        if pattern.name == 'readings_batch_api':
+            requests.append((pattern.name, 'POST', url, batch_body))
+            continue
+        requests.append((pattern.name, 'GET', url, None))
+        for query in EXTRA_REQUESTS.get(pattern.name, []):
+            requests.append((f'{pattern.name}{query}', 'GET', url + query, None))
+    return requests
+
+
+def measure(client, method, url, body, iterations, warmup, cold):
+    """Time one URL; returns a result dict"""
+    from django.core.cache import caches
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    timings = []
+    for iteration in range(warmup + iterations):
+        if cold:
+            for cache in caches.all():
+                cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            if method == 'POST':
+                response = client.post(url, body, content_type='application/json')
+            else:
+                response = client.get(url)
+            # Streaming responses (exports) do their work while being read
+            content = b''.join(response.streaming_content) if response.streaming else response.content
+            elapsed = time.perf_counter() - started
+        if iteration >= warmup:
+            timings.append(elapsed * 1000)
+
+    timings.sort()
+    return {
+        'method': method,
+        'url': url,
+        'status': response.status_code,
+        'iterations': iterations,
+        'p50_ms': round(statistics.median(timings), 2),
+        'p95_ms': round(percentile(timings, 95), 2),
+        'mean_ms': round(statistics.fmean(timings), 2),
+        'min_ms': round(timings[0], 2),
+        'queries': len(queries),
+        'bytes': len(content),
+    }
+
+
+def print_results(results, previous):
+    header = f'{"request":<40} {"status":>6} {"p50 ms":>9} {"p95 ms":>9} {"queries":>8} {"bytes":>10}'
+    if previous:
+        header += f' {"p50 change":>11} {"queries was":>12}'
+    print(header)
+    for name, result in results.items():
+        if 'error' in result:
+            print(f'{name:<40} {"error":>6}  {result["error"]}')
+            continue
+        line = (f'{name:<40} {result["status"]:>6} {result["p50_ms"]:>9.1f} {result["p95_ms"]:>9.1f} '
+                f'{result["queries"]:>8} {result["bytes"]:>10,}')
+        before = previous.get(name) if previous else None
+        if before and 'p50_ms' in before:
+            change = (result['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100 if before['p50_ms'] else 0
+            line += f' {change:>+10.0f}% {before["queries"]:>12}'
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', help='Measure this SQLite file instead of generated demo data')
+    parser.add_argument('--patients', type=int, default=100)
+    parser.add_argument('--years', type=float, default=2)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--cold', action='store_true', help='Clear all caches before every request')
+    parser.add_argument('--only', action='append', help='Only requests whose name starts with this (repeatable)')
+    parser.add_argument('--output', default='view_benchmark.json', help='Where to save the results (JSON)')
+    parser.add_argument('--compare', help='Earlier results file to compare with')
+    args = parser.parse_args()
+
+    previous = None
+    if args.compare:
+        previous = json.loads(Path(args.compare).read_text())['results']
+
+    with tempfile.TemporaryDirectory() as directory:
+        setup(args, directory)
+
+        import django
+        from django.conf import settings
+        from django.test import Client
+        from app.models import Patient, SugarReading
+
+        patient = Patient.objects.filter(summary__isnull=False).order_by('-summary__reading_count').first()
+        if patient is None:
+            sys.exit('No patients with readings in the database')
+        reading = patient.sugar_readings.order_by('-reading_date').first()
+
+        client = Client(HTTP_HOST='localhost')
+        results = {}
+        for name, method, url, body in build_requests(patient, reading):
+            if args.only and not any(name.startswith(prefix) for prefix in args.only):
+                continue
+            try:
+                results[name] = measure(client, method, url, body, args.iterations, args.warmup, args.cold)
+            except Exception as error:
+                results[name] = {'method': method, 'url': url, 'error': f'{type(error).__name__}: {error}'}
+
+        report = {
+            'meta': {
+                'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'git_commit': git_commit(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'db_profile': settings.DB_PROFILE,
+                'async_views': settings.ASYNC_VIEWS,
+                'cold_caches': args.cold,
+                'iterations': args.iterations,
+                'patients': Patient.objects.count(),
+                'readings': SugarReading.objects.count(),
+                'sample_patient_readings': patient.summary.reading_count,
+            },
+            'results': results,
+        }
+
+    print(f'\n{report["meta"]["patients"]} patients, {report["meta"]["readings"]} readings; '
+          f'sample patient has {report["meta"]["sample_patient_readings"]} readings\n')
+    print_results(results, previous)
+    Path(args.output).write_text(json.dumps(report, indent=2))
+    print(f'\nSaved to {args.output}')
+
+
+if __name__ == '__main__':
+    main()